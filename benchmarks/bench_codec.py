@@ -0,0 +1,76 @@
+'''Compares JSON and columnar binary encoding of telemetry batches.
+Reports bytes per sample and encode/decode time per sample.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_codec [batch size]
+'''
+import json
+import math
+import os
+import sys
+import time
+from struct import pack
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec
+from forza_package import ForzaDataPacket, FastForzaDataPacket
+
+
+def make_events(count: int) -> list[dict]:
+    '''Decoded dash packets with smoothly varying channels, sampled at 60 Hz.'''
+    codes = ForzaDataPacket.dash_format[1:]
+    events = []
+    for n in range(count):
+        t = n / 60
+        values = []
+        for i, code in enumerate(codes):
+            if i == 0:
+                values.append(1)
+            elif i == 1:
+                values.append(int(t * 1000))
+            elif code == 'f':
+                values.append(100 * math.sin(t * (0.05 + i / 50)) + i)
+            elif code in 'iIH':
+                values.append(i + int(t / 30))
+            else:
+                values.append((i + int(t)) % 100)
+        datagram = pack(ForzaDataPacket.dash_format, *values)
+        events.append(FastForzaDataPacket(datagram, 'bench driver').to_dict())
+    return events
+
+
+def timed(function, *args) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def encode_json(events: list[dict]) -> list[str]:
+    return [json.dumps(event) for event in events]
+
+
+def run(batch_size: int, repeat: int = 20) -> None:
+    events = make_events(batch_size * repeat)
+    batches = [events[i:i + batch_size] for i in range(0, len(events), batch_size)]
+    print(f'{len(events)} samples in batches of {batch_size}')
+    print(f'{"format":<16} {"bytes/sample":>13} {"encode us/sample":>17} {"decode us/sample":>17}')
+    formats = (('json', encode_json, lambda payload: [json.loads(item) for item in payload],
+                lambda payload: sum(len(item.encode()) for item in payload)),
+               ('binary', lambda batch: codec.encode_batch(batch, False), codec.decode_batch, len),
+               ('binary + zlib', codec.encode_batch, codec.decode_batch, len))
+    for label, encode, decode, size in formats:
+        total_bytes = encode_time = decode_time = 0
+        for batch in batches:
+            seconds, payload = timed(encode, batch)
+            encode_time += seconds
+            total_bytes += size(payload)
+            seconds, decoded = timed(decode, payload)
+            decode_time += seconds
+            assert decoded == batch
+        print(f'{label:<16} {total_bytes / len(events):>13.1f} '
+              f'{encode_time / len(events) * 1e6:>17.2f} {decode_time / len(events) * 1e6:>17.2f}')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 75)
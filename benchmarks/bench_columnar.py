@@ -0,0 +1,41 @@
+'''Benchmark of the NumPy columnar batch decoder against the per-packet path.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_columnar [packet counts ...]
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_decode import make_datagram
+from forza_columnar import decode_batch, decode_columns
+from forza_package import FastForzaDataPacket
+
+
+def per_packet(datagrams: list[bytes]) -> list[dict]:
+    return [FastForzaDataPacket(datagram, 'bench').to_dict() for datagram in datagrams]
+
+
+def timed(function, datagrams: list[bytes]) -> float:
+    start = time.perf_counter()
+    function(datagrams)
+    return time.perf_counter() - start
+
+
+def run(counts: list[int]) -> None:
+    templates = [make_datagram('dash') for _ in range(64)]
+    print(f'{"packets":>9} {"per-packet":>12} {"batch":>12} {"columns":>12} {"speedup":>8}')
+    for count in counts:
+        datagrams = [templates[i % len(templates)] for i in range(count)]
+        records = decode_batch(datagrams[:100])
+        assert records['speed'][0] == FastForzaDataPacket(datagrams[0], 'bench').speed
+        slow = timed(per_packet, datagrams)
+        batch = timed(decode_batch, datagrams)
+        columns = timed(decode_columns, datagrams)
+        print(f'{count:>9} {slow:>11.3f}s {batch:>11.3f}s {columns:>11.3f}s {slow / columns:>7.1f}x')
+
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
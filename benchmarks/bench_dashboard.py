@@ -0,0 +1,123 @@
+'''Load test of the live dashboard server.
+
+A receiver process runs the pipeline with dashboard_port set, synthetic rigs
+send 60 Hz telemetry, and a client process holds many Server-Sent Events
+connections: most read every frame at the requested rate and measure the
+delay from the send time carried in cur_race_time, a few never read at all
+to play the part of stalled browsers. Ingest is measured as in
+bench_pipeline (drops and latency up to Producer.send_events()) with and
+without clients connected. All rigs send from the loopback address, so they
+share one driver name and each client gets about CLIENT_HZ records per second.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_dashboard [clients] [stalled clients] [seconds] [rigs]
+'''
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic
+from benchmarks.harness import free_port, receive
+
+CLIENT_HZ = 10
+
+
+async def client(port: int, base: float, until: float, delays: list, frames: list) -> None:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET /events?hz={CLIENT_HZ} HTTP/1.1\r\nHost: bench\r\n\r\n'.encode())
+    await reader.readuntil(b'\r\n\r\n')
+    count = 0
+    try:
+        while time.monotonic() < until:
+            message = await asyncio.wait_for(reader.readuntil(b'\n\n'), until - time.monotonic())
+            data = message.split(b'data: ', 1)[1]
+            delays.append(time.monotonic() - base - json.loads(data)['cur_race_time'])
+            count += 1
+    except asyncio.TimeoutError:
+        pass
+    frames.append(count)
+    writer.close()
+
+
+async def stalled(port: int, until: float) -> None:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'GET /events HTTP/1.1\r\nHost: bench\r\n\r\n')
+    await asyncio.sleep(until - time.monotonic())
+    writer.close()
+
+
+def run_clients(port: int, base: float, clients: int, stalled_clients: int,
+                seconds: float, results: multiprocessing.Queue) -> None:
+    delays, frames = [], []
+
+    async def main() -> None:
+        until = time.monotonic() + seconds
+        await asyncio.gather(*[client(port, base, until, delays, frames) for _ in range(clients)],
+                             *[stalled(port, until) for _ in range(stalled_clients)])
+
+    asyncio.run(main())
+    results.put({'delays': delays, 'frames': frames})
+    results.close()
+    results.join_thread()
+
+
+def run_once(clients: int, stalled_clients: int, seconds: float, rigs: int) -> dict:
+    port, dashboard_port, base = free_port(), free_port(), time.monotonic()
+    results, client_results = multiprocessing.Queue(), multiprocessing.Queue()
+    receiver = multiprocessing.Process(target = receive,
+                                       args = (port, base, seconds + 2, results, {'filter_rate': 0},
+                                               {'max_linger': 0.01, 'dashboard_port': dashboard_port}))
+    receiver.start()
+    time.sleep(0.5)
+    client_process = None
+    if clients or stalled_clients:
+        client_process = multiprocessing.Process(target = run_clients,
+                                                 args = (dashboard_port, base, clients, stalled_clients,
+                                                         seconds + 0.5, client_results))
+        client_process.start()
+    time.sleep(0.5)
+    sent = synthetic.send('127.0.0.1', port, rigs, 60, seconds, 'dash', base)
+    result = results.get()
+    receiver.join()
+    client_result = {'delays': [], 'frames': []}
+    if client_process is not None:
+        client_result = client_results.get()
+        client_process.join()
+    latencies = sorted(result['latencies'])
+    quantiles = statistics.quantiles(latencies, n = 100)
+    delays = client_result['delays']
+    client_quantiles = statistics.quantiles(delays, n = 100) if len(delays) > 1 else [0.0] * 99
+    return {'sent': sent,
+            'received': result['stats']['received'],
+            'queue_drops': result['queue_drops'],
+            'ingest_p50_ms': quantiles[49] * 1000,
+            'ingest_p99_ms': quantiles[98] * 1000,
+            'frames_per_client_s': statistics.mean(client_result['frames']) / seconds if client_result['frames'] else 0,
+            'client_p50_ms': client_quantiles[49] * 1000,
+            'client_p99_ms': client_quantiles[98] * 1000}
+
+
+def run(clients: int, stalled_clients: int, seconds: float, rigs: int) -> None:
+    print(f'{rigs} rigs at 60 Hz for {seconds:.0f} s, clients ask for {CLIENT_HZ} Hz')
+    print(f'{"clients":<20} {"sent":>6} {"recv":>6} {"drops":>6} {"ingest p50/p99 ms":>18} '
+          f'{"records/s":>9} {"client p50/p99 ms":>18}')
+    for label, counts in (('none', (0, 0)),
+                          (f'{clients} + {stalled_clients} stalled', (clients, stalled_clients))):
+        result = run_once(*counts, seconds, rigs)
+        print(f'{label:<20} {result["sent"]:>6} {result["received"]:>6} {result["queue_drops"]:>6} '
+              f'{result["ingest_p50_ms"]:>8.2f} / {result["ingest_p99_ms"]:>7.2f} '
+              f'{result["frames_per_client_s"]:>9.1f} '
+              f'{result["client_p50_ms"]:>8.2f} / {result["client_p99_ms"]:>7.2f}')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 120,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+        float(sys.argv[3]) if len(sys.argv) > 3 else 10,
+        int(sys.argv[4]) if len(sys.argv) > 4 else 4)
@@ -0,0 +1,88 @@
+'''Reduction ratio and reconstruction error of the decimation strategies.
+
+Every strategy runs over the same recorded session (a capture file written by
+capture.py) or, when none is given, over 10 minutes of synthetic telemetry
+with collisions and brake lockups. Each channel is reconstructed from the kept
+packets by linear interpolation and compared with the full rate signal:
+
+    nrmse %     root mean square error divided by the channel range
+    peak err %  mean error of the per second maximum absolute value, divided by
+                the channel range, which shows how well spikes survive
+
+Usage (from the repository root):
+    python -m benchmarks.bench_decimation [capture file]
+'''
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from capture import CaptureFile
+from decimation import DEFAULT_DEADBANDS, Deadband, EveryNth, MinMaxWindow, TimeRate
+from forza_package import FastForzaDataPacket, ForzaDataReader
+from synthetic import SyntheticRig
+
+CHANNELS = ['speed', 'current_engine_rpm', 'brake', 'acceleration_x', 'acceleration_z',
+            'tire_slip_ratio_FL', 'tire_temp_FL']
+
+STRATEGIES = {
+    'EveryNth(2) (main.py)': lambda: EveryNth(2),
+    'EveryNth(9)': lambda: EveryNth(9),
+    'TimeRate(10 Hz)': lambda: TimeRate(10),
+    'TimeRate(6 Hz)': lambda: TimeRate(6),
+    'Deadband(1000 ms)': lambda: Deadband(DEFAULT_DEADBANDS, 1000),
+    'Deadband(250 ms)': lambda: Deadband(DEFAULT_DEADBANDS, 250),
+    'MinMaxWindow(500 ms)': lambda: MinMaxWindow(500, CHANNELS),
+    'MinMaxWindow(1000 ms)': lambda: MinMaxWindow(1000, CHANNELS),
+}
+
+
+def load_session(path: str | None) -> list[bytes]:
+    if path:
+        capture = CaptureFile(path)
+        return [bytes(data) for _, data in capture.records()]
+    rig = SyntheticRig('dash', seed = 7)
+    return [rig.datagram(i / 60) for i in range(60 * 600)]
+
+
+def columns(packets: list) -> dict[str, np.ndarray]:
+    return {channel: np.array([getattr(packet, channel) for packet in packets], dtype = float)
+            for channel in ['timestamp_ms'] + CHANNELS}
+
+
+def evaluate(original: dict[str, np.ndarray], kept: dict[str, np.ndarray]) -> tuple[float, float]:
+    time = original['timestamp_ms']
+    seconds = ((time - time[0]) // 1000).astype(int)
+    nrmse, peak = [], []
+    for channel in CHANNELS:
+        signal = original[channel]
+        span = np.ptp(signal) or 1.0
+        rebuilt = np.interp(time, kept['timestamp_ms'], kept[channel])
+        nrmse.append(np.sqrt(np.mean((rebuilt - signal) ** 2)) / span)
+        original_peaks = np.zeros(seconds[-1] + 1)
+        rebuilt_peaks = np.zeros(seconds[-1] + 1)
+        np.maximum.at(original_peaks, seconds, np.abs(signal))
+        np.maximum.at(rebuilt_peaks, seconds, np.abs(rebuilt))
+        peak.append(np.mean(np.abs(original_peaks - rebuilt_peaks)) / span)
+    return float(np.mean(nrmse)) * 100, float(np.mean(peak)) * 100
+
+
+def run(path: str | None) -> None:
+    datagrams = load_session(path)
+    packets = [FastForzaDataPacket(datagram, 'bench') for datagram in datagrams]
+    packets = [packet for packet in packets if packet.is_race_on == 1]
+    original = columns(packets)
+    print(f'{len(packets)} packets from {path or "synthetic session"}')
+    print(f'{"strategy":<24} {"kept":>7} {"reduction":>10} {"nrmse %":>8} {"peak err %":>11}')
+    for label, factory in STRATEGIES.items():
+        reader = ForzaDataReader('bench', decimator = factory)
+        kept = [packet for datagram in datagrams for packet in reader.handle(datagram) if packet]
+        kept += reader.flush()
+        nrmse, peak = evaluate(original, columns(kept))
+        print(f'{label:<24} {len(kept):>7} {len(packets) / len(kept):>9.1f}x {nrmse:>8.2f} {peak:>11.2f}')
+
+
+if __name__ == '__main__':
+    run(sys.argv[1] if len(sys.argv) > 1 else None)
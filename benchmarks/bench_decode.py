@@ -0,0 +1,57 @@
+'''Micro-benchmark comparing ForzaDataPacket with FastForzaDataPacket.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_decode [number_of_packets]
+'''
+import os
+import random
+import sys
+import timeit
+from struct import pack
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from forza_package import ForzaDataPacket, FastForzaDataPacket
+
+
+def make_datagram(packet_format: str) -> bytes:
+    '''Returns a datagram with random values for the given layout.'''
+    fmt = ForzaDataPacket.sled_format if packet_format == 'sled' else ForzaDataPacket.dash_format
+    values = []
+    for code in fmt[1:]:
+        if code == 'f':
+            values.append(random.uniform(-100, 100))
+        elif code in 'iI':
+            values.append(random.randint(0, 1000))
+        elif code == 'H':
+            values.append(random.randint(0, 60000))
+        elif code == 'B':
+            values.append(random.randint(0, 255))
+        else:
+            values.append(random.randint(-127, 127))
+    data = pack(fmt, *values)
+    if packet_format == 'fh4':
+        data = bytes(FastForzaDataPacket.FH4_OFFSET) + data
+    return data
+
+
+def run(number: int) -> None:
+    for packet_format in ('sled', 'dash', 'fh4'):
+        data = make_datagram(packet_format)
+        assert ForzaDataPacket(data, 'bench').to_dict() == FastForzaDataPacket(data, 'bench').to_dict()
+        print(f'{packet_format} packets ({len(data)} bytes), {number} iterations')
+        for label, stmt in (('decode', 'cls(data, "bench")'),
+                            ('decode + to_dict', 'cls(data, "bench").to_dict()'),
+                            ('attribute access', 'packet.is_race_on; packet.timestamp_ms')):
+            results = {}
+            for cls in (ForzaDataPacket, FastForzaDataPacket):
+                namespace = {'cls': cls, 'data': data, 'packet': cls(data, 'bench')}
+                seconds = min(timeit.repeat(stmt, globals=namespace, number=number, repeat=3))
+                results[cls.__name__] = seconds / number * 1e6
+            old, new = results['ForzaDataPacket'], results['FastForzaDataPacket']
+            print(f'    {label:<18} ForzaDataPacket {old:7.2f} us   '
+                  f'FastForzaDataPacket {new:7.2f} us   speedup {old / new:5.1f}x')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,95 @@
+'''Lookup rate and accuracy of the delta to best lap index.
+
+Builds a long (about 21 km, Nordschleife sized) figure eight track with
+wiggles and a crossing, drives a reference lap over it at 60 Hz, then looks
+up every sample of a 2% slower lap driven 1.5 m off the reference line with
+ReferenceLap.time_at() (grid index, pure Python) and with a brute force
+numpy nearest search over the same distance window. Reports lookups per
+second, the time to build (swap in) the reference, and the delta error
+against the exact delta of the slower lap.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_delta [track meters]
+'''
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delta import DISTANCE_WINDOW, ReferenceLap
+
+RATE = 60
+
+
+def track(length: float) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    '''Returns a dense polyline (x, z), its arc length and unit normals, scaled to length meters.'''
+    angle = np.linspace(0, 2 * np.pi, 400000)
+    x = np.sin(angle) + 0.01 * np.sin(60 * angle)
+    z = np.sin(angle) * np.cos(angle) + 0.01 * np.cos(45 * angle)
+    arc = np.r_[0, np.cumsum(np.hypot(np.diff(x), np.diff(z)))]
+    scale = length / arc[-1]
+    x, z, arc = x * scale, z * scale, arc * scale
+    dx, dz = np.gradient(x), np.gradient(z)
+    norm = np.hypot(dx, dz)
+    return x, z, arc, np.column_stack((-dz / norm, dx / norm))
+
+
+def drive(x, z, arc, normals, pace: float, offset: float) -> tuple[np.ndarray, ...]:
+    '''Samples a lap at RATE Hz, speed varying along the track, offset meters off the line.
+    Returns:
+        (x, z, distance, time) of every sample.'''
+    speed = pace * (55 + 25 * np.cos(2 * np.pi * arc / 1500))
+    elapsed = np.r_[0, np.cumsum(np.diff(arc) / speed[1:])]
+    times = np.arange(0, elapsed[-1], 1 / RATE)
+    distance = np.interp(times, elapsed, arc)
+    shift = np.column_stack([np.interp(distance, arc, normals[:, axis]) for axis in (0, 1)]) * offset
+    return (np.interp(distance, arc, x) + shift[:, 0], np.interp(distance, arc, z) + shift[:, 1],
+            distance, times)
+
+
+def brute_force(reference: ReferenceLap, xs, zs, distances) -> list[int]:
+    '''Nearest reference sample within DISTANCE_WINDOW with numpy, for comparison.'''
+    rx, rz, rd = np.array(reference.x), np.array(reference.z), np.array(reference.distance)
+    indices = []
+    for x, z, distance in zip(xs, zs, distances):
+        squared = (rx - x) ** 2 + (rz - z) ** 2
+        squared[np.abs(rd - distance) > DISTANCE_WINDOW] = np.inf
+        indices.append(int(np.argmin(squared)))
+    return indices
+
+
+def run(length: float) -> None:
+    x, z, arc, normals = track(length)
+    reference_lap = drive(x, z, arc, normals, 1.0, 0.0)
+    start = time.perf_counter()
+    reference = ReferenceLap(*reference_lap, lap_time = float(reference_lap[3][-1]))
+    build = time.perf_counter() - start
+    lap_x, lap_z, lap_distance, lap_time = drive(x, z, arc, normals, 0.98, 1.5)
+    print(f'{length / 1000:.1f} km track, reference lap {reference.lap_time:.1f} s, {len(reference)} samples, '
+          f'{len(reference.grid)} grid cells, built in {build * 1000:.1f} ms')
+    samples = list(zip(lap_x.tolist(), lap_z.tolist(), lap_distance.tolist()))
+    start = time.perf_counter()
+    reference_times = [reference.time_at(*sample) for sample in samples]
+    grid_seconds = time.perf_counter() - start
+    count = min(len(samples), 5000)
+    start = time.perf_counter()
+    brute = brute_force(reference, lap_x[:count], lap_z[:count], lap_distance[:count])
+    brute_seconds = (time.perf_counter() - start) / count * len(samples)
+    same = sum(reference.nearest(*sample) == index for sample, index in zip(samples[:count], brute))
+    # exact reference time at each distance, the slower lap's delta is its time minus that
+    exact = np.interp(lap_distance, reference_lap[2], reference_lap[3])
+    errors = np.abs(np.array(reference_times) - exact)
+    delta = lap_time - np.array(reference_times)
+    print(f'{"index":<12} {"lookups/s":>10} {"us/lookup":>10}')
+    print(f'{"grid":<12} {len(samples) / grid_seconds:>10.0f} {grid_seconds / len(samples) * 1e6:>10.1f}')
+    print(f'{"brute force":<12} {len(samples) / brute_seconds:>10.0f} {brute_seconds / len(samples) * 1e6:>10.1f}')
+    print(f'same nearest sample as brute force: {same / count:.2%} of {count}')
+    print(f'reference time error: mean {errors.mean() * 1000:.2f} ms, max {errors.max() * 1000:.2f} ms; '
+          f'delta at the end of the lap {delta[-1]:.2f} s (exact {lap_time[-1] - exact[-1]:.2f} s)')
+
+
+if __name__ == '__main__':
+    run(float(sys.argv[1]) if len(sys.argv) > 1 else 20800)
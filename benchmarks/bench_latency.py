@@ -0,0 +1,33 @@
+'''End-to-end latency from UDP arrival to Producer.send_events().
+
+Compares the thread + polling queue reader (native_udp = False) with the
+asyncio DatagramProtocol reader, using synthetic traffic over loopback.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_latency [seconds] [packets per second]
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import run_pipeline
+
+
+def run(seconds: float, rate: float) -> None:
+    print(f'{rate:.0f} packets/s for {seconds:.0f} s per mode')
+    print(f'{"reader":<32} {"events":>7} {"p50 ms":>8} {"p99 ms":>8}')
+    modes = (('thread + polling queue', {'native_udp': False}),
+             ('DatagramProtocol, 100 ms linger', {'max_linger': 0.1}),
+             ('DatagramProtocol, 10 ms linger', {'max_linger': 0.01}))
+    for label, io_options in modes:
+        result = run_pipeline(1, rate, seconds,
+                              reader_options = {'filter_rate': 0},
+                              io_options = io_options)
+        print(f'{label:<32} {result["throughput"] * seconds:>7.0f} '
+              f'{result["p50_ms"]:>8.2f} {result["p99_ms"]:>8.2f}')
+
+
+if __name__ == '__main__':
+    run(float(sys.argv[1]) if len(sys.argv) > 1 else 5,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 60)
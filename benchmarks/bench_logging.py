@@ -0,0 +1,94 @@
+'''Packet receive jitter with DEBUG logging, synchronous versus background writer.
+
+Each mode runs the pipeline in a fresh interpreter, because the log handlers
+are chosen from the environment when the modules are imported. The delay
+from the send time carried in cur_race_time to the moment the datagram
+reaches ForzaDatagramProtocol.datagram_received() is measured for every
+packet; its spread is the receive jitter caused by whatever else runs on the
+event loop, such as log records written by the writer coroutine and the
+Producer.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_logging [seconds] [packets per second]
+'''
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = (
+    ('DEBUG, synchronous file handler', {'FORZA_LOG_LEVEL': 'DEBUG', 'FORZA_LOG_QUEUE': '0', 'FORZA_LOG_RATE': '0'}),
+    ('DEBUG, background writer', {'FORZA_LOG_LEVEL': 'DEBUG', 'FORZA_LOG_RATE': '0'}),
+    ('DEBUG, background + rate limit', {'FORZA_LOG_LEVEL': 'DEBUG'}),
+    ('INFO, background + rate limit', {'FORZA_LOG_LEVEL': 'INFO'}),
+)
+
+
+def measure(seconds: float, rate: float) -> dict:
+    '''Runs the pipeline in this process and returns the receive delays in ms.'''
+    import asyncio
+    import multiprocessing
+
+    import main
+    import synthetic
+    from benchmarks.harness import RecordingProducer, free_port
+    from forza_package import FastForzaDataPacket, ForzaDatagramProtocol, ForzaDataReader
+
+    base = time.monotonic()
+    delays = []
+
+    class TimedProtocol(ForzaDatagramProtocol):
+        def datagram_received(self, data: bytes, addr: tuple) -> None:
+            now = time.monotonic() - base
+            delays.append(now - FastForzaDataPacket(data, '').cur_race_time)
+            super().datagram_received(data, addr)
+
+    main.ForzaDatagramProtocol = TimedProtocol
+    port = free_port()
+    reader = ForzaDataReader(driver_name = 'bench', ip = '127.0.0.1', port = port, filter_rate = 0)
+    forza_io = main.AsyncForzaIO(reader = reader, producer = RecordingProducer(base), max_linger = 0.005)
+    sender = multiprocessing.Process(target = synthetic.send,
+                                     args = ('127.0.0.1', port, 1, rate, seconds, 'dash', base))
+
+    async def run() -> None:
+        sender.start()
+        try:
+            await asyncio.wait_for(forza_io.run(), seconds + 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(run())
+    sender.join()
+    delays = [delay * 1000 for delay in delays]
+    quantiles = statistics.quantiles(delays, n = 1000)
+    return {'packets': len(delays),
+            'p50': quantiles[499], 'p99': quantiles[989], 'p999': quantiles[998],
+            'stdev': statistics.stdev(delays)}
+
+
+def run(seconds: float, rate: float) -> None:
+    print(f'{rate:.0f} packets/s for {seconds:.0f} s per mode, receive delay in ms')
+    print(f'{"logging":<34} {"packets":>8} {"p50":>7} {"p99":>7} {"p99.9":>7} {"stdev":>7}')
+    for label, env in MODES:
+        with tempfile.TemporaryDirectory() as log_dir:
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_logging', '--measure',
+                                     str(seconds), str(rate)],
+                                    env = {**os.environ, **env, 'FORZA_LOG_DIR': log_dir},
+                                    capture_output = True, text = True, check = True).stdout
+        result = json.loads(output.splitlines()[-1])
+        print(f'{label:<34} {result["packets"]:>8} {result["p50"]:>7.3f} {result["p99"]:>7.3f} '
+              f'{result["p999"]:>7.3f} {result["stdev"]:>7.3f}')
+
+
+if __name__ == '__main__':
+    if '--measure' in sys.argv:
+        sys.argv.remove('--measure')
+        print(json.dumps(measure(float(sys.argv[1]), float(sys.argv[2]))), flush = True)
+        os._exit(0)
+    run(float(sys.argv[1]) if len(sys.argv) > 1 else 10,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 600)
@@ -0,0 +1,62 @@
+'''Aggregate throughput of the multi-rig mode as worker processes are added.
+
+Synthetic rigs are split across one port per worker and one sender process
+per port; a MultiRigIngest forwards everything to one RecordingProducer.
+Throughput should grow close to linearly with the number of workers until
+the host runs out of cores.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_multirig [--workers 1 2 4] [--rigs 32] [--rate 120] [--seconds 5]
+'''
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic
+from benchmarks.harness import RecordingProducer, free_port
+from multirig import MultiRigIngest
+
+
+async def measure(ingest: MultiRigIngest, seconds: float) -> None:
+    try:
+        await asyncio.wait_for(ingest.run(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+def run_case(workers: int, rigs: int, rate: float, seconds: float) -> None:
+    ports = [free_port() for _ in range(workers)]
+    config = {'filter_rate': 0,
+              'rigs': [{'port': port, 'driver_name': f'rig{port}', 'ip': '127.0.0.1'} for port in ports]}
+    base = time.monotonic()
+    producer = RecordingProducer(base)
+    ingest = MultiRigIngest(config, producer, io_options = {'max_linger': 0.05})
+    ingest.start()
+    time.sleep(1)
+    with multiprocessing.Pool(workers) as pool:
+        senders = pool.starmap_async(synthetic.send,
+                                     [('127.0.0.1', port, rigs // workers, rate, seconds, 'dash', base)
+                                      for port in ports])
+        asyncio.run(measure(ingest, seconds + 1))
+        sent = sum(senders.get())
+    ingest.stop()
+    print(f'{workers:>8} {rigs:>5} {sent:>9} {producer.events:>9} '
+          f'{(1 - producer.events / sent) * 100:>7.2f} {producer.events / seconds:>10.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--workers', type = int, nargs = '+', default = [1, 2, 4])
+    parser.add_argument('--rigs', type = int, default = 32)
+    parser.add_argument('--rate', type = float, default = 120)
+    parser.add_argument('--seconds', type = float, default = 5)
+    args = parser.parse_args()
+    print(f'{os.cpu_count()} cpus')
+    print(f'{"workers":>8} {"rigs":>5} {"sent":>9} {"received":>9} {"drop %":>7} {"events/s":>10}')
+    for workers in args.workers:
+        run_case(workers, args.rigs, args.rate, args.seconds)
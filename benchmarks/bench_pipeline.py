@@ -0,0 +1,42 @@
+'''End-to-end benchmark: synthetic rigs -> ForzaDataReader -> AsyncForzaIO -> Producer.
+
+Reports ingest throughput, drop rate, CPU time per packet and p50/p99
+latency from send to Producer for an increasing number of rigs.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_pipeline [--rigs 1 4 16 64] [--rate 60] [--seconds 5]
+                                        [--format dash] [--filter-rate 0]
+'''
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import run_pipeline
+
+
+def run(rigs: list[int], rate: float, seconds: float, packet_format: str, filter_rate: int) -> None:
+    print(f'{packet_format} packets at {rate:.0f} Hz per rig, {seconds:.0f} s per case, filter_rate {filter_rate}')
+    print(f'{"rigs":>5} {"sent":>8} {"received":>9} {"drop %":>7} {"events/s":>9} '
+          f'{"cpu us/pkt":>10} {"p50 ms":>8} {"p99 ms":>8}')
+    for count in rigs:
+        result = run_pipeline(count, rate, seconds, packet_format,
+                              reader_options = {'filter_rate': filter_rate,
+                                                'batch_size': 32,
+                                                'rcvbuf_size': 1024 * 1024},
+                              io_options = {'max_linger': 0.05})
+        print(f'{count:>5} {result["sent"]:>8} {result["received"]:>9} {result["drop_rate"] * 100:>7.2f} '
+              f'{result["throughput"]:>9.0f} {result["cpu_us_per_packet"]:>10.1f} '
+              f'{result["p50_ms"]:>8.2f} {result["p99_ms"]:>8.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--rigs', type = int, nargs = '+', default = [1, 4, 16, 64])
+    parser.add_argument('--rate', type = float, default = 60)
+    parser.add_argument('--seconds', type = float, default = 5)
+    parser.add_argument('--format', choices = ('sled', 'dash', 'fh4'), default = 'dash')
+    parser.add_argument('--filter-rate', type = int, default = 0)
+    args = parser.parse_args()
+    run(args.rigs, args.rate, args.seconds, args.format, args.filter_rate)
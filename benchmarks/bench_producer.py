@@ -0,0 +1,64 @@
+'''Latency and throughput of Producer against the local Event Hubs stand-in.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_producer [send latency in ms]
+'''
+import asyncio
+import os
+import statistics
+import sys
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_codec import make_events
+from local_eventhub import LocalEventHubProducerClient
+from producer import Producer
+
+
+async def run_case(events: list[dict],
+                   calls: int,
+                   latency: float,
+                   max_in_flight: int,
+                   encoding: str,
+                   failure_rate: float = 0.0) -> None:
+    sent = []
+    client_factory = partial(LocalEventHubProducerClient,
+                             latency = latency,
+                             failure_rate = failure_rate,
+                             on_send = lambda batch: sent.append(len(batch)))
+    producer = Producer(client_factory = client_factory,
+                        encoding = encoding,
+                        max_in_flight = max_in_flight,
+                        retry_delay = 0)
+    connections = LocalEventHubProducerClient.connections
+    call_times = []
+    start = time.perf_counter()
+    for _ in range(calls):
+        call_start = time.perf_counter()
+        await producer.send_events(events)
+        call_times.append(time.perf_counter() - call_start)
+    await producer.close()
+    elapsed = time.perf_counter() - start
+    call_times.sort()
+    samples = calls * len(events)
+    print(f'{encoding:<7} {max_in_flight:>9} {failure_rate:>8.2f} {samples / elapsed:>12.0f} '
+          f'{statistics.median(call_times) * 1000:>10.2f} {call_times[int(len(call_times) * 0.99)] * 1000:>10.2f} '
+          f'{len(sent):>8} '
+          f'{LocalEventHubProducerClient.connections - connections:>6}')
+
+
+async def run(latency: float) -> None:
+    events = make_events(60)
+    print(f'100 calls of {len(events)} events, {latency * 1000:.0f} ms per send_batch')
+    print(f'{"format":<7} {"in flight":>9} {"failures":>8} {"events/s":>12} '
+          f'{"p50 ms":>10} {"p99 ms":>10} {"batches":>8} {"conns":>6}')
+    for encoding in ('json', 'binary'):
+        for max_in_flight in (1, 4, 16):
+            await run_case(events, 100, latency, max_in_flight, encoding)
+        await run_case(events, 100, latency, 4, encoding, failure_rate = 0.05)
+
+
+if __name__ == '__main__':
+    asyncio.run(run(float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.03))
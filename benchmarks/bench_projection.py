@@ -0,0 +1,70 @@
+'''Decode and serialize cost and payload size of field projections.
+
+Compares FastForzaDataPacket (all channels) with the classes built by
+projection() for a few typical channel selections, on the same dash
+datagrams. JSON bytes are per event; binary bytes are per sample in
+codec.py payloads of 1000 samples.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_projection [number_of_packets]
+'''
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec
+from synthetic import SyntheticRig
+from forza_package import FastForzaDataPacket, projection
+
+PROJECTIONS = {
+    'dashboard (15)': ['is_race_on', 'speed', 'current_engine_rpm', 'engine_max_rpm', 'gear',
+                       'accel', 'brake', 'steer', 'lap_no', 'race_pos', 'cur_lap_time',
+                       'best_lap_time', 'last_lap_time', 'fuel', 'position_x'],
+    'tires (20)': [f'{channel}_{wheel}' for channel in ('tire_temp', 'tire_slip_ratio',
+                                                        'tire_combined_slip', 'norm_suspension_travel',
+                                                        'wheel_rotation_speed')
+                   for wheel in ('FL', 'FR', 'RL', 'RR')],
+    'motion (12)': ['speed', 'acceleration_x', 'acceleration_y', 'acceleration_z',
+                    'velocity_x', 'velocity_y', 'velocity_z', 'yaw', 'pitch', 'roll',
+                    'position_x', 'position_z'],
+}
+
+
+def measure(packet_class: type, datagrams: list[bytes], number: int) -> dict:
+    namespace = {'cls': packet_class, 'datagrams': datagrams, 'json': json}
+    decode = min(timeit.repeat('for data in datagrams: cls(data, "bench")',
+                               globals = namespace, number = 1, repeat = 5))
+    serialize = min(timeit.repeat('for data in datagrams: json.dumps(cls(data, "bench").to_dict())',
+                                  globals = namespace, number = 1, repeat = 5))
+    events = [packet_class(data, 'bench').to_dict() for data in datagrams]
+    return {'decode_us': decode / number * 1e6,
+            'serialize_us': serialize / number * 1e6,
+            'json_bytes': sum(len(json.dumps(event)) for event in events) / number,
+            'binary_bytes': sum(len(codec.encode_batch(events[start:start + 1000]))
+                                for start in range(0, number, 1000)) / number}
+
+
+def run(number: int) -> None:
+    rig = SyntheticRig('dash', seed = 1)
+    datagrams = [rig.datagram(n / 60) for n in range(number)]
+    print(f'{number} dash packets, times per packet')
+    print(f'{"channels":<16} {"decode us":>10} {"+ json us":>10} {"json B":>8} {"binary B":>9}')
+    base = measure(FastForzaDataPacket, datagrams, number)
+    rows = [('all (85)', base)]
+    for label, fields in PROJECTIONS.items():
+        rows.append((label, measure(projection(fields), datagrams, number)))
+    for label, result in rows:
+        print(f'{label:<16} {result["decode_us"]:>10.2f} {result["serialize_us"]:>10.2f} '
+              f'{result["json_bytes"]:>8.0f} {result["binary_bytes"]:>9.1f}')
+    for label, result in rows[1:]:
+        print(f'{label}: decode {base["decode_us"] / result["decode_us"]:.1f}x, '
+              f'decode + json {base["serialize_us"] / result["serialize_us"]:.1f}x faster, '
+              f'json {1 - result["json_bytes"] / base["json_bytes"]:.0%} and '
+              f'binary {1 - result["binary_bytes"] / base["binary_bytes"]:.0%} smaller')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
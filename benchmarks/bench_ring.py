@@ -0,0 +1,117 @@
+'''Single process pipeline versus the shared memory ring mode.
+
+For each number of rigs, synthetic dash traffic is sent to the single
+process pipeline of bench_pipeline, then to a SharedMemoryIngest with a
+receiver process and WORKERS worker processes (see ring.py), and both get
+the same time to deliver events to the producer. Drops are datagrams sent
+but never delivered, kernel drops those lost on the socket, overruns those
+dropped because a ring was full. CPU is the time of all pipeline processes
+per packet sent; latency is from send to Producer.send_events().
+
+Usage (from the repository root):
+    python -m benchmarks.bench_ring [--rigs 16 32 48 64] [--workers 1] [--rate 60] [--seconds 5]
+'''
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic
+from benchmarks.harness import RecordingProducer, free_port, run_pipeline
+from ring import SharedMemoryIngest
+
+
+class JsonRecordingProducer(RecordingProducer):
+    '''RecordingProducer also reading the send time of events serialized by the workers.'''
+    async def send_events(self, events_list: list) -> None:
+        now = time.monotonic() - self.base
+        for event in events_list:
+            if isinstance(event, str):
+                start = event.find('"cur_race_time": ') + 17
+                self.latencies.append(now - float(event[start:event.find(',', start)]))
+        await super().send_events(events_list)
+
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def measure(ingest: SharedMemoryIngest, seconds: float) -> None:
+    try:
+        await asyncio.wait_for(ingest.run(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+def run_ring(rigs: int, rate: float, seconds: float, workers: int) -> dict:
+    port, base = free_port(), time.monotonic()
+    producer = JsonRecordingProducer(base)
+    ingest = SharedMemoryIngest({'port': port, 'ip': '127.0.0.1', 'driver_name': 'bench', 'workers': workers},
+                                producer, filter_rate = 0, io_options = {'max_linger': 0.05})
+    ingest.start()
+    time.sleep(1)
+    with multiprocessing.Pool(1) as pool:
+        sender = pool.apply_async(synthetic.send, ('127.0.0.1', port, rigs, rate, seconds, 'dash', base))
+        cpu_start = time.process_time()
+        asyncio.run(measure(ingest, seconds + 1))
+        cpu = time.process_time() - cpu_start
+        sent = sender.get()
+    stats = ingest.stats()
+    children_before = children_cpu()
+    ingest.stop()
+    # ingest.stop() waits for the pipeline processes, adding their CPU time to RUSAGE_CHILDREN
+    cpu += children_cpu() - children_before
+    latencies = sorted(producer.latencies)
+    quantiles = statistics.quantiles(latencies, n = 100) if len(latencies) > 1 else [0.0] * 99
+    return {'sent': sent,
+            'events': producer.events,
+            'kernel_drops': stats['kernel_drops'],
+            'overruns': sum(ring['overruns'] for ring in stats['rings']),
+            'high_water': max(ring['high_water'] for ring in stats['rings']),
+            'cpu_us_per_packet': cpu / sent * 1e6,
+            'p50_ms': quantiles[49] * 1000,
+            'p99_ms': quantiles[98] * 1000}
+
+
+def run_single(rigs: int, rate: float, seconds: float) -> dict:
+    result = run_pipeline(rigs, rate, seconds, 'dash',
+                          reader_options = {'filter_rate': 0, 'batch_size': 32, 'rcvbuf_size': 1024 * 1024},
+                          io_options = {'max_linger': 0.05})
+    return {'sent': result['sent'],
+            'events': result['throughput'] * seconds,
+            'kernel_drops': result['kernel_drops'],
+            'overruns': 0,
+            'high_water': 0,
+            'cpu_us_per_packet': result['cpu_us_per_packet'] * result['received'] / result['sent'],
+            'p50_ms': result['p50_ms'],
+            'p99_ms': result['p99_ms']}
+
+
+def run(rigs: list[int], workers: int, rate: float, seconds: float) -> None:
+    print(f'{os.cpu_count()} cpus, dash packets at {rate:.0f} Hz per rig, {seconds:.0f} s per case')
+    print(f'{"mode":<10} {"rigs":>5} {"sent":>7} {"events":>7} {"drop %":>7} {"kernel":>7} {"overrun":>7} '
+          f'{"ring max":>8} {"cpu us/pkt":>10} {"p50 ms":>8} {"p99 ms":>8}')
+    for count in rigs:
+        for label, result in (('single', run_single(count, rate, seconds)),
+                              (f'ring x{workers}', run_ring(count, rate, seconds, workers))):
+            print(f'{label:<10} {count:>5} {result["sent"]:>7} {result["events"]:>7.0f} '
+                  f'{(1 - result["events"] / result["sent"]) * 100:>7.2f} {result["kernel_drops"]:>7} '
+                  f'{result["overruns"]:>7} {result["high_water"]:>8} {result["cpu_us_per_packet"]:>10.1f} '
+                  f'{result["p50_ms"]:>8.2f} {result["p99_ms"]:>8.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--rigs', type = int, nargs = '+', default = [16, 32, 48, 64])
+    parser.add_argument('--workers', type = int, default = 1)
+    parser.add_argument('--rate', type = float, default = 60)
+    parser.add_argument('--seconds', type = float, default = 5)
+    args = parser.parse_args()
+    run(args.rigs, args.workers, args.rate, args.seconds)
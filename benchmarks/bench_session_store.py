@@ -0,0 +1,78 @@
+'''Write cost, size on disk and query latency of the session store.
+
+Records a long synthetic dash session with SessionRecorder, then queries
+one channel over the whole session and over a one minute window at several
+resolutions. Peak memory is measured with tracemalloc, it stays far below
+the size of a column for queries served by the zoom levels.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_session_store [minutes]
+'''
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from forza_package import FastForzaDataPacket
+from session_store import SessionReader, SessionRecorder
+from synthetic import SyntheticRig
+
+RESOLUTIONS = (0, 100, 1000, 10000, 60000)
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for directory, _, names in os.walk(path) for name in names)
+
+
+def timed_query(session: SessionReader, *args) -> tuple[float, float, int]:
+    '''Returns (ms, peak MB, rows) of the fastest of 5 queries.'''
+    best = None
+    for _ in range(5):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = session.query(*args)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if best is None or elapsed < best[0]:
+            best = (elapsed, peak)
+    return best[0] * 1000, best[1] / 1e6, len(result['time'])
+
+
+def run(minutes: float) -> None:
+    number = int(minutes * 60 * 60)
+    rig = SyntheticRig('dash', seed = 1)
+    packets = [FastForzaDataPacket(rig.datagram(n / 60), 'bench') for n in range(number)]
+    root = tempfile.mkdtemp()
+    try:
+        recorder = SessionRecorder(root)
+        start = time.perf_counter()
+        for packet in packets:
+            recorder.push(packet)
+        recorder.flush()
+        elapsed = time.perf_counter() - start
+        path = recorder.sessions[0]
+        size = directory_size(path)
+        levels = sum(directory_size(os.path.join(path, name)) for name in os.listdir(path) if name.startswith('L'))
+        print(f'{number} dash packets ({minutes:.0f} min at 60 Hz), '
+              f'{elapsed / number * 1e6:.1f} us per packet to record')
+        print(f'{size / 1e6:.1f} MB on disk ({levels / 1e6:.1f} MB of zoom levels), '
+              f'{number * 311 / 1e6:.1f} MB of datagrams')
+        session = SessionReader(path)
+        middle = session.start_ms + (session.end_ms - session.start_ms) // 2
+        print(f'{"query of speed":<22} {"resolution ms":>13} {"rows":>8} {"ms":>8} {"peak MB":>8}')
+        for label, window in (('whole session', (None, None)), ('one minute', (middle, middle + 60000))):
+            for resolution in RESOLUTIONS:
+                milliseconds, peak, rows = timed_query(session, 'speed', *window, resolution)
+                print(f'{label:<22} {resolution:>13} {rows:>8} {milliseconds:>8.2f} {peak:>8.2f}')
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    run(float(sys.argv[1]) if len(sys.argv) > 1 else 60)
@@ -0,0 +1,104 @@
+'''Fan-out to several sinks, with and without a stalled one.
+
+One AsyncForzaIO decodes synthetic dash traffic once and feeds an
+EventHubsSink (Producer on the in-memory client), a FileSink, a UdpSink
+re-broadcasting Forza datagrams and a StdoutSink writing to /dev/null. The
+second run adds a sink whose writes take one second, to check that it only
+fills and drops its own queue: the lag of the other sinks (seconds the
+oldest record of a batch waited) should not change.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_sinks [rigs] [seconds]
+'''
+import asyncio
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic
+from benchmarks.harness import free_port
+from forza_package import ForzaDataReader
+from local_eventhub import LocalEventHubProducerClient
+from main import AsyncForzaIO
+from producer import Producer
+from sinks import EventHubsSink, FileSink, Sink, StdoutSink, UdpSink
+
+
+class SlowSink(Sink):
+    '''Sink taking one second per batch, like a destination that stopped answering.'''
+    async def write(self, records: list[dict]) -> None:
+        await asyncio.sleep(1)
+
+
+def record_lags(sink: Sink) -> list[float]:
+    '''Returns a list receiving the lag of every batch the sink writes.'''
+    lags = []
+    write = sink.write
+
+    async def timed_write(records: list[dict]) -> None:
+        lags.append(sink.lag)
+        await write(records)
+
+    sink.write = timed_write
+    return lags
+
+
+async def measure(forza_io: AsyncForzaIO, seconds: float) -> None:
+    try:
+        await asyncio.wait_for(forza_io.run(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+def run_once(rigs: int, seconds: float, slow: bool, directory: str) -> dict:
+    port, udp_port = free_port(), free_port()
+    sinks = [EventHubsSink(Producer(client_factory = lambda: LocalEventHubProducerClient(latency = 0.01)),
+                           name = 'eventhubs'),
+             FileSink(os.path.join(directory, f'forza-{port}.jsonl'), name = 'file'),
+             UdpSink('127.0.0.1', udp_port, format = 'forza', name = 'udp'),
+             StdoutSink(open(os.devnull, 'w'), name = 'stdout')]
+    if slow:
+        sinks.append(SlowSink(name = 'slow', queue_size = 1000))
+    lags = {sink.name: record_lags(sink) for sink in sinks}
+    reader = ForzaDataReader(driver_name = 'bench', ip = '127.0.0.1', port = port, filter_rate = 0,
+                             batch_size = 32, rcvbuf_size = 1024 * 1024)
+    forza_io = AsyncForzaIO(reader = reader, producer = None, sinks = sinks, max_linger = 0.05)
+    with multiprocessing.Pool(1) as pool:
+        sender = pool.apply_async(synthetic.send, ('127.0.0.1', port, rigs, 60, seconds, 'dash'))
+        time.sleep(0.2)
+        asyncio.run(measure(forza_io, seconds + 1))
+        sent = sender.get()
+    reader.stop()
+    results = {}
+    for sink in sinks:
+        stats = sink.stats()
+        quantiles = statistics.quantiles(lags[sink.name], n = 100) if len(lags[sink.name]) > 1 else [0.0] * 99
+        results[sink.name] = {'sent': stats['sent'], 'dropped': stats['dropped'], 'queued': stats['queued'],
+                              'p50_ms': quantiles[49] * 1000, 'p99_ms': quantiles[98] * 1000}
+    return {'sent': sent, 'received': reader.stats.received, 'sinks': results}
+
+
+def run(rigs: int, seconds: float) -> None:
+    print(f'{rigs} rigs at 60 Hz for {seconds:.0f} s, records per sink and lag per batch')
+    print(f'{"run":<12} {"sink":<10} {"records":>8} {"dropped":>8} {"queued":>7} {"lag p50 ms":>11} {"lag p99 ms":>11}')
+    directory = tempfile.mkdtemp()
+    try:
+        for label, slow in (('all healthy', False), ('one stalled', True)):
+            result = run_once(rigs, seconds, slow, directory)
+            print(f'{label:<12} {"(udp in)":<10} {result["received"]:>8} of {result["sent"]} sent')
+            for name, sink in result['sinks'].items():
+                print(f'{label:<12} {name:<10} {sink["sent"]:>8} {sink["dropped"]:>8} {sink["queued"]:>7} '
+                      f'{sink["p50_ms"]:>11.2f} {sink["p99_ms"]:>11.2f}')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 16,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 5)
@@ -0,0 +1,115 @@
+'''Shared helpers for the pipeline benchmarks.
+
+A receiver process runs ForzaDataReader -> AsyncForzaIO -> RecordingProducer
+(a Producer writing to the in-memory LocalEventHubProducerClient), while
+synthetic.send() feeds it over loopback UDP from another process. Latency is
+measured from the send time carried in cur_race_time to the moment events
+reach Producer.send_events(), so only dash and FH4 packets can be used to
+measure it.
+'''
+import asyncio
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic
+from forza_package import ForzaDataReader
+from local_eventhub import LocalEventHubProducerClient
+from main import AsyncForzaIO
+from producer import Producer
+
+
+class RecordingProducer(Producer):
+    '''Producer sending to the local stand-in client and recording latencies.'''
+    def __init__(self, base: float, **kwargs) -> None:
+        super().__init__(client_factory = lambda: LocalEventHubProducerClient(latency = 0.01), **kwargs)
+        self.base = base
+        self.events = 0
+        self.latencies = []
+
+    async def send_events(self, events_list: list[dict]) -> None:
+        now = time.monotonic() - self.base
+        self.events += len(events_list)
+        self.latencies.extend(now - event['cur_race_time'] for event in events_list
+                              if isinstance(event, dict) and 'cur_race_time' in event)
+        await super().send_events(events_list)
+
+
+def free_port() -> int:
+    '''Returns a UDP port that is free on the loopback interface.'''
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def receive(port: int,
+            base: float,
+            seconds: float,
+            results: multiprocessing.Queue,
+            reader_options: dict,
+            io_options: dict) -> None:
+    '''Runs the pipeline for seconds seconds and puts its results in results.'''
+    reader = ForzaDataReader(driver_name = 'bench', ip = '127.0.0.1', port = port, **reader_options)
+    producer = RecordingProducer(base)
+    forza_io = AsyncForzaIO(reader = reader, producer = producer, **io_options)
+
+    async def main() -> None:
+        try:
+            await asyncio.wait_for(forza_io.run(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        await producer.flush()
+
+    cpu_start = time.process_time()
+    # asyncio.run() would wait forever for the legacy reader thread on shutdown
+    asyncio.new_event_loop().run_until_complete(main())
+    protocol = getattr(forza_io, 'protocol', None)
+    results.put({'cpu': time.process_time() - cpu_start,
+                 'stats': reader.stats.to_dict(),
+                 'queue_drops': protocol.dropped if protocol else 0,
+                 'events': producer.events,
+                 'latencies': producer.latencies})
+    results.close()
+    results.join_thread()
+    # the legacy reader thread blocks in recvfrom() forever
+    os._exit(0)
+
+
+def run_pipeline(rigs: int = 1,
+                 rate: float = 60,
+                 seconds: float = 5,
+                 packet_format: str = 'dash',
+                 reader_options: dict | None = None,
+                 io_options: dict | None = None) -> dict:
+    '''Sends synthetic traffic through the pipeline and returns its measurements.
+    Returns:
+        dict: sent, received, drop_rate, throughput (events/s reaching the
+            producer), cpu_us_per_packet, p50_ms and p99_ms latency.
+    '''
+    port, base = free_port(), time.monotonic()
+    results = multiprocessing.Queue()
+    receiver = multiprocessing.Process(target = receive,
+                                       args = (port, base, seconds + 1, results,
+                                               reader_options or {}, io_options or {}))
+    receiver.start()
+    time.sleep(0.5)
+    sent = synthetic.send('127.0.0.1', port, rigs, rate, seconds, packet_format, base)
+    result = results.get()
+    receiver.join()
+    received = result['stats']['received']
+    latencies = sorted(result['latencies'])
+    quantiles = statistics.quantiles(latencies, n = 100) if len(latencies) > 1 else [0.0] * 99
+    return {'sent': sent,
+            'received': received,
+            'drop_rate': 1 - received / sent if sent else 0.0,
+            'queue_drops': result['queue_drops'],
+            'kernel_drops': result['stats']['kernel_drops'],
+            'throughput': result['events'] / seconds,
+            'cpu_us_per_packet': result['cpu'] / max(received, 1) * 1e6,
+            'p50_ms': quantiles[49] * 1000,
+            'p99_ms': quantiles[98] * 1000}
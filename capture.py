@@ -0,0 +1,343 @@
+'''Raw capture of Forza datagrams to disk and time indexed replay.
+
+A capture file is append-only:
+
+    magic b'FZCAP' | version (u8) | record * N
+    record: payload length (u16) | receive time, ns since epoch (u64) | payload
+
+Next to it, <capture>.idx holds a sparse index with one fixed size entry
+every index_interval records and at every session start (first packet, race
+turning on, or timestamp_ms going backwards):
+
+    entry: record offset (u64) | receive time ns (u64) | timestamp_ms (u32) 
+           | session number (u16) | flags (u8) | padding (1 byte)
+
+Replay memory-maps the capture file and uses the index to start at any
+receive time or session timestamp_ms without scanning from the start.
+
+Usage:
+    python capture.py record <capture> [--port 6667]
+    python capture.py replay <capture> [--port 6667] [--speed 1] [--session N --timestamp MS]
+'''
+import argparse
+import asyncio
+import bisect
+import logging
+import mmap
+import os
+import socket
+import struct
+import time
+from typing import Iterator
+
+from forza_package import ForzaDataPacket, ForzaDataReader, read_header
+from logger import create_logger
+
+logger = create_logger(__name__, logging.DEBUG)
+
+MAGIC = b'FZCAP'
+VERSION = 1
+FILE_HEADER = MAGIC + bytes((VERSION,))
+FLAG_SESSION_START = 1
+
+_record_header = struct.Struct('<HQ')
+_index_entry = struct.Struct('<QQIHBx')
+
+
+class CaptureWriter:
+    '''Appends raw datagrams, with their receive time, to a capture file.
+    Args:
+        path (str): capture file, created if missing and appended to otherwise.
+        index_interval (int) default 60: records between sparse index entries.
+    '''
+    def __init__(self,
+                 path: str,
+                 index_interval: int = 60) -> None:
+        self.path = path
+        self.index_interval = index_interval
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER)
+        self.index = open(f'{path}.idx', 'ab')
+        self.offset = self.file.tell()
+        self.records = 0
+        self.session = self._last_session() + 1
+        self._since_index = index_interval
+        self._last_race_on = 0
+        self._last_timestamp = None
+        logger.debug(f'CaptureWriter writing to {path}')
+
+    def _last_session(self) -> int:
+        size = self.index.tell()
+        if size < _index_entry.size:
+            return -1
+        with open(f'{self.path}.idx', 'rb') as index:
+            index.seek(size - size % _index_entry.size - _index_entry.size)
+            return _index_entry.unpack(index.read(_index_entry.size))[3]
+
+    def write(self, data: bytes, recv_time_ns: int | None = None) -> None:
+        '''Appends one datagram to the capture.'''
+        if recv_time_ns is None:
+            recv_time_ns = time.time_ns()
+        header = read_header(data)
+        is_race_on, timestamp_ms = header if header else (0, 0)
+        flags = 0
+        if self._last_timestamp is None:
+            flags = FLAG_SESSION_START
+        elif header and ((is_race_on and not self._last_race_on) or timestamp_ms < self._last_timestamp):
+            flags = FLAG_SESSION_START
+            self.session += 1
+        if header:
+            self._last_race_on = is_race_on
+            self._last_timestamp = timestamp_ms
+        if flags or self._since_index >= self.index_interval:
+            self.index.write(_index_entry.pack(self.offset, recv_time_ns, timestamp_ms,
+                                               self.session & 0xffff, flags))
+            self._since_index = 0
+        self.file.write(_record_header.pack(len(data), recv_time_ns))
+        self.file.write(data)
+        self.offset += _record_header.size + len(data)
+        self.records += 1
+        self._since_index += 1
+
+    def flush(self) -> None:
+        self.file.flush()
+        self.index.flush()
+
+    def close(self) -> None:
+        self.file.close()
+        self.index.close()
+        logger.debug(f'CaptureWriter closed after {self.records} records')
+
+
+class IndexEntry:
+    '''One sparse index entry.'''
+    __slots__ = ('offset', 'recv_time_ns', 'timestamp_ms', 'session', 'flags')
+
+    def __init__(self, offset: int, recv_time_ns: int, timestamp_ms: int, session: int, flags: int) -> None:
+        self.offset = offset
+        self.recv_time_ns = recv_time_ns
+        self.timestamp_ms = timestamp_ms
+        self.session = session
+        self.flags = flags
+
+
+class CaptureFile:
+    '''Memory-mapped, read-only view of a capture file and its index.
+    Args:
+        path (str): capture file.
+    '''
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, 'rb')
+        if self.file.read(len(FILE_HEADER)) != FILE_HEADER:
+            self.file.close()
+            raise ValueError(f'{path} is not a capture file')
+        self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        self.index = []
+        if os.path.exists(f'{path}.idx'):
+            with open(f'{path}.idx', 'rb') as index:
+                content = index.read()
+            content = content[:len(content) - len(content) % _index_entry.size]
+            self.index = [IndexEntry(*entry) for entry in _index_entry.iter_unpack(content)]
+        self._times = [entry.recv_time_ns for entry in self.index]
+
+    @property
+    def sessions(self) -> list[IndexEntry]:
+        '''Index entries of every session start.'''
+        return [entry for entry in self.index if entry.flags & FLAG_SESSION_START]
+
+    def records(self, offset: int | None = None) -> Iterator[tuple[int, memoryview]]:
+        '''Yields (receive time ns, datagram) tuples starting at offset.
+        A truncated last record, left by an interrupted capture, is ignored.'''
+        view = memoryview(self.map)
+        position = len(FILE_HEADER) if offset is None else offset
+        end = len(self.map)
+        while position + _record_header.size <= end:
+            length, recv_time_ns = _record_header.unpack_from(self.map, position)
+            position += _record_header.size
+            if position + length > end:
+                break
+            yield recv_time_ns, view[position:position + length]
+            position += length
+
+    def offset_at_time(self, recv_time_ns: int) -> int:
+        '''Offset of the first record received at or after recv_time_ns.'''
+        i = bisect.bisect_right(self._times, recv_time_ns) - 1
+        offset = self.index[i].offset if i >= 0 else len(FILE_HEADER)
+        return self._scan(offset, lambda recv_time, data: recv_time >= recv_time_ns)
+
+    def offset_at_timestamp(self, timestamp_ms: int, session: int = -1) -> int:
+        '''Offset of the first record of session with timestamp_ms at or after 
+           timestamp_ms. session is an index in sessions, -1 is the last one.'''
+        sessions = self.sessions
+        if not sessions:
+            return len(FILE_HEADER)
+        start = sessions[session]
+        entries = [entry for entry in self.index
+                   if entry.session == start.session and entry.offset >= start.offset]
+        i = bisect.bisect_right([entry.timestamp_ms for entry in entries], timestamp_ms) - 1
+        offset = entries[max(i, 0)].offset
+
+        def reached(recv_time, data):
+            header = read_header(data)
+            return header is not None and header[1] >= timestamp_ms
+        return self._scan(offset, reached)
+
+    def _scan(self, offset: int, reached) -> int:
+        '''Scans forward from offset until reached() is true.'''
+        position = offset
+        for recv_time, data in self.records(offset):
+            if reached(recv_time, data):
+                return position
+            position += _record_header.size + len(data)
+        return position
+
+    def close(self) -> None:
+        try:
+            self.map.close()
+        except BufferError:
+            pass # datagrams are still referenced, the map is unmapped once they are freed
+        self.file.close()
+
+
+class ReplayForzaDataReader(ForzaDataReader):
+    '''ForzaDataReader that reads datagrams from a capture file instead of a socket.
+       read() and AsyncForzaIO work the same way they do with live data.
+    Args:
+        path (str): capture file.
+        driver_name (str): driver name added to the packets.
+        speed (float) default 1.0: replay speed, 2.0 is twice as fast and 0 is as
+            fast as possible.
+        start_time_ns (int) default None: start at this receive time.
+        start_timestamp_ms (int) default None: start at this timestamp_ms of session.
+        session (int) default -1: session used by start_timestamp_ms.
+        filter_rate (int) default 8: same as ForzaDataReader.
+        decimator (callable) default None: same as ForzaDataReader.
+        aggregator (callable) default None: same as ForzaDataReader.
+        fields (list[str]) default None: same as ForzaDataReader.
+    '''
+    def __init__(self,
+                 path: str,
+                 driver_name: str,
+                 speed: float = 1.0,
+                 start_time_ns: int | None = None,
+                 start_timestamp_ms: int | None = None,
+                 session: int = -1,
+                 filter_rate: int = 8,
+                 fast_decode: bool = True,
+                 decimator = None,
+                 aggregator = None,
+                 fields: list[str] | None = None) -> None:
+        super().__init__(driver_name = driver_name,
+                         filter_rate = filter_rate,
+                         fast_decode = fast_decode,
+                         decimator = decimator,
+                         aggregator = aggregator,
+                         fields = fields)
+        self.path = path
+        self.speed = speed
+        self.start_time_ns = start_time_ns
+        self.start_timestamp_ms = start_timestamp_ms
+        self.session = session
+        self.capture_file = None
+
+    def start(self) -> None:
+        '''Opens the capture file.'''
+        self.capture_file = CaptureFile(self.path)
+        logger.debug(f'\tReplayForzaDataReader started on {self.path}')
+
+    def stop(self) -> None:
+        if self.capture_file is not None:
+            self.capture_file.close()
+
+    def _start_offset(self) -> int | None:
+        if self.start_time_ns is not None:
+            return self.capture_file.offset_at_time(self.start_time_ns)
+        if self.start_timestamp_ms is not None:
+            return self.capture_file.offset_at_timestamp(self.start_timestamp_ms, self.session)
+        return None
+
+    def _delays(self) -> Iterator[tuple[float, memoryview]]:
+        '''Yields (seconds to wait, datagram) tuples paced by speed.'''
+        first_recv = start = None
+        for recv_time_ns, data in self.capture_file.records(self._start_offset()):
+            delay = 0.0
+            if self.speed:
+                if first_recv is None:
+                    first_recv, start = recv_time_ns, time.monotonic()
+                delay = start + (recv_time_ns - first_recv) / 1e9 / self.speed - time.monotonic()
+            yield delay, data
+
+    def read(self) -> ForzaDataPacket:
+        '''Generator to replay, format and output Forza data packets.
+        Stops at the end of the capture.
+        Yields: ForzaDataPacket object.'''
+        for delay, data in self._delays():
+            if delay > 0:
+                time.sleep(delay)
+            yield from self.handle(data)
+        yield from self.flush()
+
+    async def serve(self, protocol: asyncio.DatagramProtocol) -> None:
+        '''Feeds the capture to protocol from the event loop.'''
+        for count, (delay, data) in enumerate(self._delays()):
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif count % 256 == 0:
+                # let the writer run when replaying as fast as possible
+                await asyncio.sleep(0)
+            protocol.datagram_received(bytes(data), None)
+        logger.info(f'Replay of {self.path} finished')
+        await asyncio.get_running_loop().create_future()
+
+
+def record(path: str, ip: str, port: int) -> None:
+    '''Captures every datagram received on ip:port until interrupted.'''
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((ip, port))
+    writer = CaptureWriter(path)
+    try:
+        while True:
+            data, _ = sock.recvfrom(ForzaDataReader.BUFFER_SIZE)
+            writer.write(data)
+    finally:
+        writer.close()
+        sock.close()
+
+
+def replay(path: str, host: str, port: int, speed: float,
+           start_time_ns: int | None, start_timestamp_ms: int | None, session: int) -> None:
+    '''Sends a capture over UDP, so it can be read by main.py or another tool.'''
+    reader = ReplayForzaDataReader(path, 'replay', speed, start_time_ns, start_timestamp_ms, session)
+    reader.start()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    count = 0
+    for delay, data in reader._delays():
+        if delay > 0:
+            time.sleep(delay)
+        sock.sendto(data, (host, port))
+        count += 1
+    reader.stop()
+    print(f'{count} datagrams sent')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Records and replays raw Forza telemetry')
+    parser.add_argument('mode', choices = ('record', 'replay'))
+    parser.add_argument('path')
+    parser.add_argument('--host', default = None, help = 'listen address when recording, destination when replaying')
+    parser.add_argument('--port', type = int, default = 6667)
+    parser.add_argument('--speed', type = float, default = 1.0, help = '0 replays as fast as possible')
+    parser.add_argument('--time-ns', type = int, default = None, help = 'replay from this receive time')
+    parser.add_argument('--timestamp', type = int, default = None, help = 'replay from this timestamp_ms')
+    parser.add_argument('--session', type = int, default = -1)
+    args = parser.parse_args()
+    try:
+        if args.mode == 'record':
+            record(args.path, args.host or '0.0.0.0', args.port)
+        else:
+            replay(args.path, args.host or '127.0.0.1', args.port, args.speed,
+                   args.time_ns, args.timestamp, args.session)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,257 @@
+'''Compact columnar binary encoding for batches of telemetry events.
+
+A payload packs a whole batch of event dicts column by column:
+
+    magic b'FZC' | schema version (u8) | flags (u8) | body (zlib compressed when flags & 1)
+
+    body: rows (u32) | columns (u16) | column * columns
+    column: name length (u8) | name (utf-8) | type (u8) | has mask (u8)
+            | [presence bitmap, (rows + 7) // 8 bytes] | data length (u32) | data
+
+Float channels are XORed with the previous value (Gorilla style) and integer
+channels are delta encoded. Both are stored byte-shuffled, so the mostly zero
+high bytes of slowly varying channels end up next to each other and compress
+well. Missing keys are recorded in the presence bitmap.
+'''
+import json
+import struct
+import sys
+import zlib
+from array import array
+from itertools import compress
+
+MAGIC = b'FZC'
+SCHEMA_VERSION = 1
+CONTENT_TYPE = 'application/x-forza-columnar'
+FLAG_ZLIB = 1
+
+# column types
+FLOAT32_XOR = 0
+FLOAT64_XOR = 1
+INT_DELTA = 2
+BOOL = 3
+STRING_DICT = 4
+JSON = 5
+
+_header = struct.Struct('<3sBB')
+_body_header = struct.Struct('<IH')
+_u8 = struct.Struct('<B')
+_u16 = struct.Struct('<H')
+_u32 = struct.Struct('<I')
+_MISSING = object()
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+
+def _shuffle(data: bytes, width: int) -> bytes:
+    '''Groups the nth byte of every value together.'''
+    return b''.join(data[i::width] for i in range(width))
+
+
+def _unshuffle(data: bytes, width: int) -> bytes:
+    '''Reverts _shuffle().'''
+    count = len(data) // width
+    output = bytearray(len(data))
+    for i in range(width):
+        output[i::width] = data[i * count:(i + 1) * count]
+    return bytes(output)
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    values = array(typecode, data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def _xor_encode(values: list[float], float_code: str, int_code: str) -> bytes:
+    bits = array(int_code, array(float_code, values).tobytes())
+    previous = 0
+    for i, value in enumerate(bits):
+        bits[i] = value ^ previous
+        previous = value
+    return _shuffle(_little_endian(bits), bits.itemsize)
+
+
+def _xor_decode(data: bytes, float_code: str, int_code: str) -> list[float]:
+    width = array(int_code).itemsize
+    bits = _from_little_endian(int_code, _unshuffle(data, width))
+    previous = 0
+    for i, value in enumerate(bits):
+        previous = bits[i] = value ^ previous
+    return array(float_code, bits.tobytes()).tolist()
+
+
+def _delta_encode(values: list[int]) -> bytes:
+    deltas = array('q', values)
+    for i in range(len(deltas) - 1, 0, -1):
+        deltas[i] -= deltas[i - 1]
+    return _shuffle(_little_endian(deltas), 8)
+
+
+def _delta_decode(data: bytes) -> list[int]:
+    values = _from_little_endian('q', _unshuffle(data, 8))
+    for i in range(1, len(values)):
+        values[i] += values[i - 1]
+    return values.tolist()
+
+
+def _column_type(values: list) -> int:
+    '''Picks the most compact column type able to store values exactly.'''
+    kinds = {type(value) for value in values}
+    if kinds == {bool}:
+        return BOOL
+    if kinds == {int}:
+        if min(values) >= _INT64_MIN // 2 and max(values) <= _INT64_MAX // 2:
+            return INT_DELTA
+        return JSON
+    if kinds == {float}:
+        if array('f', values).tolist() == values:
+            return FLOAT32_XOR
+        return FLOAT64_XOR
+    if kinds == {str}:
+        return STRING_DICT
+    return JSON
+
+
+def _encode_values(column_type: int, values: list) -> bytes:
+    if column_type == FLOAT32_XOR:
+        return _xor_encode(values, 'f', 'I')
+    if column_type == FLOAT64_XOR:
+        return _xor_encode(values, 'd', 'Q')
+    if column_type == INT_DELTA:
+        return _delta_encode(values)
+    if column_type == BOOL:
+        return bytes(values)
+    if column_type == STRING_DICT:
+        unique = list(dict.fromkeys(values))
+        index = {value: i for i, value in enumerate(unique)}
+        parts = [_u32.pack(len(unique))]
+        for value in unique:
+            encoded = value.encode('utf-8')
+            parts.append(_u32.pack(len(encoded)))
+            parts.append(encoded)
+        indices = array('I', [index[value] for value in values])
+        parts.append(_little_endian(indices))
+        return b''.join(parts)
+    return json.dumps(values, separators = (',', ':')).encode('utf-8')
+
+
+def _decode_values(column_type: int, data: bytes) -> list:
+    if column_type == FLOAT32_XOR:
+        return _xor_decode(data, 'f', 'I')
+    if column_type == FLOAT64_XOR:
+        return _xor_decode(data, 'd', 'Q')
+    if column_type == INT_DELTA:
+        return _delta_decode(data)
+    if column_type == BOOL:
+        return [bool(value) for value in data]
+    if column_type == STRING_DICT:
+        (count,), position = _u32.unpack_from(data), _u32.size
+        unique = []
+        for _ in range(count):
+            (length,) = _u32.unpack_from(data, position)
+            position += _u32.size
+            unique.append(data[position:position + length].decode('utf-8'))
+            position += length
+        return [unique[i] for i in _from_little_endian('I', data[position:])]
+    if column_type == JSON:
+        return json.loads(data)
+    raise ValueError(f'unknown column type: {column_type}')
+
+
+def encode_batch(events: list[dict], compress_payload: bool = True) -> bytes:
+    '''Encodes a batch of events into one columnar binary payload.
+    Args:
+        events (list[dict]): events to be encoded, usually ForzaDataPacket.to_dict() output.
+        compress_payload (bool) default True: compress the payload body with zlib.
+    Returns:
+        bytes: encoded payload, ValueError is raised for keys longer than
+            255 bytes once UTF-8 encoded.
+    '''
+    names = list(dict.fromkeys(name for event in events for name in event))
+    parts = [_body_header.pack(len(events), len(names))]
+    for name in names:
+        column = [event.get(name, _MISSING) for event in events]
+        mask = [value is not _MISSING for value in column]
+        has_mask = not all(mask)
+        if has_mask:
+            column = list(compress(column, mask))
+        column_type = _column_type(column)
+        data = _encode_values(column_type, column)
+        encoded_name = name.encode('utf-8')
+        if len(encoded_name) > 255:
+            raise ValueError(f'key {name[:32]!r}... is longer than 255 bytes')
+        parts.append(_u8.pack(len(encoded_name)))
+        parts.append(encoded_name)
+        parts.append(bytes((column_type, has_mask)))
+        if has_mask:
+            bitmap = bytearray((len(events) + 7) // 8)
+            for i, present in enumerate(mask):
+                if present:
+                    bitmap[i >> 3] |= 1 << (i & 7)
+            parts.append(bytes(bitmap))
+        parts.append(_u32.pack(len(data)))
+        parts.append(data)
+    body = b''.join(parts)
+    flags = 0
+    if compress_payload:
+        body = zlib.compress(body)
+        flags |= FLAG_ZLIB
+    return _header.pack(MAGIC, SCHEMA_VERSION, flags) + body
+
+
+def decode_batch(payload: bytes) -> list[dict]:
+    '''Decodes a payload created by encode_batch() back into a list of events.
+    Args:
+        payload (bytes): encoded payload.
+    Returns:
+        list[dict]: decoded events, in the original order.
+    '''
+    magic, version, flags = _header.unpack_from(payload)
+    if magic != MAGIC:
+        raise ValueError('payload is not a forza columnar batch')
+    if version != SCHEMA_VERSION:
+        raise ValueError(f'unsupported schema version: {version}')
+    body = payload[_header.size:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    rows, columns_count = _body_header.unpack_from(body)
+    position = _body_header.size
+    names, columns = [], []
+    masked = False
+    for _ in range(columns_count):
+        (length,) = _u8.unpack_from(body, position)
+        position += 1
+        names.append(body[position:position + length].decode('utf-8'))
+        position += length
+        column_type, has_mask = body[position], body[position + 1]
+        position += 2
+        bitmap = None
+        if has_mask:
+            bitmap = body[position:position + (rows + 7) // 8]
+            position += len(bitmap)
+        (length,) = _u32.unpack_from(body, position)
+        position += _u32.size
+        values = _decode_values(column_type, body[position:position + length])
+        position += length
+        if bitmap is not None:
+            masked = True
+            present = iter(values)
+            values = [next(present) if bitmap[i >> 3] & (1 << (i & 7)) else _MISSING
+                      for i in range(rows)]
+        columns.append(values)
+    if not columns:
+        return [{} for _ in range(rows)]
+    events = [dict(zip(names, row)) for row in zip(*columns)]
+    if masked:
+        events = [{name: value for name, value in event.items() if value is not _MISSING}
+                  for event in events]
+    return events
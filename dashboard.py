@@ -0,0 +1,191 @@
+'''Live dashboard server: latest state per driver over Server-Sent Events.
+
+AsyncForzaIO feeds every record it queues for the Producer to
+DashboardServer.update(), which only stores it as the latest record of its
+driver, so ingest never waits on browsers. Each connected client has its own
+coroutine that wakes at most hz times per second and sends the records that
+changed since its last frame; intermediate records are skipped (coalesced),
+so a slow client only gets fewer frames, and a client that does not read for
+send_timeout seconds is disconnected.
+
+Routes:
+    /                  minimal live page
+    /events?hz=10      text/event-stream, one 'state' (or lap_summary, ...)
+                       event per driver that changed, add &driver=<name> to
+                       follow one driver
+    /state             JSON array with the latest records
+'''
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+from logger import create_logger
+
+logger = create_logger(__name__, logging.DEBUG)
+
+_SSE_HEADERS = (b'HTTP/1.1 200 OK\r\n'
+                b'Content-Type: text/event-stream\r\n'
+                b'Cache-Control: no-cache\r\n'
+                b'Connection: keep-alive\r\n'
+                b'Access-Control-Allow-Origin: *\r\n\r\n')
+
+_PAGE = b'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Forza dashboard</title>
+<style>body{font-family:sans-serif;background:#111;color:#eee}td,th{padding:4px 12px;text-align:right}</style>
+</head><body><table><thead><tr><th>driver</th><th>km/h</th><th>rpm</th><th>gear</th>
+<th>lap</th><th>lap time</th><th>best</th><th>pos</th></tr></thead><tbody id="rows"></tbody></table>
+<script>
+const rows = {};
+const fixed = (value, digits) => value === undefined ? '' : Number(value).toFixed(digits);
+new EventSource('events').addEventListener('state', (message) => {
+  const s = JSON.parse(message.data);
+  let row = rows[s.driver_name];
+  if (!row) {
+    row = rows[s.driver_name] = document.createElement('tr');
+    document.getElementById('rows').appendChild(row);
+  }
+  row.innerHTML = [s.driver_name, fixed(s.speed * 3.6, 0), fixed(s.current_engine_rpm, 0), s.gear,
+                   s.lap_no, fixed(s.cur_lap_time, 3), fixed(s.best_lap_time, 3), s.race_pos]
+                  .map((value) => `<td>${value ?? ''}</td>`).join('');
+});
+</script></body></html>
+'''
+
+
+class _Client:
+    __slots__ = ('writer', 'interval', 'driver', 'seen')
+
+    def __init__(self, writer: asyncio.StreamWriter, interval: float, driver: str | None) -> None:
+        self.writer = writer
+        self.interval = interval
+        self.driver = driver
+        self.seen = 0 # last version sent
+
+
+class DashboardServer:
+    '''Broadcasts the latest record of each driver to browser clients.
+    Args:
+        host (str) default '0.0.0.0': address to listen on.
+        port (int) default 8080: port to listen on.
+        max_rate (float) default 20: maximum frames per second per client, clients
+            ask for less with ?hz=.
+        fields (list[str]) default None: keys of the packet records sent to clients,
+            all when None. Records with an event_type are sent whole.
+        send_timeout (float) default 10: seconds a client may take to read a frame
+            before it is disconnected.
+    '''
+    def __init__(self,
+                 host: str = '0.0.0.0',
+                 port: int = 8080,
+                 max_rate: float = 20,
+                 fields: list[str] | None = None,
+                 send_timeout: float = 10) -> None:
+        self.host = host
+        self.port = port
+        self.max_rate = max_rate
+        self.fields = None if fields is None else [*fields, 'driver_name']
+        self.send_timeout = send_timeout
+        self.latest = {} # (driver name, event type) -> [version, record, encoded frame]
+        self.version = 0
+        self.clients = set()
+        self.frames_sent = 0
+        self.updates_skipped = 0
+        self._changed = asyncio.Event()
+        metrics.REGISTRY.register(f'dashboard:{port}', self._collect_metrics)
+
+    def update(self, record: dict) -> None:
+        '''Stores record as the latest one of its driver. Never blocks.'''
+        kind = record.get('event_type', 'state')
+        if self.fields is not None and kind == 'state':
+            record = {key: record[key] for key in self.fields if key in record}
+        self.version += 1
+        self.latest[(record.get('driver_name'), kind)] = [self.version, record, None]
+        self._changed.set()
+
+    def _frames(self, client: _Client) -> list[bytes]:
+        '''Returns the frames of the records changed since the client's last frame.'''
+        frames = []
+        for (driver, kind), entry in self.latest.items():
+            if entry[0] <= client.seen or (client.driver is not None and driver != client.driver):
+                continue
+            if entry[2] is None:
+                entry[2] = f'event: {kind}\ndata: {json.dumps(entry[1])}\n\n'.encode()
+            frames.append(entry[2])
+        return frames
+
+    async def _stream(self, client: _Client) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            while self.version == client.seen:
+                self._changed.clear()
+                await self._changed.wait()
+            version = self.version
+            frames = self._frames(client)
+            self.updates_skipped += version - client.seen - len(frames)
+            client.seen = version
+            if not frames:
+                continue
+            due = loop.time() + client.interval
+            client.writer.write(b''.join(frames))
+            await asyncio.wait_for(client.writer.drain(), self.send_timeout)
+            self.frames_sent += len(frames)
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client = None
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass # headers
+            parts = request.decode('latin-1').split()
+            url = urlsplit(parts[1] if len(parts) > 1 else '/')
+            if url.path == '/events':
+                query = parse_qs(url.query)
+                hz = min(max(float(query.get('hz', [self.max_rate])[0]), 0.1), self.max_rate)
+                client = _Client(writer, 1 / hz, query.get('driver', [None])[0])
+                # drain() waits, and the client is coalesced, once 64 KB are buffered
+                writer.transport.set_write_buffer_limits(high = 64 * 1024)
+                writer.write(_SSE_HEADERS)
+                self.clients.add(client)
+                await self._stream(client)
+                return
+            if url.path == '/':
+                content_type, body = 'text/html; charset=utf-8', _PAGE
+            elif url.path == '/state':
+                content_type = 'application/json'
+                body = json.dumps([entry[1] for entry in self.latest.values()]).encode()
+            else:
+                writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                await writer.drain()
+                return
+            writer.write(f'HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n'
+                         f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except asyncio.TimeoutError:
+            logger.warning('Dashboard client too slow, disconnecting')
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.clients.discard(client)
+            writer.close()
+
+    def _collect_metrics(self) -> list:
+        port = {'port': str(self.port)}
+        return [('forza_dashboard_clients', 'gauge', 'Connected dashboard clients',
+                 [(port, len(self.clients))]),
+                ('forza_dashboard_frames_total', 'counter', 'Records sent to dashboard clients',
+                 [(port, self.frames_sent)]),
+                ('forza_dashboard_skipped_total', 'counter',
+                 'Records not sent to a client because a newer one replaced them',
+                 [(port, self.updates_skipped)])]
+
+    async def serve(self) -> None:
+        '''Serves the dashboard, forever.'''
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info('Dashboard served on http://%s:%d/', self.host, self.port)
+        async with server:
+            await server.serve_forever()
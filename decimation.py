@@ -0,0 +1,165 @@
+'''Pluggable decimation of the packet stream.
+
+ForzaDataReader keeps one decimator per driver, created by the factory given
+in its decimator argument, for example:
+
+    ForzaDataReader(..., decimator = lambda: TimeRate(hz = 10))
+    ForzaDataReader(..., decimator = lambda: Deadband(DEFAULT_DEADBANDS, max_interval_ms = 500))
+    ForzaDataReader(..., decimator = lambda: MinMaxWindow(200, ['speed', 'acceleration_z']))
+
+admit() is called with the header timestamp_ms before the packet is decoded,
+so rate based decimators never pay for decoding dropped packets. push() is
+called with every decoded packet and returns the packets to emit, which may
+be earlier packets held back by window based decimators.
+'''
+# channel -> minimum change worth sending
+DEFAULT_DEADBANDS = {
+    'speed': 0.5,
+    'current_engine_rpm': 150.0,
+    'accel': 16, 'brake': 16, 'handbrake': 1, 'clutch': 32,
+    'steer': 8, 'gear': 1, 'lap_no': 1, 'race_pos': 1,
+    'acceleration_x': 2.0, 'acceleration_z': 2.0, 'acceleration_y': 2.0,
+    'tire_combined_slip_FL': 0.3, 'tire_combined_slip_FR': 0.3,
+    'tire_combined_slip_RL': 0.3, 'tire_combined_slip_RR': 0.3,
+    'wheel_on_rumble_strip_FL': 1, 'wheel_on_rumble_strip_FR': 1,
+    'wheel_on_rumble_strip_RL': 1, 'wheel_on_rumble_strip_RR': 1,
+    'tire_temp_FL': 2.0, 'tire_temp_FR': 2.0, 'tire_temp_RL': 2.0, 'tire_temp_RR': 2.0,
+}
+
+
+class Decimator:
+    '''Base decimator, keeps every packet.'''
+    def admit(self, timestamp_ms: int) -> bool:
+        '''Decides from the packet header whether the packet is decoded at all.'''
+        return True
+
+    def push(self, packet) -> list:
+        '''Receives a decoded packet and returns the packets to emit.'''
+        return [packet]
+
+    def flush(self) -> list:
+        '''Returns packets still held back, at the end of the stream.'''
+        return []
+
+
+class DropAll(Decimator):
+    '''Keeps no packet, for pipelines that only send lap summaries (see laps.py).'''
+    def admit(self, timestamp_ms: int) -> bool:
+        return False
+
+
+class EveryNth(Decimator):
+    '''Skips the first n packets and then keeps one packet every n, the legacy
+       filter_rate behavior. n = 0 keeps every packet.
+    Args:
+        n (int): filter rate.
+    '''
+    def __init__(self, n: int) -> None:
+        self.n = n
+        self.counter = 0
+
+    def admit(self, timestamp_ms: int) -> bool:
+        if self.counter < self.n:
+            self.counter += 1
+            return False
+        self.counter = 1
+        return True
+
+
+class TimeRate(Decimator):
+    '''Keeps packets at a target rate measured with timestamp_ms, regardless of
+       the rate the game sends at.
+    Args:
+        hz (float): packets per second to keep.
+    '''
+    def __init__(self, hz: float) -> None:
+        self.interval_ms = 1000 / hz
+        self.last_ms = None
+        self.next_ms = None
+
+    def admit(self, timestamp_ms: int) -> bool:
+        if self.next_ms is not None and self.last_ms <= timestamp_ms < self.next_ms:
+            return False
+        if self.next_ms is None or timestamp_ms < self.last_ms or timestamp_ms >= self.next_ms + self.interval_ms:
+            # first packet, timestamp_ms reset by the game or a gap in the stream
+            self.next_ms = timestamp_ms + self.interval_ms
+        else:
+            self.next_ms += self.interval_ms
+        self.last_ms = timestamp_ms
+        return True
+
+
+class Deadband(Decimator):
+    '''Keeps a packet only when a channel changed by at least its deadband since
+       the last kept packet, or when max_interval_ms passed without any.
+    Args:
+        deadbands (dict[str, float]) default DEFAULT_DEADBANDS: channel -> minimum change.
+        max_interval_ms (int) default 1000: heartbeat interval.
+    '''
+    def __init__(self,
+                 deadbands: dict[str, float] | None = None,
+                 max_interval_ms: int = 1000) -> None:
+        self.deadbands = list((deadbands or DEFAULT_DEADBANDS).items())
+        self.max_interval_ms = max_interval_ms
+        self.last = None
+        self.last_ms = None
+
+    def push(self, packet) -> list:
+        timestamp_ms = packet.timestamp_ms
+        last = self.last
+        if last is not None and 0 <= timestamp_ms - self.last_ms < self.max_interval_ms:
+            for channel, deadband in self.deadbands:
+                value = getattr(packet, channel, None)
+                if value is not None and abs(value - getattr(last, channel)) >= deadband:
+                    break
+            else:
+                return []
+        self.last = packet
+        self.last_ms = timestamp_ms
+        return [packet]
+
+
+class MinMaxWindow(Decimator):
+    '''Peak preserving reduction: for each window_ms window emits, in time order,
+       the first packet and the packets holding the minimum and the maximum of
+       every channel. Packets are emitted when the window closes.
+    Args:
+        window_ms (int): window length.
+        channels (list[str]): channels whose extremes are preserved.
+    '''
+    def __init__(self,
+                 window_ms: int,
+                 channels: list[str]) -> None:
+        self.window_ms = window_ms
+        self.channels = channels
+        self.window_start = None
+        self.selected = {}
+
+    def _close(self) -> list:
+        selected = {id(packet): packet for packet in self.selected.values()}
+        self.selected = {}
+        return sorted(selected.values(), key = lambda packet: packet.timestamp_ms)
+
+    def push(self, packet) -> list:
+        timestamp_ms = packet.timestamp_ms
+        emitted = []
+        if self.window_start is None or not 0 <= timestamp_ms - self.window_start < self.window_ms:
+            emitted = self._close()
+            self.window_start = timestamp_ms
+            self.selected['first'] = packet
+        selected = self.selected
+        for channel in self.channels:
+            value = getattr(packet, channel, None)
+            if value is None:
+                continue
+            low, high = selected.get(('min', channel)), selected.get(('max', channel))
+            if low is None or value < getattr(low, channel):
+                selected[('min', channel)] = packet
+            if high is None or value > getattr(high, channel):
+                selected[('max', channel)] = packet
+        return emitted
+
+    def flush(self) -> list:
+        self.window_start = None
+        return self._close()
+
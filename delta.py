@@ -0,0 +1,182 @@
+'''Live time delta to the best lap.
+
+DeltaTracker keeps the trace (position_x, position_z, distance into the lap
+and cur_lap_time) of the lap in progress. When a complete lap is faster
+than the reference, its trace becomes the new ReferenceLap, indexed on a
+uniform grid of cell_size meters. For every packet, the nearest reference
+point is looked up in the grid cells around the car, the car position is
+projected on the reference segment next to it, and
+
+    delta_best = cur_lap_time - interpolated reference time
+
+(negative when ahead of the best lap) is added to the packet extras, so it
+is in the outgoing record. Only reference points within distance_window
+meters of the car's distance into the lap are considered when there are
+some, so crossing parts of a track (bridges, figure eight layouts) are not
+mistaken for each other.
+
+    ForzaDataReader(..., aggregator = DeltaTracker)
+
+The tracker runs for every race packet, before decimation, on fully
+decoded packets: readers with fields do not accept aggregators.
+'''
+import logging
+import math
+
+import numpy as np
+
+from logger import create_logger
+
+logger = create_logger(__name__, logging.DEBUG)
+
+CELL_SIZE = 10.0 # meters
+DISTANCE_WINDOW = 200.0 # meters
+_MAX_RING = 10 # cells searched around the car, beyond that the car is off the reference
+_LAP_START_TIME = 0.5 # seconds, traces starting later than this are partial laps
+# cell offsets at each Chebyshev distance from the car's cell
+_RINGS = [[(dx, dz) for dx in range(-ring, ring + 1) for dz in range(-ring, ring + 1)
+           if max(abs(dx), abs(dz)) == ring] for ring in range(_MAX_RING + 1)]
+
+
+class ReferenceLap:
+    '''Lap trace indexed by position on a uniform grid.
+    Args:
+        x (sequence[float]): position_x of each sample.
+        z (sequence[float]): position_z of each sample.
+        distance (sequence[float]): meters from the start of the lap.
+        time (sequence[float]): seconds from the start of the lap.
+        lap_time (float): lap time.
+        cell_size (float) default CELL_SIZE: grid cell size in meters.
+    '''
+    def __init__(self,
+                 x, z, distance, time,
+                 lap_time: float,
+                 cell_size: float = CELL_SIZE) -> None:
+        self.lap_time = lap_time
+        self.cell_size = cell_size
+        positions = np.column_stack((np.asarray(x, dtype = np.float64), np.asarray(z, dtype = np.float64)))
+        # lookups run in pure Python, on lists of Python floats
+        self.x, self.z = positions[:, 0].tolist(), positions[:, 1].tolist()
+        self.distance = np.asarray(distance, dtype = np.float64).tolist()
+        self.time = np.asarray(time, dtype = np.float64).tolist()
+        # cell -> indices of the samples in it, built with numpy so swapping
+        # references costs a few milliseconds even for long tracks
+        cells = np.floor(positions / cell_size).astype(np.int64)
+        order = np.lexsort((cells[:, 1], cells[:, 0]))
+        cells = cells[order]
+        starts = np.flatnonzero(np.r_[True, np.any(cells[1:] != cells[:-1], axis = 1)])
+        self.grid = dict(zip(map(tuple, cells[starts].tolist()), (group.tolist() for group in np.split(order, starts[1:]))))
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def nearest(self, x: float, z: float, distance: float | None = None,
+                distance_window: float = DISTANCE_WINDOW) -> int | None:
+        '''Returns the index of the reference sample nearest to (x, z), among
+           those within distance_window of distance when there are some, None
+           when no sample is within _MAX_RING cells.'''
+        cx, cz = math.floor(x / self.cell_size), math.floor(z / self.cell_size)
+        grid, xs, zs, distances = self.grid, self.x, self.z, self.distance
+        best = best_in_window = None
+        best_squared = best_squared_in_window = math.inf
+        for ring, offsets in enumerate(_RINGS):
+            for dx, dz in offsets:
+                for index in grid.get((cx + dx, cz + dz), ()):
+                    squared = (xs[index] - x) ** 2 + (zs[index] - z) ** 2
+                    if squared < best_squared:
+                        best, best_squared = index, squared
+                    if (squared < best_squared_in_window and distance is not None
+                            and abs(distances[index] - distance) <= distance_window):
+                        best_in_window, best_squared_in_window = index, squared
+            # samples beyond this ring are more than ring cells away; a nearer
+            # sample outside the window gets one more ring to find one inside it
+            reach = ring * self.cell_size
+            if best_in_window is not None and best_squared_in_window <= reach * reach:
+                break
+            if best_in_window is None and best is not None and ring and best_squared <= (reach - self.cell_size) ** 2:
+                break
+        return best_in_window if best_in_window is not None else best
+
+    def time_at(self, x: float, z: float, distance: float | None = None,
+                distance_window: float = DISTANCE_WINDOW) -> float | None:
+        '''Returns the reference lap time at the point of the trace nearest to
+           (x, z), interpolated along the segment next to it.'''
+        index = self.nearest(x, z, distance, distance_window)
+        if index is None:
+            return None
+        xs, zs, times = self.x, self.z, self.time
+        for start in (index, index - 1):
+            end = start + 1
+            if start < 0 or end >= len(xs):
+                continue
+            dx, dz = xs[end] - xs[start], zs[end] - zs[start]
+            length = dx * dx + dz * dz
+            if not length:
+                continue
+            fraction = ((x - xs[start]) * dx + (z - zs[start]) * dz) / length
+            if 0 <= fraction <= 1:
+                return times[start] + fraction * (times[end] - times[start])
+        return times[index]
+
+
+class DeltaTracker:
+    '''Adds delta_best, the time delta to the best lap, to the packets of one
+       driver. Used as an aggregator of ForzaDataReader, it returns no events.
+    Args:
+        reference (ReferenceLap) default None: lap compared with until a faster
+            lap completes.
+        cell_size (float) default CELL_SIZE: grid cell size in meters.
+        distance_window (float) default DISTANCE_WINDOW: meters around the car's
+            distance into the lap where reference samples are looked for first.
+    '''
+    def __init__(self,
+                 reference: ReferenceLap | None = None,
+                 cell_size: float = CELL_SIZE,
+                 distance_window: float = DISTANCE_WINDOW) -> None:
+        self.reference = reference
+        self.cell_size = cell_size
+        self.distance_window = distance_window
+        self.lap_no = None
+        self.last_time = 0.0
+        self.start_distance = 0.0
+        self.trace = ([], [], [], []) # x, z, distance, time of the lap in progress
+        self.swaps = 0
+
+    def _end_lap(self, packet) -> None:
+        '''Makes the lap that just ended the reference when it is complete and faster.'''
+        x, z, distance, time = self.trace
+        complete = (self.lap_no is not None and packet.lap_no == self.lap_no + 1
+                    and len(time) > 1 and time[0] < _LAP_START_TIME)
+        lap_time = packet.last_lap_time or self.last_time
+        if complete and lap_time > 0 and (self.reference is None or lap_time < self.reference.lap_time):
+            self.reference = ReferenceLap(x, z, distance, time, lap_time, self.cell_size)
+            self.swaps += 1
+            logger.info('New reference lap for %s: lap %d, %.3f s, %d samples',
+                        packet.driver_name, self.lap_no, lap_time, len(time))
+        self.trace = ([], [], [], [])
+        self.lap_no = packet.lap_no
+        self.start_distance = packet.dist_traveled
+
+    def push(self, packet) -> list:
+        '''Records the packet in the lap trace and sets its delta_best extra.'''
+        if packet.packet_format == 'sled':
+            return []
+        cur_lap_time = packet.cur_lap_time
+        if packet.lap_no != self.lap_no or cur_lap_time < self.last_time:
+            self._end_lap(packet)
+        self.last_time = cur_lap_time
+        x, z = packet.position_x, packet.position_z
+        distance = packet.dist_traveled - self.start_distance
+        trace = self.trace
+        trace[0].append(x)
+        trace[1].append(z)
+        trace[2].append(distance)
+        trace[3].append(cur_lap_time)
+        if self.reference is not None:
+            reference_time = self.reference.time_at(x, z, distance, self.distance_window)
+            if reference_time is not None:
+                packet.extras = {'delta_best': round(cur_lap_time - reference_time, 3)}
+        return []
+
+    def flush(self) -> list:
+        return []
@@ -0,0 +1,127 @@
+'''Columnar batch decoding of Forza telemetry datagrams with NumPy.
+
+Datagrams are decoded with a single np.frombuffer call over a contiguous
+buffer instead of building one Python object per packet. The structured
+dtypes are derived from ForzaDataPacket.sled_format/dash_format and
+ForzaDataPacket.sled_props/dash_props.
+'''
+import logging
+
+import numpy as np
+
+from forza_package import ForzaDataPacket, FastForzaDataPacket
+from logger import create_logger
+
+logger = create_logger(__name__, logging.DEBUG)
+
+# struct format code -> little-endian numpy type
+STRUCT_TO_NUMPY = {'i': '<i4', 'I': '<u4', 'f': '<f4', 'H': '<u2', 'B': 'u1', 'b': 'i1'}
+
+
+def build_dtype(struct_format: str,
+                props: list[str],
+                offset: int = 0,
+                itemsize: int | None = None) -> np.dtype:
+    '''Builds a structured dtype from a struct format and field names.
+    Fields follow each other with no padding between them; the dtype is packed
+    only with the default offset and itemsize, FH4_DTYPE is not.
+    Args:
+        struct_format (str): little-endian struct format, one code per field.
+        props (list[str]): field names, in the same order of struct_format.
+        offset (int) default 0: bytes before the first field (13 for FH4 packets).
+        itemsize (int) default None: total record size, defaults to the packed size.
+    Returns:
+        np.dtype: structured dtype matching the datagram layout.
+    '''
+    codes = struct_format.lstrip('<')
+    if len(codes) != len(props):
+        raise ValueError(f'{len(codes)} format codes for {len(props)} fields')
+    formats = [np.dtype(STRUCT_TO_NUMPY[code]) for code in codes]
+    offsets = []
+    for fmt in formats:
+        offsets.append(offset)
+        offset += fmt.itemsize
+    return np.dtype({'names': list(props),
+                     'formats': formats,
+                     'offsets': offsets,
+                     'itemsize': itemsize or offset})
+
+
+SLED_DTYPE = build_dtype(ForzaDataPacket.sled_format, ForzaDataPacket.sled_props)
+DASH_DTYPE = build_dtype(ForzaDataPacket.dash_format,
+                         ForzaDataPacket.sled_props + ForzaDataPacket.dash_props)
+FH4_DTYPE = build_dtype(ForzaDataPacket.dash_format,
+                        ForzaDataPacket.sled_props + ForzaDataPacket.dash_props,
+                        offset = FastForzaDataPacket.FH4_OFFSET,
+                        itemsize = FastForzaDataPacket.FH4_LENGTH)
+
+# packet length -> structured dtype over the raw datagram
+DTYPES = {
+    FastForzaDataPacket.SLED_LENGTH: SLED_DTYPE,
+    FastForzaDataPacket.DASH_LENGTH: DASH_DTYPE,
+    FastForzaDataPacket.FH4_LENGTH: FH4_DTYPE,
+}
+
+
+def decode_buffer(buffer: bytes | bytearray | memoryview,
+                  packet_length: int) -> np.ndarray:
+    '''Decodes a contiguous buffer of same length datagrams without copying.
+    Args:
+        buffer: concatenated datagrams.
+        packet_length (int): length of every datagram in buffer.
+    Returns:
+        np.ndarray: read-only structured array viewing buffer, one record per datagram.
+    '''
+    try:
+        dtype = DTYPES[packet_length]
+    except KeyError:
+        raise ValueError(f'unexpected packet length: {packet_length} bytes') from None
+    if len(buffer) % packet_length:
+        raise ValueError(f'buffer size {len(buffer)} is not a multiple of {packet_length}')
+    return np.frombuffer(buffer, dtype = dtype)
+
+
+def decode_batch(datagrams: list[bytes]) -> np.ndarray:
+    '''Decodes a batch of datagrams into a packed structured array.
+    Sled datagrams cannot be mixed with dash or FH4 ones, as they lack the dash 
+    fields. Dash and FH4 datagrams can be mixed and keep their input order.
+    Args:
+        datagrams (list[bytes]): raw datagrams as received from the game.
+    Returns:
+        np.ndarray: structured array with one record per datagram and one 
+            field per channel, using sled or dash field names.
+    '''
+    if not datagrams:
+        return np.empty(0, dtype = DASH_DTYPE)
+    lengths = {len(datagram) for datagram in datagrams}
+    if len(lengths) == 1:
+        length = lengths.pop()
+        records = decode_buffer(b''.join(datagrams), length)
+        if length != FastForzaDataPacket.FH4_LENGTH:
+            return records.copy()
+        # FH4 records are copied field by field into the packed dash layout
+        output = np.empty(len(datagrams), dtype = DASH_DTYPE)
+        output[:] = records
+        return output
+    if FastForzaDataPacket.SLED_LENGTH in lengths:
+        raise ValueError('sled datagrams cannot be decoded together with dash or FH4 datagrams')
+    unexpected = lengths - DTYPES.keys()
+    if unexpected:
+        raise ValueError(f'unexpected packet lengths: {sorted(unexpected)}')
+    lengths_array = np.fromiter((len(datagram) for datagram in datagrams),
+                                dtype = np.int32, count = len(datagrams))
+    output = np.empty(len(datagrams), dtype = DASH_DTYPE)
+    for length in lengths:
+        selected = np.flatnonzero(lengths_array == length)
+        output[selected] = decode_buffer(b''.join([datagrams[i] for i in selected]), length)
+    return output
+
+
+def to_columns(records: np.ndarray) -> dict[str, np.ndarray]:
+    '''Converts a structured array into a dict of contiguous column arrays.'''
+    return {name: np.ascontiguousarray(records[name]) for name in records.dtype.names}
+
+
+def decode_columns(datagrams: list[bytes]) -> dict[str, np.ndarray]:
+    '''Decodes a batch of datagrams into a dict of column arrays.'''
+    return to_columns(decode_batch(datagrams))
@@ -26,11 +26,15 @@ adding this simple and short one to inform that I have modified original code.
 MarlosB 
 '''
 
+import asyncio
 import json
 import logging
 import socket
-from struct import unpack
+import sys
+from struct import Struct, unpack
+from typing import Callable
 
+from decimation import Decimator, EveryNth
 from logger import create_logger
 
 logger = create_logger(__name__, logging.DEBUG)
@@ -38,6 +42,10 @@ logger = create_logger(__name__, logging.DEBUG)
 IP_ADDRESS = '0.0.0.0' # all interfaces from the local machine
 PORT = 6667
 
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40) # linux value, missing from older pythons
+_ANCDATA_SIZE = socket.CMSG_SPACE(4) if hasattr(socket, 'CMSG_SPACE') else 0
+_MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+
 class ForzaDataPacket:
     '''Class to handle Forza data packets.
     Args:
@@ -125,6 +133,7 @@ class ForzaDataPacket:
                 setattr(self, prop_name, prop_value)
         # atribuindo valor ao atributo driver_name
         setattr(self, 'driver_name', driver_name)
+        self.extras = None # derived channels added by aggregators, e.g. delta_best
         
 
 
@@ -133,9 +142,190 @@ class ForzaDataPacket:
         '''Converts the ForzaDataPacket object to JSON.'''
         return json.dumps(self.to_dict())
     
+    def to_dict(self, fields: list[str] | None = None) -> dict:
+        '''Converts the ForzaDataPacket object to dict.
+        Args:
+            fields (list[str]) default None: channels to include, all when None.
+                driver_name and the extras (channels added by aggregators) are always included.'''
+        if fields is None:
+            record = {prop_name: getattr(self, prop_name) for prop_name in self.attrirbutes_list}
+        else:
+            record = {prop_name: getattr(self, prop_name) for prop_name in fields 
+                      if prop_name in self.attrirbutes_list}
+            record['driver_name'] = self.driver_name
+        if self.extras:
+            record.update(self.extras)
+        return record
+
+
+def _field(name: str, index: int) -> property:
+    '''Builds a read-only property that reads one slot of the values tuple.'''
+    def getter(self):
+        try:
+            return self.values[index]
+        except IndexError:
+            raise AttributeError(f'{self.packet_format} packet has no attribute {name!r}') from None
+    return property(getter, doc=f'{name} channel value')
+
+
+class FastForzaDataPacket:
+    '''Fast, tuple backed version of ForzaDataPacket.
+    The struct layouts are compiled once at class creation and every packet keeps
+    its decoded values in a single tuple, so decoding is one unpack call and
+    there is no per instance __dict__. Channels are read with the same
+    attribute names used by ForzaDataPacket (packet.speed, packet.lap_no, ...).
+    Args:
+        data (bytearray): Data packet to be parsed.
+        driver_name (str): name of the driver who generated the packet.
+    '''
+    __slots__ = ('values', 'keys', 'driver_name', 'packet_format', 'extras')
+
+    SLED_LENGTH = ForzaDataPacket.SLED_LENGTH
+    DASH_LENGTH = ForzaDataPacket.DASH_LENGTH
+    FH4_LENGTH = ForzaDataPacket.FH4_LENGTH
+    FH4_OFFSET = FH4_LENGTH - DASH_LENGTH
+
+    sled_struct = Struct(ForzaDataPacket.sled_format)
+    dash_struct = Struct(ForzaDataPacket.dash_format)
+    sled_keys = tuple(ForzaDataPacket.sled_props)
+    dash_keys = tuple(ForzaDataPacket.sled_props + ForzaDataPacket.dash_props)
+
+    # packet length -> (packet_format, struct, keys, offset)
+    layouts = {
+        SLED_LENGTH: ('sled', sled_struct, sled_keys, 0),
+        DASH_LENGTH: ('dash', dash_struct, dash_keys, 0),
+        FH4_LENGTH: ('fh4', dash_struct, dash_keys, FH4_OFFSET),
+    }
+
+    def __init__(self,
+                 data: bytearray,
+                 driver_name: str) -> None:
+        '''Initializes the FastForzaDataPacket object.'''
+        try:
+            packet_format, layout, keys, offset = self.layouts[len(data)]
+        except KeyError:
+            raise ValueError(f'unexpected packet length: {len(data)} bytes') from None
+        self.packet_format = packet_format
+        self.keys = keys
+        self.values = layout.unpack_from(data, offset)
+        self.driver_name = driver_name
+        self.extras = None # derived channels added by aggregators, e.g. delta_best
+
+    def to_json(self) -> str:
+        '''Converts the FastForzaDataPacket object to JSON.'''
+        return json.dumps(self.to_dict())
+
+    def to_dict(self, fields: list[str] | None = None) -> dict:
+        '''Converts the FastForzaDataPacket object to dict.
+        Keys and order are the same produced by ForzaDataPacket.to_dict().
+        Args:
+            fields (list[str]) default None: channels to include, all when None.
+                driver_name and the extras (channels added by aggregators) are always included.'''
+        if fields is None:
+            record = dict(zip(self.keys, self.values))
+        else:
+            record = {key: value for key, value in zip(self.keys, self.values) if key in fields}
+        record['driver_name'] = self.driver_name
+        if self.extras:
+            record.update(self.extras)
+        return record
+
+
+for _index, _name in enumerate(FastForzaDataPacket.dash_keys):
+    setattr(FastForzaDataPacket, _name, _field(_name, _index))
+del _index, _name
+
+# struct format character -> size in bytes
+_FORMAT_SIZES = {code: Struct('<' + code).size for code in 'iIfHBb'}
+_projections = {} # tuple of fields -> FastForzaDataPacket subclass
+
+
+def _missing_field(name: str) -> property:
+    def getter(self):
+        raise AttributeError(f'{name!r} is not one of the projected fields')
+    return property(getter, doc=f'{name} channel, not projected')
+
+
+def _project_format(format: str, keys: tuple, fields: set) -> tuple[str, tuple]:
+    '''Returns the struct format decoding only fields, with pad bytes in place
+       of the other channels, and the keys it decodes.'''
+    codes, selected, pad = [format[0]], [], 0
+    for key, code in zip(keys, format[1:]):
+        if key in fields:
+            if pad:
+                codes.append(f'{pad}x')
+                pad = 0
+            codes.append(code)
+            selected.append(key)
+        else:
+            pad += _FORMAT_SIZES[code]
+    # trailing channels are not padded, unpack_from() ignores the extra bytes
+    return ''.join(codes), tuple(selected)
+
+
+def projection(fields: list[str]) -> type:
+    '''Builds a FastForzaDataPacket subclass that decodes only fields.
+    Skipped channels are pad bytes in the generated struct formats, so they are
+    never converted to Python objects, and to_dict() returns only the fields
+    (timestamp_ms and driver_name are always included). Reading a channel that
+    is not projected raises AttributeError. Subclasses are cached, the same
+    fields return the same class.
+    Args:
+        fields (list[str]): channel names from ForzaDataPacket.sled_props and dash_props.
+    Returns:
+        FastForzaDataPacket subclass.'''
+    unknown = [field for field in fields if field not in FastForzaDataPacket.dash_keys]
+    if unknown:
+        raise ValueError(f'unknown fields: {unknown}')
+    selected = {'timestamp_ms', *fields}
+    key = tuple(sorted(selected))
+    packet_class = _projections.get(key)
+    if packet_class is not None:
+        return packet_class
+    layouts = {}
+    for length, (packet_format, _, keys, offset) in FastForzaDataPacket.layouts.items():
+        layout_format = ForzaDataPacket.sled_format if packet_format == 'sled' else ForzaDataPacket.dash_format
+        projected_format, projected_keys = _project_format(layout_format, keys, selected)
+        layouts[length] = (packet_format, Struct(projected_format), projected_keys, offset)
+    dash_keys = layouts[FastForzaDataPacket.DASH_LENGTH][2]
+    namespace = {'__slots__': (), 'layouts': layouts}
+    for name in FastForzaDataPacket.dash_keys:
+        namespace[name] = _field(name, dash_keys.index(name)) if name in selected else _missing_field(name)
+    packet_class = _projections[key] = type('ProjectedForzaDataPacket', (FastForzaDataPacket,), namespace)
+    return packet_class
+
+def read_header(data: bytes) -> tuple[int, int] | None:
+    '''Reads is_race_on and timestamp_ms without decoding the whole packet.
+    Returns: 
+        (is_race_on, timestamp_ms) tuple or None for unexpected packet lengths.'''
+    length = len(data)
+    if length not in FastForzaDataPacket.layouts:
+        return None
+    offset = FastForzaDataPacket.FH4_OFFSET if length == FastForzaDataPacket.FH4_LENGTH else 0
+    return ForzaDataReader.header_struct.unpack_from(data, offset)
+
+
+class ReaderStats:
+    '''Counters updated by ForzaDataReader while receiving packets.
+    Attributes:
+        received (int): datagrams read from the socket.
+        decoded (int): datagrams decoded into packets.
+        filtered (int): datagrams discarded by filter_rate without being decoded.
+        invalid (int): datagrams with an unexpected length.
+        kernel_drops (int): datagrams dropped by the kernel because the socket 
+            receive buffer was full (Linux only, SO_RXQ_OVFL).
+        overruns (int): datagrams truncated because they did not fit the receive buffer.
+    '''
+    __slots__ = ('received', 'decoded', 'filtered', 'invalid', 'kernel_drops', 'overruns')
+
+    def __init__(self) -> None:
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
     def to_dict(self) -> dict:
-        '''Converts the ForzaDataPacket object to dict.'''
-        return {prop_name: getattr(self, prop_name) for prop_name in self.attrirbutes_list}
+        '''Converts the ReaderStats object to dict.'''
+        return {name: getattr(self, name) for name in self.__slots__}
+
 
 class ForzaDataReader:
     '''Class to handle Forza data packets.
@@ -143,42 +333,267 @@ class ForzaDataReader:
         ip (str) default "0.0.0.0" : IP address to listen on.
         port (int) default 1024: Port to listen on.
         filter_rate (int) default 10: Number of packets to skip between each packet processed.
+            Ignored when decimator is given.
+        fast_decode (bool) default True: decode packets with FastForzaDataPacket 
+            instead of ForzaDataPacket.
+        batch_size (int) default 1: maximum number of datagrams drained from the 
+            socket on each wakeup. Values bigger than 1 enable the batched receive mode.
+        rcvbuf_size (int) default None: SO_RCVBUF size in bytes, operating system 
+            default when None.
+        capture_path (str) default None: append every received datagram, before 
+            filter_rate is applied, to this capture file (see capture.py).
+        driver_names (dict[str, str]) default None: source IP address -> driver name, 
+            for several rigs sending to the same port. Datagrams from other 
+            addresses use driver_name.
+        reuse_port (bool) default False: set SO_REUSEPORT so several processes 
+            can bind the same port, the kernel then spreads sources across them.
+        decimator (callable) default None: factory of the Decimator used for each 
+            driver (see decimation.py), EveryNth(filter_rate) when None.
+        aggregator (callable or list of callables) default None: factory, or factories,
+            of the aggregators used for each driver, objects with push(packet) and
+            flush() methods returning events, such as LapAggregator (see laps.py) or
+            SessionRecorder (see session_store.py). Every packet with is_race_on is 
+            then decoded and aggregated before decimation, and the events returned,
+            such as lap summaries, are emitted with the packets.
+        fields (list[str]) default None: decode only these channels (see projection()),
+            packets then carry only these keys. Requires fast_decode, and cannot be
+            combined with aggregator, which reads other channels: use
+            Producer(..., fields = ...) to send fewer keys instead.
     '''
+    BUFFER_SIZE = 1024
+    header_struct = Struct('<iI') # is_race_on, timestamp_ms
 
     def __init__(self, 
                  driver_name: str,
                  ip: str = "0.0.0.0", 
                  port: int = 1024,
-                 filter_rate: int = 8) -> None:
+                 filter_rate: int = 8,
+                 fast_decode: bool = True,
+                 batch_size: int = 1,
+                 rcvbuf_size: int | None = None,
+                 capture_path: str | None = None,
+                 driver_names: dict[str, str] | None = None,
+                 reuse_port: bool = False,
+                 decimator: Callable[[], Decimator] | None = None,
+                 aggregator: Callable | list[Callable] | None = None,
+                 fields: list[str] | None = None) -> None:
         '''Initializes the ForzaDataReader object.'''	
         self.driver_name = driver_name
+        self.driver_names = driver_names or {}
+        self.reuse_port = reuse_port
         self.ip = ip
         self.port = port
         self.filter_rate = filter_rate
+        self.packet_class = FastForzaDataPacket if fast_decode else ForzaDataPacket
+        if fields is not None:
+            if not fast_decode:
+                raise ValueError('fields requires fast_decode')
+            if aggregator:
+                raise ValueError('fields cannot be combined with aggregator, use Producer fields instead')
+            self.packet_class = projection(fields)
+        self.batch_size = max(1, batch_size)
+        self.rcvbuf_size = rcvbuf_size
+        self.capture_path = capture_path
+        self.capture = None
+        self.sock = None
+        self.stats = ReaderStats()
+        self.decimator_factory = decimator or (lambda: EveryNth(filter_rate))
+        self._decimators = {} # driver name -> Decimator
+        if aggregator is None:
+            aggregator = []
+        self.aggregator_factories = list(aggregator) if isinstance(aggregator, (list, tuple)) else [aggregator]
+        self._aggregators = {} # driver name -> list of aggregators
+        self._track_drops = False
         logger.debug(f'\tForzaDataReader object created with driver_name: {self.driver_name}')
 
     def start(self) -> None:
         '''Starts the ForzaDataReader.'''
         # Configurando a conexão com o servidor
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.rcvbuf_size:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf_size)
+            logger.debug(f'\tSO_RCVBUF set to {self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)} bytes')
+        if sys.platform.startswith('linux') and hasattr(self.sock, 'recvmsg_into'):
+            try:
+                self.sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+                self._track_drops = True
+            except OSError:
+                logger.warning('SO_RXQ_OVFL not supported, kernel drops will not be counted')
+        if self.reuse_port:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.sock.bind((self.ip, self.port))
+        self._buffers = [memoryview(bytearray(self.BUFFER_SIZE)) for _ in range(self.batch_size)]
+        if self.capture_path:
+            # imported here because capture imports this module
+            from capture import CaptureWriter
+            self.capture = CaptureWriter(self.capture_path)
         logger.debug(f'\tForzaDataReader started on {self.ip}:{self.port}')
-        
+
+    def stop(self) -> None:
+        '''Closes the socket and the capture file.'''
+        if self.sock is not None:
+            self.sock.close()
+        if self.capture is not None:
+            self.capture.close()
+
+    def _receive(self, buffer: memoryview, flags: int = 0) -> tuple[memoryview, tuple]:
+        '''Receives one datagram into buffer and returns a view of its bytes and 
+           the source address.'''
+        if self._track_drops:
+            nbytes, ancdata, msg_flags, addr = self.sock.recvmsg_into([buffer], _ANCDATA_SIZE, flags)
+            for level, kind, value in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL:
+                    self.stats.kernel_drops = int.from_bytes(value[:4], sys.byteorder)
+            if msg_flags & socket.MSG_TRUNC:
+                self.stats.overruns += 1
+        else:
+            nbytes, addr = self.sock.recvfrom_into(buffer, 0, flags)
+            if nbytes == self.BUFFER_SIZE:
+                self.stats.overruns += 1
+        return buffer[:nbytes], addr
+
+    def _receive_batch(self) -> list[tuple[memoryview, tuple]]:
+        '''Blocks until a datagram arrives, then drains up to batch_size datagrams
+           already queued on the socket without blocking.'''
+        batch = [self._receive(self._buffers[0])]
+        if self.batch_size == 1:
+            return batch
+        if not _MSG_DONTWAIT:
+            self.sock.setblocking(False)
+        try:
+            for buffer in self._buffers[1:]:
+                batch.append(self._receive(buffer, _MSG_DONTWAIT))
+        except (BlockingIOError, InterruptedError):
+            pass
+        finally:
+            if not _MSG_DONTWAIT:
+                self.sock.setblocking(True)
+        return batch
+
+    def _decimator(self, driver_name: str) -> Decimator:
+        decimator = self._decimators.get(driver_name)
+        if decimator is None:
+            decimator = self._decimators[driver_name] = self.decimator_factory()
+        return decimator
+
+    def _aggregate(self, packet) -> list:
+        aggregators = self._aggregators.get(packet.driver_name)
+        if aggregators is None:
+            aggregators = self._aggregators[packet.driver_name] = [factory() for factory in self.aggregator_factories]
+        if len(aggregators) == 1:
+            return aggregators[0].push(packet)
+        return [event for aggregator in aggregators for event in aggregator.push(packet)]
+
+    def handle(self, data: bytes, addr: tuple | None = None) -> list:
+        '''Decimates one datagram and decodes it when it is kept.
+        Only the packet header is read before the decimator admits the packet.
+        Decimation is applied separately to each driver. With an aggregator
+        every packet with is_race_on is decoded, and lap summaries come first
+        in the list.
+        Args:
+            data (bytes): datagram.
+            addr (tuple) default None: source address, used to find the driver name.
+        Returns: 
+            list of packets to emit, usually empty or with a single packet. When
+            an admitted packet has is_race_on off the list is [None].'''
+        stats = self.stats
+        stats.received += 1
+        if self.capture is not None:
+            self.capture.write(data)
+        header = read_header(data)
+        if header is None:
+            stats.invalid += 1
+            logger.warning('Ignoring packet with unexpected length: %d bytes', len(data))
+            return []
+        driver_name = self.driver_name
+        if self.driver_names and addr is not None:
+            driver_name = self.driver_names.get(addr[0], driver_name)
+        packet = None
+        summaries = []
+        if self.aggregator_factories and header[0] == 1:
+            stats.decoded += 1
+            packet = self.packet_class(data, driver_name = driver_name)
+            summaries = self._aggregate(packet)
+        decimator = self._decimator(driver_name)
+        if not decimator.admit(header[1]):
+            stats.filtered += 1
+            return summaries
+        if header[0] != 1:
+            logger.info('is_race_on is False')
+            return [None]
+        if packet is None:
+            stats.decoded += 1
+            packet = self.packet_class(data, driver_name = driver_name)
+        packets = decimator.push(packet)
+        if not packets:
+            stats.filtered += 1
+        return summaries + packets if summaries else packets
+
+    def flush(self) -> list:
+        '''Returns the packets still held back by the decimators and the events
+           still held by the aggregators, such as the summaries of the laps in progress.'''
+        packets = [packet for decimator in self._decimators.values() for packet in decimator.flush()]
+        return packets + [event for aggregators in self._aggregators.values() 
+                          for aggregator in aggregators for event in aggregator.flush()]
+
     def read(self) -> ForzaDataPacket:
         '''Generator to read, format and output Forza data packets.
         Yields: ForzaDataPacket object.'''
-        i = 0
         while True:
             # Aguardando por dados do jogo Forza
-            data, addr = self.sock.recvfrom(1024)
-            # Interpretando os dados recebidos usando a classe ForzaDataPacket
-            packet = ForzaDataPacket(data, driver_name = self.driver_name)
-            if i == self.filter_rate and packet.is_race_on == 1:
-                i = 0
-                logger.debug('ForzaDataReader.read() yield packet')
-                yield packet
-            elif i == self.filter_rate and packet.is_race_on == 0:
-                i = 0
-                logger.info('is_race_on is False')
-                yield None
-            i = i + 1
\ No newline at end of file
+            for data, addr in self._receive_batch():
+                for packet in self.handle(data, addr):
+                    if packet is not None:
+                        logger.debug('ForzaDataReader.read() yield packet')
+                    yield packet
+
+    async def serve(self, protocol: asyncio.DatagramProtocol) -> None:
+        '''Feeds received datagrams to protocol from the event loop, forever.'''
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(lambda: protocol, sock = self.sock)
+        try:
+            await loop.create_future()
+        finally:
+            transport.close()
+
+
+class ForzaDatagramProtocol(asyncio.DatagramProtocol):
+    '''asyncio protocol that handles datagrams with a ForzaDataReader and puts 
+       the kept packets, as dicts, into a bounded asyncio.Queue.
+       When the queue is full the oldest item is dropped, so the event loop 
+       never waits on slow consumers.
+    Args:
+        reader (ForzaDataReader): reader used to filter and decode datagrams.
+        queue (asyncio.Queue): queue receiving packet dicts, None to only call on_record.
+        on_record (callable) default None: also called with every packet dict, 
+            e.g. DashboardServer.update (see dashboard.py).
+    '''
+    def __init__(self,
+                 reader: ForzaDataReader,
+                 queue: asyncio.Queue | None,
+                 on_record: Callable[[dict], None] | None = None) -> None:
+        self.reader = reader
+        self.queue = queue
+        self.on_record = on_record
+        self.dropped = 0
+
+    def datagram_received(self, data: bytes, addr: tuple) -> None:
+        self.emit(self.reader.handle(data, addr))
+
+    def emit(self, packets: list) -> None:
+        '''Queues the dicts of packets and events, such as those returned by
+           ForzaDataReader.handle() or flush(), skipping None.'''
+        for packet in packets:
+            if packet is None:
+                continue
+            record = packet.to_dict()
+            if self.queue is not None:
+                if self.queue.full():
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                self.queue.put_nowait(record)
+            if self.on_record is not None:
+                self.on_record(record)
+
+    def error_received(self, exc: Exception) -> None:
+        logger.error('Error receiving datagram: %s', exc)
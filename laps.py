@@ -0,0 +1,264 @@
+'''Streaming lap and sector aggregation.
+
+LapAggregator receives every decoded packet of one driver and keeps running
+statistics (min, max, mean and P² quantile estimates) of a few channels for
+the current lap and the current sector, in O(1) time and memory per packet.
+When a lap ends it returns a LapSummary, a compact event sent through the
+Producer like any packet:
+
+    ForzaDataReader(..., aggregator = LapAggregator)
+    ForzaDataReader(..., aggregator = lambda: LapAggregator(sectors = 4),
+                    decimator = DropAll)   # lap summaries only
+
+A lap ends when lap_no changes or cur_lap_time goes back to zero. The game
+does not report sectors, so sectors are equal slices of the lap distance,
+measured on the previous complete lap or given with track_length. Sled
+packets carry no lap data and are ignored.
+'''
+import json
+import logging
+
+from logger import create_logger
+
+logger = create_logger(__name__, logging.DEBUG)
+
+DEFAULT_CHANNELS = ('speed', 'current_engine_rpm', 'accel', 'brake',
+                    'acceleration_x', 'acceleration_z',
+                    'tire_temp_FL', 'tire_temp_FR', 'tire_temp_RL', 'tire_temp_RR')
+DEFAULT_QUANTILES = (0.5, 0.9)
+
+_PARTIAL_LAP_TIME = 0.5 # laps first seen later than this are marked incomplete
+
+
+class P2Quantile:
+    '''Streaming quantile estimate with the P² algorithm (Jain and Chlamtac,
+       1985): five markers are adjusted on each value, no values are stored.
+    Args:
+        p (float): quantile, between 0 and 1.
+    '''
+    __slots__ = ('p', 'heights', 'positions', 'count')
+
+    def __init__(self, p: float) -> None:
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.count = 0
+
+    def add(self, x: float) -> None:
+        q = self.heights
+        if len(q) < 5:
+            q.append(x)
+            if len(q) == 5:
+                q.sort()
+            return
+        n = self.positions
+        if x < q[0]:
+            q[0] = x
+            n[1] += 1; n[2] += 1; n[3] += 1
+        elif x >= q[4]:
+            q[4] = x
+        elif x < q[2]:
+            n[2] += 1; n[3] += 1
+            if x < q[1]:
+                n[1] += 1
+        elif x < q[3]:
+            n[3] += 1
+        n[4] += 1
+        # desired marker positions are 1 + (count - 1) * (p / 2, p, (1 + p) / 2)
+        self.count += 1
+        steps = self.count + 4
+        p = self.p
+        for i, desired in ((1, 1 + steps * p / 2), (2, 1 + steps * p), (3, 1 + steps * (1 + p) / 2)):
+            delta = desired - n[i]
+            if (delta >= 1 and n[i + 1] - n[i] > 1) or (delta <= -1 and n[i - 1] - n[i] < -1):
+                s = 1 if delta > 0 else -1
+                height = q[i] + s / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < height < q[i + 1]:
+                    # parabolic prediction out of order, fall back to linear
+                    height = q[i] + s * (q[i + s] - q[i]) / (n[i + s] - n[i])
+                q[i] = height
+                n[i] += s
+
+    def value(self) -> float | None:
+        q = self.heights
+        if len(q) == 5:
+            return q[2]
+        if not q:
+            return None
+        ordered = sorted(q)
+        return ordered[round(self.p * (len(ordered) - 1))]
+
+
+class RunningStats:
+    '''Count, min, max, mean and quantile estimates of one channel.
+    Args:
+        quantiles (tuple[float]) default (): quantiles estimated with P2Quantile.
+    '''
+    __slots__ = ('count', 'total', 'min', 'max', 'quantiles')
+
+    def __init__(self, quantiles: tuple[float, ...] = ()) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.quantiles = [P2Quantile(p) for p in quantiles]
+
+    def add(self, value: float) -> None:
+        if self.count:
+            if value < self.min:
+                self.min = value
+            elif value > self.max:
+                self.max = value
+        else:
+            self.min = self.max = value
+        self.count += 1
+        self.total += value
+        for quantile in self.quantiles:
+            quantile.add(value)
+
+    def to_dict(self, digits: int = 3) -> dict:
+        '''Returns min, max, mean and one p<percent> key per quantile.'''
+        if not self.count:
+            return {}
+        record = {'min': round(self.min, digits),
+                  'max': round(self.max, digits),
+                  'mean': round(self.total / self.count, digits)}
+        for quantile in self.quantiles:
+            record[f'p{quantile.p * 100:g}'] = round(quantile.value(), digits)
+        return record
+
+
+class LapSummary:
+    '''Summary event of one lap, sent through the pipeline like a packet.
+    Attributes:
+        record (dict): the summary, see LapAggregator.
+        driver_name (str): driver of the lap.
+    '''
+    __slots__ = ('record', 'driver_name')
+
+    def __init__(self, record: dict) -> None:
+        self.record = record
+        self.driver_name = record['driver_name']
+
+    def to_json(self) -> str:
+        '''Converts the LapSummary object to JSON.'''
+        return json.dumps(self.record)
+
+    def to_dict(self) -> dict:
+        '''Converts the LapSummary object to dict.'''
+        return self.record
+
+
+class LapAggregator:
+    '''Aggregates the packets of one driver into lap summaries.
+       Each summary has the keys event_type ('lap_summary'), driver_name,
+       car_ordinal, lap_no, lap_time, complete (False for laps joined late or
+       cut short by flush()), samples, start_timestamp_ms, end_timestamp_ms,
+       distance, sectors (list of {'time': seconds, channel: stats}) and
+       stats ({channel: {'min', 'max', 'mean', 'p50', ...}}).
+    Args:
+        channels (tuple[str]) default DEFAULT_CHANNELS: channels summarized per lap.
+        sector_channels (tuple[str]) default ('speed',): channels summarized per sector.
+        sectors (int) default 3: sectors per lap, 0 disables sector splits.
+        quantiles (tuple[float]) default DEFAULT_QUANTILES: quantiles estimated for
+            each channel.
+        track_length (float) default None: lap distance in meters, used for the
+            sectors of the first lap, which otherwise has none.
+    '''
+    def __init__(self,
+                 channels: tuple[str, ...] = DEFAULT_CHANNELS,
+                 sector_channels: tuple[str, ...] = ('speed',),
+                 sectors: int = 3,
+                 quantiles: tuple[float, ...] = DEFAULT_QUANTILES,
+                 track_length: float | None = None) -> None:
+        self.channels = tuple(channels)
+        self.sector_channels = tuple(sector_channels)
+        self.sectors = sectors
+        self.quantiles = tuple(quantiles)
+        self.lap_length = track_length
+        self.lap_no = None
+        self.laps = 0
+
+    def _start_lap(self, packet) -> None:
+        self.lap_no = packet.lap_no
+        self.complete = packet.cur_lap_time <= _PARTIAL_LAP_TIME
+        self.samples = 0
+        self.start_timestamp_ms = packet.timestamp_ms
+        self.start_distance = packet.dist_traveled
+        self.stats = [RunningStats(self.quantiles) for _ in self.channels]
+        self.sector_results = []
+        self._start_sector(0, 0.0)
+
+    def _start_sector(self, sector: int, start_time: float) -> None:
+        self.sector = sector
+        self.sector_start_time = start_time
+        self.sector_stats = [RunningStats(self.quantiles) for _ in self.sector_channels]
+
+    def _close_sector(self, end_time: float) -> None:
+        result = {'time': round(end_time - self.sector_start_time, 3)}
+        for channel, stats in zip(self.sector_channels, self.sector_stats):
+            result[channel] = stats.to_dict()
+        self.sector_results.append(result)
+
+    def _summary(self, lap_time: float, complete: bool) -> LapSummary:
+        last = self.last
+        if self.lap_length and self.sectors:
+            self._close_sector(lap_time)
+        distance = last.dist_traveled - self.start_distance
+        if complete and distance > 0:
+            self.lap_length = distance
+        self.laps += 1
+        return LapSummary({
+            'event_type': 'lap_summary',
+            'driver_name': last.driver_name,
+            'car_ordinal': last.car_ordinal,
+            'lap_no': self.lap_no,
+            'lap_time': round(lap_time, 3),
+            'complete': complete,
+            'samples': self.samples,
+            'start_timestamp_ms': self.start_timestamp_ms,
+            'end_timestamp_ms': last.timestamp_ms,
+            'distance': round(distance, 1),
+            'sectors': self.sector_results,
+            'stats': {channel: stats.to_dict() for channel, stats in zip(self.channels, self.stats)},
+        })
+
+    def push(self, packet) -> list[LapSummary]:
+        '''Adds a packet and returns the summary of the lap it ended, if any.'''
+        if packet.packet_format == 'sled':
+            return []
+        lap_no = packet.lap_no
+        cur_lap_time = packet.cur_lap_time
+        summaries = []
+        if self.lap_no is None:
+            self._start_lap(packet)
+        elif lap_no != self.lap_no or cur_lap_time < self.last.cur_lap_time:
+            if lap_no == self.lap_no + 1:
+                lap_time = packet.last_lap_time or self.last.cur_lap_time
+                summaries.append(self._summary(lap_time, self.complete))
+            else:
+                # restarted race or rewind, the lap so far is discarded
+                logger.info('Lap %d of %s interrupted, now on lap %d', self.lap_no, packet.driver_name, lap_no)
+            self._start_lap(packet)
+        self.samples += 1
+        self.last = packet
+        for channel, stats in zip(self.channels, self.stats):
+            stats.add(getattr(packet, channel))
+        if self.lap_length and self.sectors:
+            sector = int((packet.dist_traveled - self.start_distance) * self.sectors / self.lap_length)
+            if self.sector < sector < self.sectors:
+                self._close_sector(cur_lap_time)
+                self._start_sector(sector, cur_lap_time)
+        for channel, stats in zip(self.sector_channels, self.sector_stats):
+            stats.add(getattr(packet, channel))
+        return summaries
+
+    def flush(self) -> list[LapSummary]:
+        '''Returns the summary of the lap in progress, marked incomplete.'''
+        if self.lap_no is None:
+            return []
+        summary = self._summary(self.last.cur_lap_time, False)
+        self.lap_no = None
+        return [summary]
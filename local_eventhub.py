@@ -0,0 +1,72 @@
+'''Local stand-in for the Azure Event Hubs producer client.
+
+LocalEventHubProducerClient implements the subset of
+azure.eventhub.aio.EventHubProducerClient used by Producer, so Producer can be
+benchmarked without network access to Azure:
+
+    producer = Producer(client_factory = LocalEventHubProducerClient)
+'''
+import asyncio
+import logging
+import random
+import time
+
+from azure.eventhub import EventDataBatch
+from azure.eventhub.exceptions import ConnectionLostError
+
+from logger import create_logger
+
+logger = create_logger(__name__, logging.DEBUG)
+
+# Event Hubs standard tier maximum batch size
+MAX_BATCH_SIZE = 1024 * 1024
+
+class LocalEventHubProducerClient:
+    '''Producer client that keeps sent batches in memory.
+    Args:
+        latency (float) default 0.02: seconds each send_batch() call takes.
+        failure_rate (float) default 0.0: probability of a send failing with
+            ConnectionLostError, which makes the client unusable until it is closed.
+        max_size_in_bytes (int) default 1 MB: batch size limit.
+        on_send (callable) default None: called with each batch after it is sent.
+    '''
+    connections = 0 # number of clients created, to check reconnects
+
+    def __init__(self,
+                 latency: float = 0.02,
+                 failure_rate: float = 0.0,
+                 max_size_in_bytes: int = MAX_BATCH_SIZE,
+                 on_send = None) -> None:
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.max_size_in_bytes = max_size_in_bytes
+        self.on_send = on_send
+        self.closed = False
+        self.batches_sent = 0
+        self.events_sent = 0
+        self.bytes_sent = 0
+        self.send_times = []
+        type(self).connections += 1
+        logger.debug('LocalEventHubProducerClient object created')
+
+    async def create_batch(self) -> EventDataBatch:
+        '''Creates an empty batch with the configured size limit.'''
+        return EventDataBatch(max_size_in_bytes = self.max_size_in_bytes)
+
+    async def send_batch(self, event_data_batch: EventDataBatch) -> None:
+        '''Waits latency seconds and records the batch as sent.'''
+        if self.closed:
+            raise ConnectionLostError('client is closed')
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            self.closed = True
+            raise ConnectionLostError('simulated connection loss')
+        self.batches_sent += 1
+        self.events_sent += len(event_data_batch)
+        self.bytes_sent += event_data_batch.size_in_bytes
+        self.send_times.append(time.perf_counter())
+        if self.on_send is not None:
+            self.on_send(event_data_batch)
+
+    async def close(self) -> None:
+        self.closed = True
@@ -1,15 +1,146 @@
+'''Logging setup shared by all modules.
+
+Records are handed to a QueueHandler and written to logs/<name>.log by a
+single background thread (QueueListener), so formatting and disk I/O never
+run on the receive path. Messages are formatted lazily: pass the arguments
+instead of an f-string, logger.debug('got %d messages', count), and nothing
+is formatted when the level is disabled. Each call site is rate limited, the
+count of suppressed messages is added to the next message that gets through.
+
+Environment variables:
+    FORZA_LOG_LEVEL: level of every logger (DEBUG, INFO, ...), overrides the
+        level given to create_logger().
+    FORZA_LOG_LEVEL_<NAME>: level of one logger, e.g. FORZA_LOG_LEVEL_PRODUCER.
+    FORZA_LOG_DIR default 'logs': directory of the log files, created on the
+        first record written.
+    FORZA_LOG_RATE default 20: messages per second allowed per call site,
+        0 disables rate limiting.
+    FORZA_LOG_QUEUE default 1: 0 writes records synchronously from the
+        calling thread, as before.
+'''
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import multiprocessing.util
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(module)s - %(message)s')
+_files = {} # logger name -> log file name
+_listener = None
+_listener_pid = None
+_queue = None
+
+
+class RateLimitFilter(logging.Filter):
+    '''Token bucket per call site (logger and line number).
+    Args:
+        rate (float): messages per second allowed per call site.
+        burst (int) default None: messages allowed at once, rate when None.
+    '''
+    def __init__(self, rate: float, burst: int | None = None) -> None:
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.sites = {} # (logger name, line number) -> [tokens, last time, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.lineno)
+        now = record.created
+        site = self.sites.get(key)
+        if site is None:
+            site = self.sites[key] = [self.burst, now, 0]
+        tokens = min(self.burst, site[0] + (now - site[1]) * self.rate)
+        site[1] = now
+        if tokens < 1:
+            site[0] = tokens
+            site[2] += 1
+            return False
+        site[0] = tokens - 1
+        if site[2]:
+            record.msg = f'{record.msg} ({site[2]} similar messages suppressed)'
+            site[2] = 0
+        return True
+
+
+class _FileRouter(logging.Handler):
+    '''Writes each record to the rotating log file of its logger, opening the
+       file (and creating the log directory) on the first record.'''
+    def __init__(self, log_dir: str) -> None:
+        super().__init__()
+        self.log_dir = log_dir
+        self.handlers = {}
+
+    def _handler(self, name: str) -> logging.Handler:
+        handler = self.handlers.get(name)
+        if handler is None:
+            os.makedirs(self.log_dir, exist_ok = True)
+            handler = RotatingFileHandler(os.path.join(self.log_dir, f'{_files.get(name, name)}.log'),
+                                          maxBytes=1024*1024,
+                                          backupCount=5)
+            handler.setFormatter(_formatter)
+            self.handlers[name] = handler
+        return handler
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self._handler(record.name).handle(record)
+
+    def close(self) -> None:
+        for handler in self.handlers.values():
+            handler.close()
+        super().close()
+
+
+class _BackgroundHandler(QueueHandler):
+    '''QueueHandler that leaves formatting to the listener thread and starts
+       a listener in forked worker processes.'''
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if _listener_pid != os.getpid():
+            _start_listener()
+        _queue.put_nowait(record)
+
+
+def _start_listener() -> None:
+    global _listener, _listener_pid, _queue
+    _queue = queue.SimpleQueue()
+    _listener = QueueListener(_queue, _FileRouter(os.environ.get('FORZA_LOG_DIR', 'logs')))
+    _listener.start()
+    _listener_pid = os.getpid()
+    # multiprocessing workers exit without running atexit handlers
+    multiprocessing.util.Finalize(None, stop_logging, exitpriority = 0)
+
+
+def stop_logging() -> None:
+    '''Writes the records still queued and stops the background writer.'''
+    global _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener_pid = None
+
+atexit.register(stop_logging)
+
 
-def create_logger(name: str, 
+def create_logger(name: str,
                   log_level: int) -> logging.Logger:
     '''Creates a logger with the name provided and returns it'''
     logger = logging.getLogger(name.replace('_',''))
-    logger.setLevel(log_level)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(module)s - %(message)s')
-    handler = RotatingFileHandler(f'logs/{name}.log', 
-                                                   maxBytes=1024*1024, 
-                                                   backupCount=5)
-    handler.setFormatter(formatter)
+    _files[logger.name] = name
+    level = (os.environ.get(f'FORZA_LOG_LEVEL_{name.upper()}') or
+             os.environ.get('FORZA_LOG_LEVEL') or log_level)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    if logger.handlers:
+        return logger
+    rate = float(os.environ.get('FORZA_LOG_RATE', 20))
+    if rate > 0:
+        logger.addFilter(RateLimitFilter(rate))
+    if os.environ.get('FORZA_LOG_QUEUE', '1') == '0':
+        handler = _FileRouter(os.environ.get('FORZA_LOG_DIR', 'logs'))
+    else:
+        handler = _BackgroundHandler(None)
     logger.addHandler(handler)
-    return logger
\ No newline at end of file
+    return logger
@@ -3,16 +3,25 @@ import logging
 import os
 import random
 import sys
+import time
+from functools import partial
 
-from forza_package import ForzaDataReader
+from forza_package import ForzaDataReader, ForzaDatagramProtocol
+import metrics
+from dashboard import DashboardServer
+from delta import DeltaTracker
+from laps import LapAggregator
 from logger import create_logger
 from producer import Producer
+from session_store import SessionRecorder
+from sinks import FileSink, StdoutSink, UdpSink
+from spool import SpillBuffer
 
 # define constants
 IP_ADDRESS = '0.0.0.0'
 PORT = 6667
-CONN_STRING = os.environ['EVENTHUBS_CONNECTION_STRING']
-EVENTHUB_NAME = os.environ['EVENTHUBS_NAME']
+CONN_STRING = os.environ.get('EVENTHUBS_CONNECTION_STRING')
+EVENTHUB_NAME = os.environ.get('EVENTHUBS_NAME')
 
 logger = create_logger(__name__, logging.DEBUG)
 
@@ -22,16 +31,65 @@ class AsyncForzaIO:
             1. read_data() - reads data from Forza Horizon 4 UDP stream
             2. write_data() - sends data to Azure EventHub
         Boths tasks are repeting continuoesly until the program is terminated.
-        Income UDP messages are read one by one and put in a queue.
-        The queue is then emptied and all messages are sent to EventHub.
+        By default datagrams are received by an asyncio DatagramProtocol on the 
+        event loop and put in a bounded asyncio.Queue. The writer wakes up as soon
+        as batch_size messages are queued or max_linger seconds after the first 
+        message of the batch arrived, whichever comes first.
+        With native_udp = False the blocking ForzaDataReader.read() generator runs
+        in a thread and the writer polls a queue.Queue every 0.5 seconds.
         The run() method is used to start both tasks and is the only one you should call direct.
+    Args:
+        reader (ForzaDataReader): reader used to receive and decode packets
+        producer (Producer): producer used to send events, may be None when sinks are given
+        native_udp (bool) default True: use the asyncio DatagramProtocol reader
+        batch_size (int) default 100: target number of messages per send
+        max_linger (float) default 0.1: maximum seconds a message waits for a batch to fill
+        queue_size (int) default 10000: maximum queued messages, the oldest are dropped when full
+        spill_dir (str) default None: when given, messages beyond queue_size and batches
+            the producer failed to send are kept in a disk journal in this directory 
+            instead of being dropped (see spool.py)
+        stats_interval (float) default 30: seconds between buffer statistics log lines
+        metrics_port (int) default None: when given, reader, queue and producer metrics
+            and the event loop lag are served on http://127.0.0.1:<metrics_port>/metrics
+            (see metrics.py)
+        dashboard_port (int) default None: when given, the latest record of each driver
+            is served to browsers on http://<host>:<dashboard_port>/ (see dashboard.py),
+            native_udp only
+        sinks (list[Sink]) default None: further destinations of every record, each
+            with its own queue, batching and drop policy (see sinks.py), native_udp only
     '''
     def __init__(self,
                  reader: ForzaDataReader,
-                 producer: Producer) -> None:
+                 producer: Producer,
+                 native_udp: bool = True,
+                 batch_size: int = 100,
+                 max_linger: float = 0.1,
+                 queue_size: int = 10000,
+                 spill_dir: str | None = None,
+                 stats_interval: float = 30,
+                 metrics_port: int | None = None,
+                 dashboard_port: int | None = None,
+                 sinks: list | None = None) -> None:
+        if producer is None and not sinks:
+            raise ValueError('AsyncForzaIO needs a producer or sinks')
         self.reader = reader
         self.producer = producer
-        self.queue = queue.Queue()
+        self.sinks = list(sinks or [])
+        self.native_udp = native_udp
+        self.batch_size = batch_size
+        self.max_linger = max_linger
+        self.stats_interval = stats_interval
+        self.metrics_port = metrics_port
+        self.dashboard = DashboardServer(port = dashboard_port) if dashboard_port is not None else None
+        if native_udp and spill_dir:
+            self.queue = SpillBuffer(max_items = queue_size, journal_dir = spill_dir)
+            if getattr(producer, 'on_error', None) is None and hasattr(producer, 'on_error'):
+                producer.on_error = self.queue.requeue
+        elif native_udp:
+            self.queue = asyncio.Queue(maxsize = queue_size)
+        else:
+            self.queue = queue.Queue()
+        metrics.REGISTRY.register(f'io:{reader.port}', self._collect_metrics)
         logger.debug('\tAsyncForzaIO object created')
         self._post_init()
     
@@ -45,6 +103,23 @@ class AsyncForzaIO:
     
     async def _read_data_async(self) -> None:
         return await asyncio.to_thread(self._read_data)
+
+    def _publish(self, record: dict) -> None:
+        '''Hands a record to the dashboard and to every sink.'''
+        if self.dashboard is not None:
+            self.dashboard.update(record)
+        now = time.monotonic()
+        for sink in self.sinks:
+            sink.put(record, now)
+
+    def _protocol(self) -> ForzaDatagramProtocol:
+        return ForzaDatagramProtocol(self.reader, self.queue if self.producer is not None else None,
+                                     self._publish if self.dashboard is not None or self.sinks else None)
+
+    async def _read_data_native(self) -> None:
+        logger.debug('\tStarting native UDP reader')
+        self.protocol = self._protocol()
+        await self.reader.serve(self.protocol)
     
     def _get_all_messages(self) -> list[str]:
         logger.debug('\tGetting messages from queue')
@@ -54,27 +129,191 @@ class AsyncForzaIO:
                 items.append(self.queue.get_nowait())
             except queue.Empty:
                 break
-        logger.debug(f'\tGot {len(items)} messages from queue')
+        logger.debug('\tGot %d messages from queue', len(items))
+        return items
+
+    def _drain(self) -> list:
+        '''Removes and returns every message of the queue.'''
+        items = []
+        while not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        return items
+
+    async def _get_batch(self) -> list[dict]:
+        '''Waits for the first message, then for batch_size messages or
+           max_linger seconds, whichever comes first.'''
+        loop = asyncio.get_running_loop()
+        items = [await self.queue.get()]
+        deadline = loop.time() + self.max_linger
+        while len(items) < self.batch_size:
+            if not self.queue.empty():
+                items.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
         return items
     
+    async def _send(self, items: list) -> None:
+        '''Sends items with the producer. A failed send never ends the writer
+           loop: with a spill journal the items are put back in front of the
+           buffer and sent again after retry_delay seconds, otherwise they are
+           dropped.'''
+        spill = isinstance(self.queue, SpillBuffer)
+        requeued = self.queue.requeued if spill else 0
+        try:
+            await self.producer.send_events(items)
+        except Exception as e:
+            if spill and not isinstance(e, (TypeError, ValueError)):
+                logger.error('\tFailed to send %d messages, buffering them: %s', len(items), e)
+                self.queue.requeue(items)
+            else:
+                # encoding errors would fail again
+                logger.error('\tFailed to send %d messages, dropping them: %s', len(items), e)
+        if spill and self.queue.requeued != requeued:
+            # the producer or the handler above handed events back, they are
+            # first in the buffer again: wait instead of retrying at once
+            await asyncio.sleep(getattr(self.producer, 'retry_delay', 1.0))
+
     async def _write_data(self) -> None:
         logger.debug('\tStarting write_data() loop')
         while True:
             items = self._get_all_messages()
             if items:
-                logger.debug(f'\tSending {len(items)} messages to EventHub')
-                await self.producer.send_events(items)
+                logger.debug('\tSending %d messages to EventHub', len(items))
+                await self._send(items)
                 logger.debug('\tMessages sent')
             else:
                 logger.debug('\tNo messages to send, sleeping for 0.5 seconds')
                 await asyncio.sleep(0.5)
 
+    async def _write_data_native(self) -> None:
+        logger.debug('\tStarting write_data() loop')
+        while True:
+            items = await self._get_batch()
+            logger.debug('\tSending %d messages to EventHub', len(items))
+            await self._send(items)
+
+    async def _report_stats(self) -> None:
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            logger.info('\treader: %s', self.reader.stats.to_dict())
+            if isinstance(self.queue, SpillBuffer):
+                logger.info('\tbuffer: %s', self.queue.stats())
+            for sink in self.sinks:
+                logger.info('\t%s sink: %s', sink.name, sink.stats())
+
+    def _collect_metrics(self) -> list:
+        '''Reads the reader and queue counters when the metrics are scraped.'''
+        port = str(self.reader.port)
+        families = [('forza_reader_datagrams_total', 'counter',
+                     'Datagrams received, decoded, filtered, invalid, dropped by the kernel or truncated',
+                     [({'port': port, 'stat': name}, value) for name, value in self.reader.stats.to_dict().items()]),
+                    ('forza_queue_depth', 'gauge', 'Messages waiting to be sent',
+                     [({'port': port}, self.queue.qsize())])]
+        protocol = getattr(self, 'protocol', None)
+        if protocol is not None:
+            families.append(('forza_queue_dropped_total', 'counter', 'Messages dropped because the queue was full',
+                             [({'port': port}, protocol.dropped)]))
+        if isinstance(self.queue, SpillBuffer):
+            stats = self.queue.stats()
+            families.append(('forza_journal_bytes', 'gauge', 'Bytes waiting in the disk journal',
+                             [({'port': port}, stats['journal_bytes'])]))
+            families.append(('forza_buffer_age_seconds', 'gauge', 'Age of the oldest buffered message',
+                             [({'port': port}, stats['age'])]))
+        return families
+
+    async def _shutdown(self) -> None:
+        '''Keeps what is still buffered when run() ends. The packets held by
+           the decimators and the events held by the aggregators, such as the
+           summary of the lap in progress, are emitted and the sinks write
+           what they still hold and close. Then the events in
+           memory are written to the spill journal, to be sent on the next
+           run, or without one sent a last time.'''
+        protocol = getattr(self, 'protocol', None) or self._protocol()
+        protocol.emit(self.reader.flush())
+        for sink in self.sinks:
+            try:
+                await sink.close()
+            except Exception as e:
+                logger.error('\tFailed to close %s sink: %s', sink.name, e)
+        if isinstance(self.queue, SpillBuffer):
+            self.queue.close()
+            logger.info('\tbuffer closed: %s', self.queue.stats())
+        elif self.producer is not None:
+            items = self._drain()
+            if items:
+                logger.info('\tSending the last %d messages', len(items))
+                await self._send(items)
+            if hasattr(self.producer, 'flush'):
+                await self.producer.flush()
+
     async def run(self) -> None:
-        await asyncio.gather(self._read_data_async(), self._write_data())
         logger.debug('\tAsyncForzaIO.run() involked')
+        tasks = []
+        if self.metrics_port is not None:
+            tasks = [metrics.serve(port = self.metrics_port), metrics.monitor_loop_lag()]
+        if self.dashboard is not None:
+            tasks.append(self.dashboard.serve())
+        try:
+            if self.native_udp:
+                tasks.extend(sink.run() for sink in self.sinks)
+                if self.producer is not None:
+                    tasks.append(self._write_data_native())
+                await asyncio.gather(self._read_data_native(), self._report_stats(), *tasks)
+            else:
+                await asyncio.gather(self._read_data_async(), self._write_data(), *tasks)
+        finally:
+            await self._shutdown()
+
+async def run_multirig(config_path: str) -> None:
+    '''Runs the multi-rig mode described by the configuration file.'''
+    # imported here because multirig imports this module
+    from multirig import MultiRigIngest, load_config
+    producer = Producer(connection_string = CONN_STRING, 
+                        eventhub_name = EVENTHUB_NAME)
+    ingest = MultiRigIngest(load_config(config_path), producer)
+    ingest.start()
+    try:
+        await ingest.run()
+    finally:
+        ingest.stop()
+        await producer.close()
+
+async def run_shared_memory(driver_name: str,
+                            workers: int,
+                            reader_options: dict | None = None,
+                            metrics_port: int | None = None) -> None:
+    '''Receives in a process of its own feeding worker processes through shared memory.
+       reader_options, such as aggregator, are given to the ForzaDataReader of
+       every worker, metrics are served by this process.'''
+    # imported here because ring imports this module
+    from ring import SharedMemoryIngest
+    producer = Producer(connection_string = CONN_STRING, 
+                        eventhub_name = EVENTHUB_NAME)
+    ingest = SharedMemoryIngest({'port': PORT, 'ip': IP_ADDRESS, 'driver_name': driver_name, 'workers': workers},
+                                producer, reader_options = reader_options)
+    tasks = []
+    if metrics_port is not None:
+        tasks = [metrics.serve(port = metrics_port), metrics.monitor_loop_lag()]
+    ingest.start()
+    try:
+        await asyncio.gather(ingest.run(), *tasks)
+    finally:
+        ingest.stop()
+        await producer.close()
 
 if __name__ == '__main__':
     logger.debug('Starting main function')
+    if '/config' in sys.argv:
+        config_path = sys.argv[sys.argv.index('/config') + 1]
+        logger.debug(f'/config argument found, starting multi-rig mode with: {config_path}')
+        asyncio.run(run_multirig(config_path))
+        sys.exit()
     if '/name' in sys.argv:
         driver_name = sys.argv[sys.argv.index('/name') + 1]
         logger.debug(f'/name argument found, setting driver name to: {driver_name}')
@@ -85,13 +324,69 @@ if __name__ == '__main__':
         driver_name = f'driver{random.randint(1000, 9999)}'
         logger.debug(f'No driver name provided, setting driver name to: {driver_name}')
     
+    aggregator = []
+    if '/laps' in sys.argv:
+        logger.debug('/laps argument found, sending lap summaries')
+        aggregator.append(LapAggregator)
+    if '/delta' in sys.argv:
+        logger.debug('/delta argument found, adding delta_best to the records')
+        aggregator.append(DeltaTracker)
+    if '/store' in sys.argv:
+        store_root = sys.argv[sys.argv.index('/store') + 1]
+        logger.debug(f'/store argument found, recording sessions to: {store_root}')
+        # a partial, unlike a lambda, pickles for the /workers processes
+        aggregator.append(partial(SessionRecorder, store_root))
+    
+    metrics_port = None
+    if '/metrics' in sys.argv:
+        metrics_port = int(sys.argv[sys.argv.index('/metrics') + 1])
+        logger.debug(f'/metrics argument found, serving metrics on port: {metrics_port}')
+    
+    if '/workers' in sys.argv:
+        workers = int(sys.argv[sys.argv.index('/workers') + 1])
+        logger.debug(f'/workers argument found, decoding in {workers} worker processes fed through shared memory')
+        unsupported = [flag for flag in ('/dashboard', '/spill', '/file', '/forward', '/stdout') if flag in sys.argv]
+        if unsupported:
+            # each worker would open the same port, journal or file
+            sys.exit(f'{", ".join(unsupported)} cannot be combined with /workers')
+        asyncio.run(run_shared_memory(driver_name, workers, {'aggregator': aggregator}, metrics_port))
+        sys.exit()
+    
     reader = ForzaDataReader(ip = IP_ADDRESS, 
                              port = PORT, 
                              driver_name = driver_name,
-                             filter_rate = 2)
+                             filter_rate = 2,
+                             batch_size = 32,
+                             rcvbuf_size = 1024*1024,
+                             aggregator = aggregator)
     producer = Producer(connection_string = CONN_STRING, 
                         eventhub_name = EVENTHUB_NAME)
     
-    forza_io = AsyncForzaIO(reader = reader, producer = producer)
+    dashboard_port = None
+    if '/dashboard' in sys.argv:
+        dashboard_port = int(sys.argv[sys.argv.index('/dashboard') + 1])
+        logger.debug(f'/dashboard argument found, serving dashboard on port: {dashboard_port}')
+    
+    spill_dir = None
+    if '/spill' in sys.argv:
+        spill_dir = sys.argv[sys.argv.index('/spill') + 1]
+        logger.debug(f'/spill argument found, buffering unsent events in: {spill_dir}')
+    
+    sinks = []
+    if '/file' in sys.argv:
+        file_path = sys.argv[sys.argv.index('/file') + 1]
+        logger.debug(f'/file argument found, also writing records to: {file_path}')
+        sinks.append(FileSink(file_path))
+    if '/forward' in sys.argv:
+        host, forward_port = sys.argv[sys.argv.index('/forward') + 1].rsplit(':', 1)
+        logger.debug(f'/forward argument found, re-broadcasting packets to: {host}:{forward_port}')
+        sinks.append(UdpSink(host, int(forward_port), format = 'forza'))
+    if '/stdout' in sys.argv:
+        logger.debug('/stdout argument found, printing records')
+        sinks.append(StdoutSink())
+    
+    forza_io = AsyncForzaIO(reader = reader, producer = producer, 
+                            spill_dir = spill_dir, metrics_port = metrics_port,
+                            dashboard_port = dashboard_port, sinks = sinks)
 
     asyncio.run(forza_io.run())
\ No newline at end of file
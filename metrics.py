@@ -0,0 +1,198 @@
+'''Pipeline metrics and a local Prometheus style HTTP endpoint.
+
+Counters and histograms are plain Python objects updated in place, cheap
+enough for the hot path; values that already exist elsewhere, such as
+ForzaDataReader.stats or the queue depth, are read by collector functions
+only when the endpoint is scraped. Everything is kept in REGISTRY:
+
+    SENT = metrics.REGISTRY.counter('forza_events_sent_total', 'Events sent')
+    SENT.inc(len(events))
+
+serve() exposes REGISTRY in the Prometheus text format on /metrics and
+monitor_loop_lag() measures how late the event loop wakes up.
+'''
+import asyncio
+import logging
+from bisect import bisect_left
+from typing import Callable
+
+from logger import create_logger
+
+logger = create_logger(__name__, logging.DEBUG)
+
+# seconds, from 100 us to 5 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+class Counter:
+    '''Monotonic counter.'''
+    __slots__ = ('name', 'help', 'value')
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        return [(self.name, {}, self.value)]
+
+
+class Gauge:
+    '''Value that goes up and down, set directly or read from function on scrape.'''
+    __slots__ = ('name', 'help', 'value', 'function')
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, function: Callable[[], float] | None = None) -> None:
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.function = function
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        return [(self.name, {}, self.function() if self.function else self.value)]
+
+
+class Histogram:
+    '''Distribution of observed values in fixed buckets.
+    Args:
+        buckets (tuple[float]): upper bounds of the buckets, +Inf is added.
+    '''
+    __slots__ = ('name', 'help', 'buckets', 'counts', 'sum', 'count')
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            samples.append((f'{self.name}_bucket', {'le': bound}, cumulative))
+        samples.append((f'{self.name}_sum', {}, self.sum))
+        samples.append((f'{self.name}_count', {}, self.count))
+        return samples
+
+
+class Registry:
+    '''Named metrics and collector functions rendered together.
+       A collector returns a list of (name, kind, help, samples) tuples, with
+       samples as (labels, value) pairs, and is called on every scrape.'''
+    def __init__(self) -> None:
+        self.metrics = {}
+        self.collectors = {}
+
+    def _get(self, cls, name: str, help: str, *args):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, *args)
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str, function: Callable[[], float] | None = None) -> Gauge:
+        gauge = self._get(Gauge, name, help)
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets)
+
+    def register(self, key: str, collector: Callable[[], list]) -> None:
+        '''Adds a collector, replacing the one registered with the same key.'''
+        self.collectors[key] = collector
+
+    def render(self) -> str:
+        '''Returns every metric in the Prometheus text exposition format.
+           Samples of the same family from several collectors, such as one
+           per sink or per port, are written under a single HELP and TYPE.'''
+        families = {} # name -> (kind, help, samples)
+        for metric in self.metrics.values():
+            families[metric.name] = (metric.kind, metric.help, metric.samples())
+        for key, collector in list(self.collectors.items()):
+            try:
+                for name, kind, help, samples in collector():
+                    family = families.setdefault(name, (kind, help, []))
+                    family[2].extend((name, labels, value) for labels, value in samples)
+            except Exception as e:
+                logger.error(f'Metrics collector {key} failed: {e}')
+        lines = []
+        for family, (kind, help, samples) in families.items():
+            lines.append(f'# HELP {family} {help}')
+            lines.append(f'# TYPE {family} {kind}')
+            for name, labels, value in samples:
+                lines.append(f'{name}{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+LOOP_LAG = REGISTRY.histogram('forza_event_loop_lag_seconds',
+                              'Delay of event loop wakeups past their due time')
+
+
+async def monitor_loop_lag(interval: float = 0.25) -> None:
+    '''Sleeps interval seconds in a loop and records how late each wakeup is.'''
+    loop = asyncio.get_running_loop()
+    while True:
+        due = loop.time() + interval
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - due))
+
+
+async def serve(host: str = '127.0.0.1',
+                port: int = 9108,
+                registry: Registry = REGISTRY) -> None:
+    '''Serves registry on http://host:port/metrics, forever.'''
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass # headers
+            parts = request.split()
+            if len(parts) > 1 and parts[1].split(b'?')[0] == b'/metrics':
+                status, body = '200 OK', registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(f'HTTP/1.1 {status}\r\n'
+                         f'Content-Type: text/plain; version=0.0.4\r\n'
+                         f'Content-Length: {len(body)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f'Metrics served on http://{host}:{port}/metrics')
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,177 @@
+'''Multi-rig ingestion spread across worker processes.
+
+Every rig in the configuration gets one or more worker processes. Each worker
+runs its own ForzaDataReader -> AsyncForzaIO pipeline, so receiving,
+filtering, decoding and JSON serialization scale with the number of cores,
+and forwards its batches to the parent process, which owns the single
+Producer shared by all rigs.
+
+Configuration (JSON):
+
+    {
+        "filter_rate": 2,
+        "rigs": [
+            {"port": 6667, "driver_name": "alice"},
+            {"port": 6668, "driver_name": "guest", "workers": 2,
+             "drivers": {"192.168.0.20": "bob", "192.168.0.21": "carol"}}
+        ]
+    }
+
+"drivers" maps source IP addresses to driver names for rigs sharing a port,
+datagrams from other addresses use "driver_name". With "workers" above 1 the
+workers bind the same port with SO_REUSEPORT (Linux) and the kernel spreads
+the sources across them.
+'''
+import asyncio
+import json
+import logging
+import multiprocessing
+import queue
+
+from forza_package import ForzaDataReader
+from logger import create_logger
+from main import AsyncForzaIO
+from producer import Producer
+
+logger = create_logger(__name__, logging.DEBUG)
+
+
+def load_config(path: str) -> dict:
+    '''Reads and validates a multi-rig configuration file.'''
+    with open(path) as config_file:
+        config = json.load(config_file)
+    rigs = config.get('rigs')
+    if not rigs:
+        raise ValueError(f'{path} has no rigs')
+    for rig in rigs:
+        if 'port' not in rig:
+            raise ValueError(f'rig without port in {path}: {rig}')
+        rig.setdefault('driver_name', f'rig{rig["port"]}')
+    return config
+
+
+class QueueProducer:
+    '''Stand-in for Producer used by worker processes: forwards each batch of
+       events to the parent process through a multiprocessing queue.
+    Args:
+        queue (multiprocessing.Queue): queue read by MultiRigIngest.
+        serialize (bool) default True: send events as JSON strings, so the
+            worker pays for serialization instead of the parent.
+        fields (set[str]) default None: fields of the parent Producer, packet
+            dicts are projected before serialization since the parent cannot
+            project JSON strings.
+    '''
+    # same projection as the parent Producer
+    project = Producer.project
+
+    def __init__(self,
+                 queue: multiprocessing.Queue,
+                 serialize: bool = True,
+                 fields: set[str] | None = None) -> None:
+        self.queue = queue
+        self.serialize = serialize
+        self.fields = fields
+
+    async def send_events(self, events_list: list[dict]) -> None:
+        if self.fields is not None:
+            events_list = [self.project(event) for event in events_list]
+        if self.serialize:
+            events_list = [json.dumps(event) for event in events_list]
+        self.queue.put(events_list)
+
+
+def rig_worker(rig: dict,
+               output: multiprocessing.Queue,
+               reader_options: dict,
+               io_options: dict,
+               serialize: bool,
+               fields: set[str] | None = None) -> None:
+    '''Runs the reading side of the pipeline for one rig, forever.'''
+    reader = ForzaDataReader(driver_name = rig['driver_name'],
+                             ip = rig.get('ip', '0.0.0.0'),
+                             port = rig['port'],
+                             driver_names = rig.get('drivers'),
+                             reuse_port = rig.get('workers', 1) > 1,
+                             **reader_options)
+    forza_io = AsyncForzaIO(reader = reader,
+                            producer = QueueProducer(output, serialize, fields),
+                            **io_options)
+    asyncio.run(forza_io.run())
+
+
+class MultiRigIngest:
+    '''Runs one worker process per rig (or several with SO_REUSEPORT) and sends
+       the events of all of them with one shared Producer.
+    Args:
+        config (dict): configuration, see load_config().
+        producer (Producer): producer shared by all rigs.
+        reader_options (dict) default None: extra ForzaDataReader arguments.
+        io_options (dict) default None: extra AsyncForzaIO arguments.
+    '''
+    def __init__(self,
+                 config: dict,
+                 producer: Producer,
+                 reader_options: dict | None = None,
+                 io_options: dict | None = None) -> None:
+        self.config = config
+        self.producer = producer
+        self.reader_options = {'filter_rate': config.get('filter_rate', 2),
+                               'batch_size': 32,
+                               'rcvbuf_size': 1024 * 1024,
+                               **(reader_options or {})}
+        self.io_options = io_options or {}
+        self.queue = multiprocessing.Queue()
+        self.processes = []
+        self.batches = 0
+        self.events = 0
+        self.failed = 0 # events of the sends that raised
+
+    def start(self) -> None:
+        '''Starts the worker processes.'''
+        serialize = getattr(self.producer, 'encoding', 'json') == 'json'
+        for rig in self.config['rigs']:
+            for _ in range(rig.get('workers', 1)):
+                process = multiprocessing.Process(target = rig_worker,
+                                                  args = (rig, self.queue, self.reader_options,
+                                                          self.io_options, serialize,
+                                                          getattr(self.producer, 'fields', None)),
+                                                  daemon = True)
+                process.start()
+                self.processes.append(process)
+        logger.debug(f'{len(self.processes)} worker processes started for {len(self.config["rigs"])} rigs')
+
+    def stop(self) -> None:
+        '''Terminates the worker processes.'''
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+
+    def _get(self) -> list:
+        '''Waits up to a second for a batch, then drains the batches already queued.'''
+        try:
+            events = self.queue.get(timeout = 1)
+        except queue.Empty:
+            return []
+        self.batches += 1
+        while True:
+            try:
+                events.extend(self.queue.get_nowait())
+                self.batches += 1
+            except queue.Empty:
+                return events
+
+    async def run(self) -> None:
+        '''Sends the batches forwarded by the workers, forever.'''
+        while True:
+            events = await asyncio.to_thread(self._get)
+            if not events:
+                continue
+            self.events += len(events)
+            try:
+                await self.producer.send_events(events)
+            except Exception as e:
+                # a failed send must not stop the ingest of every rig
+                self.failed += len(events)
+                logger.error('Failed to send %d events, dropping them: %s', len(events), e)
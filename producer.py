@@ -1,70 +1,258 @@
+import asyncio
 import json
 import logging
+import time
+from typing import Callable
 
 from azure.eventhub.aio import EventHubProducerClient
-from azure.eventhub import EventData
+from azure.eventhub import EventData, EventDataBatch
 
+import codec
+import metrics
 from logger import create_logger
 
 logger = create_logger(__name__, logging.DEBUG)
 
+BATCH_EVENTS = metrics.REGISTRY.histogram('forza_producer_batch_events',
+                                          'Events per EventDataBatch', metrics.SIZE_BUCKETS)
+BATCH_BYTES = metrics.REGISTRY.histogram('forza_producer_batch_bytes',
+                                         'Size of each EventDataBatch in bytes', metrics.BYTES_BUCKETS)
+SEND_SECONDS = metrics.REGISTRY.histogram('forza_producer_send_seconds',
+                                          'Duration of successful send_batch calls')
+EVENTS_SENT = metrics.REGISTRY.counter('forza_producer_events_sent_total',
+                                       'Events sent to Azure Event Hub')
+SEND_ERRORS = metrics.REGISTRY.counter('forza_producer_send_errors_total',
+                                       'Failed send_batch attempts')
+EVENTS_FAILED = metrics.REGISTRY.counter('forza_producer_events_failed_total',
+                                         'Events of batches given up after max_retries attempts')
+
 class Producer:
-    '''Class to send events to Azure Event Hub'''
-    def __init__(self, 
-                connection_string: str, 
-                eventhub_name: str) -> None:
+    '''Class to send events to Azure Event Hub
+    A single client connection is kept open for the life of the Producer and
+    is recreated after a failed send. Events are packed into as many
+    EventDataBatch objects as needed, each one filled until it reaches its size
+    limit, and up to max_in_flight batches are sent concurrently.
+    '''
+    def __init__(self,
+                connection_string: str | None = None,
+                eventhub_name: str | None = None,
+                encoding: str = 'json',
+                compress: bool = True,
+                max_in_flight: int = 4,
+                max_retries: int = 3,
+                retry_delay: float = 1.0,
+                samples_per_payload: int = 1000,
+                client_factory: Callable | None = None,
+                on_error: Callable[[list], None] | None = None,
+                fields: list[str] | None = None) -> None:
         '''Initialize Producer class
         Args:
             connection_string (str): connection string to Azure Event Hub
             eventhub_name (str): name of the event hub
+            encoding (str) default 'json': 'json' sends one JSON event per dict,
+                'binary' packs the whole batch into one columnar payload (see codec.py)
+            compress (bool) default True: zlib compress binary payloads
+            max_in_flight (int) default 4: maximum number of batches being sent at once
+            max_retries (int) default 3: attempts to send a batch before giving up
+            retry_delay (float) default 1.0: seconds to wait before reconnecting
+            samples_per_payload (int) default 1000: maximum samples in one binary payload
+            client_factory (callable) default None: callable returning a producer
+                client, used instead of EventHubProducerClient (see local_eventhub.py)
+            on_error (callable) default None: called with the events of a batch
+                that could not be sent after max_retries attempts, so they can 
+                be buffered and sent again later
+            fields (list[str]) default None: send only these keys (and driver_name)
+                of packet dicts, events with an event_type such as lap summaries
+                are sent whole
         '''
-        self.producer = EventHubProducerClient.from_connection_string(
+        if encoding not in ('json', 'binary'):
+            raise ValueError(f'unknown encoding: {encoding}')
+        if client_factory is None:
+            if not connection_string or not eventhub_name:
+                raise ValueError('connection_string and eventhub_name are required')
+            def client_factory() -> EventHubProducerClient:
+                return EventHubProducerClient.from_connection_string(
                         conn_str=connection_string,
                         eventhub_name=eventhub_name)
+        self.client_factory = client_factory
+        self.on_error = on_error
+        self.fields = None if fields is None else {*fields, 'driver_name'}
+        self.encoding = encoding
+        self.compress = compress
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.samples_per_payload = samples_per_payload
+        self.producer = None
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._pending = set()
         logger.debug(f'Producer object created with eventhub_name: {eventhub_name}')
 
-    async def prepare_events(self, events_list: list[dict]):
+    def _client(self):
+        '''Returns the open client, connecting if needed'''
+        if self.producer is None:
+            logger.info('Connecting to Azure Event Hub')
+            self.producer = self.client_factory()
+        return self.producer
+
+    async def _disconnect(self) -> None:
+        '''Close the current client so the next send reconnects'''
+        producer, self.producer = self.producer, None
+        if producer is not None:
+            try:
+                await producer.close()
+            except Exception as e:
+                logger.warning(f'Error closing connection to Azure Event Hub: {e}')
+
+    def encode_events(self, events_list: list[dict]) -> list[tuple[EventData, int]]:
+        '''Encode events using the configured encoding
+        Args:
+            events_list (list[dict]): list of events to be encoded, JSON strings 
+                are also accepted by the json encoding
+        Returns:
+            list[tuple[EventData, int]]: (event_data, number of samples) pairs, one
+                per event for JSON encoding or one per samples_per_payload
+                events for binary encoding
+        '''
+        if self.fields is not None:
+            events_list = [self.project(event) for event in events_list]
+        if self.encoding == 'json':
+            # events already serialized by worker processes are sent as they are
+            return [(EventData(event if isinstance(event, str) else json.dumps(event)), 1)
+                    for event in events_list]
+        encoded = []
+        for start in range(0, len(events_list), self.samples_per_payload):
+            chunk = events_list[start:start + self.samples_per_payload]
+            event_data = EventData(codec.encode_batch(chunk, compress_payload = self.compress))
+            event_data.content_type = codec.CONTENT_TYPE
+            event_data.properties = {'schema_version': codec.SCHEMA_VERSION,
+                                     'samples': len(chunk)}
+            encoded.append((event_data, len(chunk)))
+        return encoded
+
+    def project(self, event):
+        '''Removes the keys not in fields from a packet dict. JSON strings are
+           returned as they are, worker processes project them before
+           serializing (see multirig.QueueProducer)'''
+        if not isinstance(event, dict) or 'event_type' in event:
+            return event
+        fields = self.fields
+        return {key: value for key, value in event.items() if key in fields}
+
+    async def _create_batch(self) -> EventDataBatch:
+        '''Creates an empty batch, reconnecting and retrying on failure.
+           create_batch() opens the connection to read the batch size limit,
+           so it fails like a send when Event Hubs is unreachable. Raises
+           ConnectionError once max_retries attempts failed, whatever the
+           client raised, including errors creating the client.'''
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                return await self._client().create_batch()
+            except Exception as e:
+                SEND_ERRORS.inc()
+                logger.error('Error creating batch of events for Azure Event Hub '
+                             '(attempt %d of %d): %s', attempt, self.max_retries, e)
+                await self._disconnect()
+                if attempt == self.max_retries:
+                    raise ConnectionError(f'no batch could be created: {e}') from e
+                await asyncio.sleep(self.retry_delay)
+
+    async def prepare_events(self, events_list: list[dict]) -> list[tuple[EventDataBatch, list[dict]]]:
         '''Prepare events to be sent to Azure Event Hub
+        Each batch is filled until it reports it is full.
         Args:
             events_list (list[dict]): list of events to be sent to Azure Event Hub
         Returns:
-            event_data_batch (EventDataBatch): batch of events to be sent to Azure Event Hub
+            list[tuple[EventDataBatch, list[dict]]]: batches of events to be sent to
+                Azure Event Hub, with the events each one carries
         '''
-        async with self.producer:
-            logger.info('Creating batch ot events')
-            event_data_batch = await self.producer.create_batch()
-            logger.info(f'Adding {len(events_list)} events to batch')
-            for event in events_list:
-                event_str = json.dumps(event)
-                event_data_batch.add(EventData(event_str))
-        logger.debug(f'batch of {len(events_list)} events created')
-        return event_data_batch
+        encoded = self.encode_events(events_list)
+        batches = []
+        event_data_batch = await self._create_batch()
+        start = end = 0
+        for event_data, samples in encoded:
+            try:
+                event_data_batch.add(event_data)
+            except ValueError:
+                if len(event_data_batch):
+                    batches.append((event_data_batch, events_list[start:end]))
+                    event_data_batch = await self._create_batch()
+                    start = end
+                try:
+                    event_data_batch.add(event_data)
+                except ValueError:
+                    logger.error('Event with %d samples is bigger than the batch size limit, dropping it', samples)
+                    start = end = end + samples
+                    continue
+            end += samples
+        if len(event_data_batch):
+            batches.append((event_data_batch, events_list[start:end]))
+        logger.debug('%d events packed in %d batches', len(events_list), len(batches))
+        return batches
+
+    async def _send_batch(self,
+                          event_data_batch: EventDataBatch,
+                          events_list: list[dict]) -> None:
+        '''Send one batch, reconnecting and retrying on failure'''
+        try:
+            for attempt in range(1, self.max_retries + 1):
+                try:
+                    start = time.perf_counter()
+                    await self._client().send_batch(event_data_batch)
+                    SEND_SECONDS.observe(time.perf_counter() - start)
+                    EVENTS_SENT.inc(len(events_list))
+                    logger.debug('batch of %d events sent to Azure Event Hub', len(events_list))
+                    return
+                except Exception as e:
+                    SEND_ERRORS.inc()
+                    logger.error('Error sending batch of events to Azure Event Hub '
+                                 '(attempt %d of %d): %s', attempt, self.max_retries, e)
+                    await self._disconnect()
+                    if attempt < self.max_retries:
+                        await asyncio.sleep(self.retry_delay)
+            logger.error('Giving up on batch of %d events', len(events_list))
+            EVENTS_FAILED.inc(len(events_list))
+            if self.on_error is not None:
+                self.on_error(events_list)
+        finally:
+            self._in_flight.release()
 
     async def send_events(self, events_list: list[dict]) -> None:
         '''Send events to Azure Event Hub
+        Returns as soon as every batch has been handed to a send task, waiting
+        only while max_in_flight batches are already being sent. Use flush()
+        to wait for the sends to complete. Events that cannot be sent, also
+        when no batch can be created because Event Hubs is unreachable, are
+        handed to on_error instead of raising; only encoding errors raise.
         Args:
             events_list (list[dict]): list of events to be sent to Azure Event Hub
         Returns:
             None
         '''
-
         logger.info('sending batch of events to Azure Event Hub')
-        if len(events_list) > 75:
-            logger.warning(f'batch of {len(events_list)} events is too big. Splitting into 2 batches (recursively)')
-            events_list_overflow = events_list[75:]
-            events_list = events_list[:75]
-            await self.send_events(events_list = events_list_overflow)
-
-        event_data_batch = await self.prepare_events(events_list = events_list)
         try:
-            await self.producer.send_batch(event_data_batch)
-        except Exception as e:
-            logger.error(f'Error sending batch of events to Azure Event Hub: {e}')
-        finally:
-            await self.producer.close()
+            batches = await self.prepare_events(events_list = events_list)
+        except ConnectionError as e:
+            # raised by _create_batch(), encoding errors raise as they would fail again
+            logger.error('Giving up on %d events: %s', len(events_list), e)
+            EVENTS_FAILED.inc(len(events_list))
+            if self.on_error is not None:
+                self.on_error(events_list)
+            return
+        for event_data_batch, events in batches:
+            BATCH_EVENTS.observe(len(events))
+            BATCH_BYTES.observe(event_data_batch.size_in_bytes)
+            await self._in_flight.acquire()
+            task = asyncio.create_task(self._send_batch(event_data_batch, events))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
 
-        logger.debug(f'batch of {len(events_list)} events sent to Azure Event Hub')
+    async def flush(self) -> None:
+        '''Wait until all batches in flight are sent'''
+        if self._pending:
+            await asyncio.gather(*self._pending)
 
-    def close(self) -> None:
-        '''Close connection to Azure Event Hub'''
-        self.producer.close()
\ No newline at end of file
+    async def close(self) -> None:
+        '''Send pending batches and close connection to Azure Event Hub'''
+        await self.flush()
+        await self._disconnect()
@@ -0,0 +1,277 @@
+'''Receiving in a process of its own, through shared memory rings.
+
+A receiver process does nothing but copy datagrams from the socket into
+shared memory ring buffers, one ring per worker process, so the socket is
+drained promptly however busy decoding gets. Each source address always
+goes to the same ring (sources are spread round robin), keeping the packets
+of a driver in order, so one game sending to the port keeps a single worker
+busy and more workers only help with several sources. Workers read datagrams straight from shared memory,
+with no pickling, and decode, filter and serialize them with the same
+ForzaDataReader -> AsyncForzaIO pipeline as rig_worker (see multirig.py),
+forwarding batches of JSON strings to the parent process, which owns the
+Producer.
+
+Each ring has a single writer (the receiver) and a single reader (its
+worker). When a ring is full the receiver drops the new datagram and counts
+an overrun. Ring indices are aligned 8 byte counters in shared memory, the
+receiver publishes a slot only after writing it.
+
+    ingest = SharedMemoryIngest({'port': 6667, 'driver_name': 'alice'}, producer)
+    ingest.start()
+    await ingest.run()
+'''
+import asyncio
+import logging
+import multiprocessing
+import socket
+import struct
+from multiprocessing import shared_memory
+
+import metrics
+from forza_package import ForzaDataReader
+from logger import create_logger
+from main import AsyncForzaIO
+from multirig import MultiRigIngest, QueueProducer
+from producer import Producer
+
+logger = create_logger(__name__, logging.DEBUG)
+
+HEADER_SIZE = 128
+SLOT_SIZE = 336 # slot header and the largest (FH4, 324 bytes) datagram, 16 byte aligned
+_SLOT_HEADER = struct.Struct('<HH4s') # length, source port, source IPv4 address
+_SLOT_DATA = SLOT_SIZE - _SLOT_HEADER.size
+# u64 counters in the header, those written by the receiver on the first
+# cache line, the read index written by the worker on the second one
+_WRITE, _RECEIVED, _OVERRUNS, _HIGH_WATER, _READ = 0, 1, 2, 3, 8
+
+
+class DatagramRing:
+    '''Single producer, single consumer ring of datagram slots in shared memory.
+       Pickles as a reference to the same memory, so it can be passed to
+       processes started with any start method.
+    Args:
+        slots (int) default 4096: number of datagrams the ring holds.
+        name (str) default None: attach to an existing ring, create one when None.
+    '''
+    def __init__(self, slots: int = 4096, name: str | None = None) -> None:
+        self.slots = slots
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name, self.owner, HEADER_SIZE + slots * SLOT_SIZE)
+        self._counters = self.shm.buf[:HEADER_SIZE].cast('Q')
+        self._slots = [self.shm.buf[HEADER_SIZE + index * SLOT_SIZE:HEADER_SIZE + (index + 1) * SLOT_SIZE]
+                       for index in range(slots)]
+        self._addresses = {} # (packed address, port) -> address tuple
+
+    def __reduce__(self) -> tuple:
+        return DatagramRing, (self.slots, self.shm.name)
+
+    def put(self, data: memoryview, address: tuple) -> bool:
+        '''Copies a datagram into the next free slot. Receiver side.
+        Returns:
+            bool: False when the ring was full and the datagram dropped.'''
+        counters = self._counters
+        write = counters[_WRITE]
+        counters[_RECEIVED] += 1
+        occupancy = write - counters[_READ]
+        if occupancy >= self.slots:
+            counters[_OVERRUNS] += 1
+            return False
+        slot = self._slots[write % self.slots]
+        length = min(len(data), _SLOT_DATA)
+        _SLOT_HEADER.pack_into(slot, 0, length, address[1], socket.inet_aton(address[0]))
+        slot[_SLOT_HEADER.size:_SLOT_HEADER.size + length] = data[:length]
+        counters[_WRITE] = write + 1
+        if occupancy >= counters[_HIGH_WATER]:
+            counters[_HIGH_WATER] = occupancy + 1
+        return True
+
+    def get(self, max_items: int = 256) -> list[tuple[bytes, tuple]]:
+        '''Returns up to max_items (datagram, source address) pairs and frees
+           their slots. Worker side.'''
+        counters = self._counters
+        read = counters[_READ]
+        end = min(counters[_WRITE], read + max_items)
+        items = []
+        addresses = self._addresses
+        for sequence in range(read, end):
+            slot = self._slots[sequence % self.slots]
+            length, port, packed = _SLOT_HEADER.unpack_from(slot)
+            address = addresses.get((packed, port))
+            if address is None:
+                address = addresses[(packed, port)] = (socket.inet_ntoa(packed), port)
+            items.append((bytes(slot[_SLOT_HEADER.size:_SLOT_HEADER.size + length]), address))
+        counters[_READ] = end
+        return items
+
+    def stats(self) -> dict:
+        '''Returns the ring counters.'''
+        counters = self._counters
+        return {'slots': self.slots,
+                'occupancy': counters[_WRITE] - counters[_READ],
+                'high_water': counters[_HIGH_WATER],
+                'received': counters[_RECEIVED],
+                'overruns': counters[_OVERRUNS]}
+
+    def close(self) -> None:
+        '''Detaches from the shared memory, and frees it when this object created it.'''
+        for view in self._slots:
+            view.release()
+        self._counters.release()
+        self._slots = []
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def ring_receiver(rig: dict,
+                  rings: list[DatagramRing],
+                  reader_options: dict,
+                  kernel_drops) -> None:
+    '''Copies the datagrams of one port into the rings, forever.'''
+    reader = ForzaDataReader(driver_name = rig['driver_name'],
+                             ip = rig.get('ip', '0.0.0.0'),
+                             port = rig['port'],
+                             rcvbuf_size = reader_options.get('rcvbuf_size', 1024 * 1024),
+                             batch_size = reader_options.get('batch_size', 32))
+    reader.start()
+    targets = {} # source address -> ring
+    while True:
+        for data, address in reader._receive_batch():
+            ring = targets.get(address)
+            if ring is None:
+                ring = targets[address] = rings[len(targets) % len(rings)]
+            ring.put(data, address)
+        kernel_drops.value = reader.stats.kernel_drops
+
+
+class RingForzaIO(AsyncForzaIO):
+    '''AsyncForzaIO reading datagrams from a DatagramRing instead of a socket.
+    Args:
+        ring (DatagramRing): ring filled by ring_receiver.
+        poll_interval (float) default 0.002: seconds to sleep when the ring is empty.
+        Other arguments as AsyncForzaIO, native_udp only.
+    '''
+    def __init__(self,
+                 ring: DatagramRing,
+                 reader: ForzaDataReader,
+                 producer: Producer,
+                 poll_interval: float = 0.002,
+                 **kwargs) -> None:
+        self.ring = ring
+        self.poll_interval = poll_interval
+        super().__init__(reader, producer, **kwargs)
+
+    def _post_init(self) -> None:
+        pass # the receiver process owns the socket
+
+    async def _read_data_native(self) -> None:
+        logger.debug('\tStarting ring reader')
+        self.protocol = self._protocol()
+        while True:
+            items = self.ring.get()
+            if not items:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            for data, address in items:
+                self.protocol.datagram_received(data, address)
+            await asyncio.sleep(0)
+
+
+def ring_worker(rig: dict,
+                ring: DatagramRing,
+                output: multiprocessing.Queue,
+                reader_options: dict,
+                io_options: dict,
+                serialize: bool,
+                fields: set[str] | None = None) -> None:
+    '''Decodes, filters and serializes the datagrams of one ring, forever.'''
+    reader = ForzaDataReader(driver_name = rig['driver_name'],
+                             port = rig['port'],
+                             driver_names = rig.get('drivers'),
+                             **reader_options)
+    forza_io = RingForzaIO(ring, reader, QueueProducer(output, serialize, fields), **io_options)
+    asyncio.run(forza_io.run())
+
+
+class SharedMemoryIngest(MultiRigIngest):
+    '''Receives one port in a receiver process feeding worker processes through
+       DatagramRings, and sends the events of all workers with one Producer.
+    Args:
+        rig (dict): rig configuration as in multirig.load_config(), "workers"
+            (default 1) is the number of worker processes, more only help with
+            several source addresses, each source being read by one worker,
+            and cores to spare for them besides the receiver and this process.
+        producer (Producer): producer sending the events.
+        slots (int) default 4096: datagrams each ring holds.
+        filter_rate (int) default 2: keep one packet every filter_rate packets.
+        reader_options (dict) default None: extra ForzaDataReader arguments.
+        io_options (dict) default None: extra RingForzaIO arguments.
+        stats_interval (float) default 30: seconds between ring statistics log lines.
+    '''
+    def __init__(self,
+                 rig: dict,
+                 producer: Producer,
+                 slots: int = 4096,
+                 filter_rate: int = 2,
+                 reader_options: dict | None = None,
+                 io_options: dict | None = None,
+                 stats_interval: float = 30) -> None:
+        rig = {'driver_name': f'rig{rig["port"]}', **rig}
+        super().__init__({'filter_rate': filter_rate, 'rigs': [rig]}, producer, reader_options, io_options)
+        self.rig = rig
+        self.slots = slots
+        self.stats_interval = stats_interval
+        self.rings = []
+        self.kernel_drops = multiprocessing.RawValue('Q', 0)
+        metrics.REGISTRY.register(f'ring:{rig["port"]}', self._collect_metrics)
+
+    def start(self) -> None:
+        '''Creates the rings and starts the worker and receiver processes.'''
+        serialize = getattr(self.producer, 'encoding', 'json') == 'json'
+        self.rings = [DatagramRing(self.slots) for _ in range(self.rig.get('workers', 1))]
+        for ring in self.rings:
+            process = multiprocessing.Process(target = ring_worker,
+                                              args = (self.rig, ring, self.queue, self.reader_options,
+                                                      self.io_options, serialize,
+                                                      getattr(self.producer, 'fields', None)),
+                                              daemon = True)
+            process.start()
+            self.processes.append(process)
+        receiver = multiprocessing.Process(target = ring_receiver,
+                                           args = (self.rig, self.rings, self.reader_options, self.kernel_drops),
+                                           daemon = True)
+        receiver.start()
+        self.processes.append(receiver)
+        logger.debug(f'Receiver and {len(self.rings)} worker processes started on port {self.rig["port"]}')
+
+    def stop(self) -> None:
+        '''Terminates the processes and frees the rings.'''
+        super().stop()
+        for ring in self.rings:
+            ring.close()
+        self.rings = []
+
+    def stats(self) -> dict:
+        '''Returns the kernel drops and the counters of every ring.'''
+        return {'kernel_drops': self.kernel_drops.value, 'rings': [ring.stats() for ring in self.rings]}
+
+    def _collect_metrics(self) -> list:
+        port = str(self.rig['port'])
+        rings = [({'port': port, 'ring': str(index)}, ring.stats()) for index, ring in enumerate(self.rings)]
+        return [('forza_ring_occupancy', 'gauge', 'Datagrams waiting in the ring',
+                 [(labels, stats['occupancy']) for labels, stats in rings]),
+                ('forza_ring_high_water', 'gauge', 'Highest ring occupancy',
+                 [(labels, stats['high_water']) for labels, stats in rings]),
+                ('forza_ring_overruns_total', 'counter', 'Datagrams dropped because the ring was full',
+                 [(labels, stats['overruns']) for labels, stats in rings]),
+                ('forza_ring_kernel_drops_total', 'counter', 'Datagrams dropped by the kernel before the receiver',
+                 [({'port': port}, self.kernel_drops.value)])]
+
+    async def _report_stats(self) -> None:
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            logger.info('\trings: %s', self.stats())
+
+    async def run(self) -> None:
+        '''Sends the batches forwarded by the workers and logs the ring statistics, forever.'''
+        await asyncio.gather(super().run(), self._report_stats())
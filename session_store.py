@@ -0,0 +1,438 @@
+'''Columnar, time indexed session store with downsampled zoom levels.
+
+Every packet of a session is kept, one directory per session:
+
+    meta.json           driver, channels and their dtypes, chunk size, levels
+    chunks.idx          per chunk: first and last time (i8), samples (u4)
+    sizes.idx           per chunk: compressed size (u4) of the time column and
+                        of every channel, in meta.json channel order
+    time.col            time column, chunks of delta encoded, byte shuffled,
+    <channel>.col       zlib compressed values, one chunk every chunk_size samples
+    L<ms>/time.bin      zoom level of <ms> buckets: bucket start time (i8),
+    L<ms>/count.bin     samples per bucket (u4) and
+    L<ms>/<channel>.bin min, max and mean of each channel (3 x f4)
+
+time is timestamp_ms. Queries read only the chunks covering the requested
+range, or memory-map one zoom level file and binary search it, so they
+never load whole files, whatever the length of the session. Data becomes
+visible when its chunk is written.
+
+SessionRecorder writes sessions from the packet stream, as an aggregator
+of ForzaDataReader, starting a new session whenever timestamp_ms goes
+backwards:
+
+    ForzaDataReader(..., aggregator = lambda: SessionRecorder('sessions'))
+
+Usage:
+    python session_store.py import <capture> <root> [--driver NAME]
+    python session_store.py list <root>
+    python session_store.py query <session> <channel> [--start MS] [--end MS] [--resolution MS]
+'''
+import argparse
+import json
+import logging
+import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from forza_columnar import STRUCT_TO_NUMPY
+from forza_package import FastForzaDataPacket, ForzaDataPacket
+from logger import create_logger
+
+logger = create_logger(__name__, logging.DEBUG)
+
+VERSION = 1
+CHUNK_SIZE = 4096 # samples, about 68 s at 60 Hz
+DEFAULT_LEVELS = (500, 5000, 60000) # bucket sizes in ms, queries below 500 ms use the chunks
+
+# channel name -> numpy dtype of its values
+CHANNEL_DTYPES = {name: STRUCT_TO_NUMPY[code] for name, code
+                  in zip(FastForzaDataPacket.dash_keys, ForzaDataPacket.dash_format[1:])}
+
+_chunk_entry = np.dtype([('first', '<i8'), ('last', '<i8'), ('count', '<u4')])
+_level_value = np.dtype([('min', '<f4'), ('max', '<f4'), ('mean', '<f4')])
+
+
+def _compress(values: np.ndarray) -> bytes:
+    '''Byte shuffles values (all first bytes, then all second bytes, ...) and compresses them.'''
+    values = np.ascontiguousarray(values)
+    shuffled = values.view(np.uint8).reshape(-1, values.itemsize).T
+    return zlib.compress(shuffled.tobytes())
+
+
+def _decompress(data: bytes, dtype: str) -> np.ndarray:
+    itemsize = np.dtype(dtype).itemsize
+    shuffled = np.frombuffer(zlib.decompress(data), dtype = np.uint8).reshape(itemsize, -1)
+    return np.ascontiguousarray(shuffled.T).view(dtype).ravel()
+
+
+def _bucket(times: np.ndarray,
+            counts: np.ndarray,
+            mins: np.ndarray,
+            maxs: np.ndarray,
+            sums: np.ndarray,
+            resolution_ms: int) -> tuple[np.ndarray, ...]:
+    '''Merges consecutive rows falling in the same resolution_ms bucket.
+    Returns:
+        (bucket start times, counts, mins, maxs, sums) arrays.'''
+    if not len(times):
+        return times, counts, mins, maxs, sums
+    buckets = times // resolution_ms
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    return (buckets[starts] * resolution_ms,
+            np.add.reduceat(counts, starts, axis = 0),
+            np.minimum.reduceat(mins, starts, axis = 0),
+            np.maximum.reduceat(maxs, starts, axis = 0),
+            np.add.reduceat(sums, starts, axis = 0))
+
+
+class SessionWriter:
+    '''Writes one session directory. Chunks are compressed and written by a
+       thread of their own, so append() does not wait on the disk.
+    Args:
+        path (str): session directory, must not exist.
+        channels (dict[str, str]): channel name -> numpy dtype, in value order.
+        chunk_size (int) default CHUNK_SIZE: samples per compressed chunk.
+        levels (tuple[int]) default DEFAULT_LEVELS: zoom level bucket sizes in ms.
+        metadata (dict) default None: extra keys stored in meta.json.
+    '''
+    def __init__(self,
+                 path: str,
+                 channels: dict[str, str],
+                 chunk_size: int = CHUNK_SIZE,
+                 levels: tuple[int, ...] = DEFAULT_LEVELS,
+                 metadata: dict | None = None) -> None:
+        self.path = path
+        self.names = list(channels)
+        self.dtypes = [channels[name] for name in self.names]
+        self.chunk_size = chunk_size
+        self.levels = tuple(sorted(levels))
+        self.meta = {'version': VERSION, 'channels': dict(channels), 'chunk_size': chunk_size,
+                     'levels': list(self.levels), 'samples': 0, **(metadata or {})}
+        self.times = []
+        self.rows = []
+        self.last_ms = None
+        self._carry = {level: None for level in self.levels} # open bucket of each level
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix = 'session-writer')
+        self._pending = None # Future of the chunk being written
+        os.makedirs(path)
+        for level in self.levels:
+            os.makedirs(os.path.join(path, f'L{level}'))
+        self._write_meta()
+        logger.debug('SessionWriter writing to %s', path)
+
+    def _write_meta(self) -> None:
+        temporary = os.path.join(self.path, 'meta.json.tmp')
+        with open(temporary, 'w') as meta_file:
+            json.dump(self.meta, meta_file)
+        os.replace(temporary, os.path.join(self.path, 'meta.json'))
+
+    def _append_file(self, name: str, data: bytes) -> None:
+        with open(os.path.join(self.path, name), 'ab') as column_file:
+            column_file.write(data)
+
+    def append(self, time_ms: int, values) -> None:
+        '''Adds one sample, values in channel order. time_ms must not go backwards.'''
+        if self.last_ms is not None and time_ms < self.last_ms:
+            raise ValueError(f'time went backwards from {self.last_ms} to {time_ms}')
+        self.last_ms = time_ms
+        self.times.append(time_ms)
+        self.rows.append(values)
+        if len(self.times) >= self.chunk_size:
+            self._submit()
+
+    def _submit(self) -> None:
+        '''Hands the buffered samples to the writer thread, raising the error of the previous chunk.'''
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+        if self.times:
+            self._pending = self._executor.submit(self._write_chunk, self.times, self.rows)
+            self.times, self.rows = [], []
+
+    def _write_chunk(self, times: list[int], rows: list) -> None:
+        times = np.array(times, dtype = '<i8')
+        # converted in slices, each holds the GIL for well under a millisecond
+        data = np.concatenate([np.array(rows[start:start + 256], dtype = np.float64)
+                               for start in range(0, len(rows), 256)]).reshape(len(times), len(self.names))
+        sizes = []
+        compressed = _compress(np.diff(times, prepend = 0))
+        self._append_file('time.col', compressed)
+        sizes.append(len(compressed))
+        for index, (name, dtype) in enumerate(zip(self.names, self.dtypes)):
+            compressed = _compress(data[:, index].astype(dtype))
+            self._append_file(f'{name}.col', compressed)
+            sizes.append(len(compressed))
+        # sizes first, readers only use chunks present in chunks.idx
+        self._append_file('sizes.idx', np.array(sizes, dtype = '<u4').tobytes())
+        entry = np.array([(times[0], times[-1], len(times))], dtype = _chunk_entry)
+        self._append_file('chunks.idx', entry.tobytes())
+        for level in self.levels:
+            self._update_level(level, times, data)
+        self.meta['samples'] += len(times)
+        self.meta.setdefault('start_ms', int(times[0]))
+        self.meta['end_ms'] = int(times[-1])
+        self._write_meta()
+
+    def _update_level(self, level: int, times: np.ndarray, data: np.ndarray) -> None:
+        '''Aggregates a chunk into level buckets, writing the buckets it closes.'''
+        rows = _bucket(times, np.ones(len(times), dtype = np.int64), data, data, data, level)
+        carry = self._carry[level]
+        if carry is not None:
+            if carry[0][0] == rows[0][0]:
+                rows = _bucket(*(np.concatenate((old, new)) for old, new in zip(carry, rows)), level)
+            else:
+                rows = tuple(np.concatenate((old, new)) for old, new in zip(carry, rows))
+        self._write_level(level, *(column[:-1] for column in rows))
+        self._carry[level] = tuple(column[-1:] for column in rows)
+
+    def _write_level(self, level: int, times, counts, mins, maxs, sums) -> None:
+        if not len(times):
+            return
+        self._append_file(f'L{level}/time.bin', times.astype('<i8').tobytes())
+        self._append_file(f'L{level}/count.bin', counts.astype('<u4').tobytes())
+        means = sums / counts[:, None]
+        for index, name in enumerate(self.names):
+            values = np.empty(len(times), dtype = _level_value)
+            values['min'], values['max'], values['mean'] = mins[:, index], maxs[:, index], means[:, index]
+            self._append_file(f'L{level}/{name}.bin', values.tobytes())
+
+    def close(self) -> None:
+        '''Writes the last chunk and the open bucket of every level.'''
+        self._submit()
+        self._submit()
+        self._executor.shutdown()
+        for level, carry in self._carry.items():
+            if carry is not None:
+                self._write_level(level, *carry)
+            self._carry[level] = None
+        self.meta['closed'] = True
+        self._write_meta()
+        logger.debug('SessionWriter closed %s after %d samples', self.path, self.meta['samples'])
+
+
+class SessionReader:
+    '''Reads a session directory written by SessionWriter.
+    Args:
+        path (str): session directory.
+    '''
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as meta_file:
+            self.meta = json.load(meta_file)
+        self.channels = self.meta['channels']
+        self.levels = tuple(self.meta['levels'])
+        columns = 1 + len(self.channels)
+        self.chunks = self._fromfile('chunks.idx', _chunk_entry)
+        sizes = self._fromfile('sizes.idx', '<u4')
+        sizes = sizes[:len(self.chunks) * columns].reshape(-1, columns).astype(np.int64)
+        self.chunks = self.chunks[:len(sizes)]
+        self._sizes = sizes
+        self._offsets = np.cumsum(sizes, axis = 0) - sizes
+        self._column = {name: index for index, name in enumerate(self.channels, start = 1)}
+
+    def _fromfile(self, name: str, dtype) -> np.ndarray:
+        '''Reads a whole file, empty when it is not written yet.'''
+        path = os.path.join(self.path, name)
+        if not os.path.exists(path):
+            return np.empty(0, dtype = dtype)
+        return np.fromfile(path, dtype = dtype)
+
+    def _memmap(self, name: str, dtype) -> np.ndarray:
+        '''Maps a file, empty when it is not written yet.'''
+        path = os.path.join(self.path, name)
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return np.empty(0, dtype = dtype)
+        return np.memmap(path, dtype = dtype, mode = 'r')
+
+    @property
+    def start_ms(self) -> int | None:
+        return int(self.chunks['first'][0]) if len(self.chunks) else None
+
+    @property
+    def end_ms(self) -> int | None:
+        return int(self.chunks['last'][-1]) if len(self.chunks) else None
+
+    @property
+    def samples(self) -> int:
+        return int(self.chunks['count'].sum())
+
+    def _read_column(self, name: str, column: int, dtype: str, first: int, last: int) -> np.ndarray:
+        '''Reads and decompresses chunks first to last - 1 of one column.'''
+        if first >= last:
+            return np.empty(0, dtype = dtype)
+        parts = []
+        with open(os.path.join(self.path, f'{name}.col'), 'rb') as column_file:
+            for chunk in range(first, last):
+                column_file.seek(self._offsets[chunk, column])
+                parts.append(_decompress(column_file.read(self._sizes[chunk, column]), dtype))
+        return np.concatenate(parts) if parts else np.empty(0, dtype = dtype)
+
+    def raw(self, channel: str, start_ms: int | None = None, end_ms: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        '''Returns (times, values) of every sample of channel between start_ms and end_ms.'''
+        start_ms = self.start_ms if start_ms is None else start_ms
+        end_ms = self.end_ms if end_ms is None else end_ms
+        first = int(np.searchsorted(self.chunks['last'], start_ms, 'left'))
+        last = int(np.searchsorted(self.chunks['first'], end_ms, 'right'))
+        # the time deltas of each chunk start from zero, not from the previous chunk
+        times = np.concatenate([np.cumsum(self._read_column('time', 0, '<i8', chunk, chunk + 1))
+                                for chunk in range(first, last)] or [np.empty(0, dtype = '<i8')])
+        values = self._read_column(channel, self._column[channel], self.channels[channel], first, last)
+        selected = (times >= start_ms) & (times <= end_ms)
+        return times[selected], values[selected]
+
+    def _level(self, level: int, channel: str, start_ms: int, end_ms: int) -> tuple[np.ndarray, ...]:
+        '''Returns (times, counts, mins, maxs, sums) of the level buckets overlapping the range.'''
+        # no file exists before the first bucket of the level is closed, and
+        # the writer thread may have appended to time.bin but not yet to the others
+        times = self._memmap(f'L{level}/time.bin', '<i8')
+        counts = self._memmap(f'L{level}/count.bin', '<u4')
+        values = self._memmap(f'L{level}/{channel}.bin', _level_value)
+        buckets = min(len(times), len(counts), len(values))
+        times = times[:buckets]
+        first = int(np.searchsorted(times, start_ms - start_ms % level, 'left'))
+        last = int(np.searchsorted(times, end_ms, 'right'))
+        counts = np.array(counts[first:last], dtype = np.int64)
+        values = np.array(values[first:last])
+        return (np.array(times[first:last]), counts,
+                values['min'].astype(np.float64), values['max'].astype(np.float64),
+                values['mean'].astype(np.float64) * counts)
+
+    def query(self,
+              channel: str,
+              start_ms: int | None = None,
+              end_ms: int | None = None,
+              resolution_ms: int = 0) -> dict[str, np.ndarray]:
+        '''Returns one channel over a time range at the requested resolution.
+        Args:
+            channel (str): channel name.
+            start_ms (int) default None: first timestamp_ms, start of the session when None.
+            end_ms (int) default None: last timestamp_ms, end of the session when None.
+            resolution_ms (int) default 0: bucket size, 0 returns every sample.
+        Returns:
+            dict[str, np.ndarray]: time and value arrays for resolution_ms 0,
+                otherwise time (bucket start), count, min, max and mean arrays.
+                Buckets come from the largest zoom level not above resolution_ms,
+                or from the samples when resolution_ms is below every level.
+        '''
+        if channel not in self.channels:
+            raise ValueError(f'unknown channel: {channel}')
+        if not len(self.chunks):
+            start_ms = end_ms = 0
+        start_ms = self.start_ms if start_ms is None else start_ms
+        end_ms = self.end_ms if end_ms is None else end_ms
+        if resolution_ms <= 0:
+            times, values = self.raw(channel, start_ms, end_ms)
+            return {'time': times, 'value': values}
+        levels = [level for level in self.levels if level <= resolution_ms]
+        if levels:
+            rows = self._level(levels[-1], channel, start_ms, end_ms)
+        else:
+            times, values = self.raw(channel, start_ms, end_ms)
+            values = values.astype(np.float64)
+            rows = (times, np.ones(len(times), dtype = np.int64), values, values, values)
+        times, counts, mins, maxs, sums = _bucket(*rows, resolution_ms)
+        return {'time': times, 'count': counts, 'min': mins, 'max': maxs,
+                'mean': sums / counts if len(counts) else sums}
+
+
+class SessionRecorder:
+    '''Writes every packet of one driver to a new session in root. Used as an
+       aggregator of ForzaDataReader, it returns no events. A new session is
+       started when timestamp_ms goes backwards or the packet layout changes.
+    Args:
+        root (str) default 'sessions': directory of the sessions.
+        chunk_size (int) default CHUNK_SIZE: samples per compressed chunk.
+        levels (tuple[int]) default DEFAULT_LEVELS: zoom level bucket sizes in ms.
+    '''
+    def __init__(self,
+                 root: str = 'sessions',
+                 chunk_size: int = CHUNK_SIZE,
+                 levels: tuple[int, ...] = DEFAULT_LEVELS) -> None:
+        self.root = root
+        self.chunk_size = chunk_size
+        self.levels = levels
+        self.writer = None
+        self.keys = None
+        self.sessions = []
+
+    def _start(self, packet) -> None:
+        self.flush()
+        self.keys = packet.keys
+        name = f'{packet.driver_name}_{time.strftime("%Y%m%d_%H%M%S")}'
+        path, number = os.path.join(self.root, name), 1
+        while os.path.exists(path):
+            number += 1
+            path = os.path.join(self.root, f'{name}_{number}')
+        self.writer = SessionWriter(path, {key: CHANNEL_DTYPES[key] for key in self.keys},
+                                    self.chunk_size, self.levels,
+                                    {'driver_name': packet.driver_name, 'packet_format': packet.packet_format,
+                                     'created': time.time()})
+        self.sessions.append(path)
+
+    def push(self, packet) -> list:
+        '''Appends the packet to the current session. Requires fast_decode packets.'''
+        timestamp_ms = packet.timestamp_ms
+        if self.writer is None or packet.keys is not self.keys or timestamp_ms < self.writer.last_ms:
+            self._start(packet)
+        self.writer.append(timestamp_ms, packet.values)
+        return []
+
+    def flush(self) -> list:
+        '''Closes the current session.'''
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        return []
+
+
+def import_capture(capture_path: str, root: str, driver_name: str = 'capture') -> list[str]:
+    '''Writes the race packets of a capture file (see capture.py) to sessions in root.'''
+    from capture import CaptureFile
+    recorder = SessionRecorder(root)
+    capture = CaptureFile(capture_path)
+    try:
+        for _, data in capture.records():
+            if len(data) in FastForzaDataPacket.layouts and data[0] == 1:
+                recorder.push(FastForzaDataPacket(bytes(data), driver_name))
+    finally:
+        recorder.flush()
+        capture.close()
+    return recorder.sessions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = 'Columnar session store')
+    commands = parser.add_subparsers(dest = 'command', required = True)
+    importer = commands.add_parser('import', help = 'write the sessions of a capture file')
+    importer.add_argument('capture')
+    importer.add_argument('root')
+    importer.add_argument('--driver', default = 'capture')
+    lister = commands.add_parser('list', help = 'list the sessions in a directory')
+    lister.add_argument('root')
+    query = commands.add_parser('query', help = 'print one channel as CSV')
+    query.add_argument('session')
+    query.add_argument('channel')
+    query.add_argument('--start', type = int)
+    query.add_argument('--end', type = int)
+    query.add_argument('--resolution', type = int, default = 0)
+    args = parser.parse_args()
+    if args.command == 'import':
+        for path in import_capture(args.capture, args.root, args.driver):
+            print(path)
+    elif args.command == 'list':
+        for name in sorted(os.listdir(args.root)):
+            session = SessionReader(os.path.join(args.root, name))
+            print(f'{name}\t{session.samples} samples\t{session.start_ms}-{session.end_ms} ms')
+    else:
+        result = SessionReader(args.session).query(args.channel, args.start, args.end, args.resolution)
+        print(','.join(result))
+        for row in zip(*result.values()):
+            print(','.join(str(value) for value in row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+'''Destinations fed by AsyncForzaIO, each with its own queue.
+
+Every record decoded by AsyncForzaIO is handed to each sink with put(),
+which never blocks: the record is added to the sink's bounded queue, and
+when the queue is full either the oldest queued record or the new one is
+dropped (drop = 'oldest' or 'newest'). Each sink then runs its own task,
+waiting for batch_size records or max_linger seconds and writing them, so
+a slow or failing sink only makes its own queue grow and drop, never delays
+the others. Records are shared between sinks and must not be modified.
+
+    forza_io = AsyncForzaIO(reader, producer = None,
+                            sinks = [EventHubsSink(producer),
+                                     FileSink('telemetry/forza.jsonl'),
+                                     UdpSink('127.0.0.1', 5300, format = 'forza'),
+                                     StdoutSink(batch_size = 1)])
+
+Sink statistics (queued, sent, dropped, failed, batches, lag of the last
+batch, highest lag, write time) are logged with the reader statistics and
+exported as forza_sink_* metrics. Subclass Sink and implement write() to
+add a destination.
+'''
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from typing import TextIO
+
+import metrics
+from forza_package import FastForzaDataPacket
+from logger import create_logger
+from producer import Producer
+
+logger = create_logger(__name__, logging.DEBUG)
+
+# channels only dash (and FH4) packets have
+_DASH_ONLY = frozenset(FastForzaDataPacket.dash_keys) - frozenset(FastForzaDataPacket.sled_keys)
+
+
+class Sink:
+    '''Base class of the sinks: a bounded queue and the task writing it.
+    Args:
+        name (str) default None: name used in logs and metrics, must be unique,
+            the class name without Sink, lowercase, when None.
+        queue_size (int) default 10000: maximum queued records.
+        batch_size (int) default 100: records written at once.
+        max_linger (float) default 0.1: maximum seconds a record waits for a batch to fill.
+        drop (str) default 'oldest': record dropped when the queue is full,
+            'oldest' or 'newest'.
+    '''
+    def __init__(self,
+                 name: str | None = None,
+                 queue_size: int = 10000,
+                 batch_size: int = 100,
+                 max_linger: float = 0.1,
+                 drop: str = 'oldest') -> None:
+        if drop not in ('oldest', 'newest'):
+            raise ValueError(f'unknown drop policy: {drop}')
+        self.name = name or type(self).__name__.removesuffix('Sink').lower()
+        self.batch_size = batch_size
+        self.max_linger = max_linger
+        self.drop = drop
+        self.queue = asyncio.Queue(maxsize = queue_size)
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0 # records of the batches write() raised on
+        self.batches = 0
+        self.lag = 0.0 # seconds the oldest record of the last batch waited
+        self.max_lag = 0.0
+        self.write_seconds = 0.0
+        self._filling = [] # batch being collected by run()
+        metrics.REGISTRY.register(f'sink:{self.name}', self._collect_metrics)
+
+    def put(self, record: dict, now: float | None = None) -> None:
+        '''Queues a record, dropping one when the queue is full. Never blocks.
+        Args:
+            record (dict): record to write.
+            now (float) default None: time.monotonic() of the record, read when None.
+        '''
+        if self.queue.full():
+            self.dropped += 1
+            if self.drop == 'newest':
+                return
+            self.queue.get_nowait()
+        self.queue.put_nowait((time.monotonic() if now is None else now, record))
+
+    async def _get_batch(self) -> list[tuple[float, dict]]:
+        '''Waits for the first record, then for batch_size records or
+           max_linger seconds, whichever comes first.'''
+        loop = asyncio.get_running_loop()
+        # kept on the sink, so close() writes it when run() is cancelled while it fills
+        items = self._filling = [await self.queue.get()]
+        deadline = loop.time() + self.max_linger
+        while len(items) < self.batch_size:
+            if not self.queue.empty():
+                items.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def run(self) -> None:
+        '''Writes the queued records in batches, forever.'''
+        logger.debug('\tStarting %s sink', self.name)
+        while True:
+            items = await self._get_batch()
+            self._filling = []
+            start = time.monotonic()
+            self.lag = start - items[0][0]
+            self.max_lag = max(self.max_lag, self.lag)
+            try:
+                written = await self.write([record for _, record in items])
+                self.sent += len(items) if written is None else written
+            except Exception as e:
+                self.failed += len(items)
+                logger.error('%s sink failed to write %d records: %s', self.name, len(items), e)
+            self.batches += 1
+            self.write_seconds += time.monotonic() - start
+
+    async def write(self, records: list[dict]) -> int | None:
+        '''Writes a batch of records, implemented by subclasses. Returns the
+           number of records actually sent when some were skipped or dropped,
+           None when all were written.'''
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        '''Writes the records still queued and releases the sink resources.'''
+        records = [record for _, record in self._filling]
+        self._filling = []
+        while not self.queue.empty():
+            records.append(self.queue.get_nowait()[1])
+        if records:
+            try:
+                written = await self.write(records)
+                self.sent += len(records) if written is None else written
+            except Exception as e:
+                self.failed += len(records)
+                logger.error('%s sink failed to write %d records: %s', self.name, len(records), e)
+
+    def stats(self) -> dict:
+        '''Returns the sink counters.'''
+        return {'queued': self.queue.qsize(),
+                'sent': self.sent,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'batches': self.batches,
+                'lag': round(self.lag, 4),
+                'max_lag': round(self.max_lag, 4),
+                'write_seconds': round(self.write_seconds, 3)}
+
+    def _collect_metrics(self) -> list:
+        sink = {'sink': self.name}
+        return [('forza_sink_records_total', 'counter', 'Records written, dropped or lost by write errors, per sink',
+                 [({**sink, 'stat': 'sent'}, self.sent),
+                  ({**sink, 'stat': 'dropped'}, self.dropped),
+                  ({**sink, 'stat': 'failed'}, self.failed)]),
+                ('forza_sink_queue_depth', 'gauge', 'Records waiting in the sink queue',
+                 [(sink, self.queue.qsize())]),
+                ('forza_sink_lag_seconds', 'gauge', 'Seconds the oldest record of the last batch waited',
+                 [(sink, self.lag)]),
+                ('forza_sink_write_seconds_total', 'counter', 'Seconds spent writing batches',
+                 [(sink, self.write_seconds)])]
+
+
+class EventHubsSink(Sink):
+    '''Sends records to Azure Event Hubs with a Producer (see producer.py).
+    Args:
+        producer (Producer): producer sending the records.
+        Other arguments as Sink.
+    '''
+    def __init__(self, producer: Producer, **options) -> None:
+        super().__init__(**options)
+        self.producer = producer
+
+    async def write(self, records: list[dict]) -> None:
+        await self.producer.send_events(records)
+
+    async def close(self) -> None:
+        await super().close()
+        await self.producer.close()
+
+
+class FileSink(Sink):
+    '''Appends records as JSON lines to a file, rotated like logging's
+       RotatingFileHandler: path.1 is the newest backup. Files are written by
+       a worker thread, the event loop never waits on the disk.
+    Args:
+        path (str) default 'telemetry/forza.jsonl': file written, its directory
+            is created when needed.
+        max_bytes (int) default 100 MB: size at which the file is rotated, 0 never rotates.
+        backup_count (int) default 5: rotated files kept.
+        Other arguments as Sink.
+    '''
+    def __init__(self,
+                 path: str = os.path.join('telemetry', 'forza.jsonl'),
+                 max_bytes: int = 100 * 1024 * 1024,
+                 backup_count: int = 5,
+                 **options) -> None:
+        super().__init__(**options)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.file = None
+        self.size = 0
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        self.file = open(self.path, 'a', encoding = 'utf-8')
+        self.size = self.file.tell()
+
+    def _rotate(self) -> None:
+        self.file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{index}'):
+                os.replace(f'{self.path}.{index}', f'{self.path}.{index + 1}')
+        if self.backup_count:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def _write(self, text: str) -> None:
+        if self.file is None:
+            self._open()
+        if self.max_bytes and self.size and self.size + len(text) > self.max_bytes:
+            self._rotate()
+        self.file.write(text)
+        self.file.flush()
+        self.size += len(text)
+
+    async def write(self, records: list[dict]) -> None:
+        text = ''.join(json.dumps(record) + '\n' for record in records)
+        await asyncio.to_thread(self._write, text)
+
+    async def close(self) -> None:
+        await super().close()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class UdpSink(Sink):
+    '''Re-broadcasts records over UDP to other telemetry tools, one datagram
+       per record. Datagrams that would block are dropped, only the datagrams
+       sent are counted as sent.
+    Args:
+        host (str): destination address, a broadcast address needs broadcast = True.
+        port (int): destination port.
+        format (str) default 'json': 'json' sends each record as JSON, 'forza'
+            packs packet records back into Forza sled or dash datagrams (channels
+            missing from projected records are zero) and skips other events.
+        broadcast (bool) default False: allow sending to broadcast addresses.
+        Other arguments as Sink, batch_size defaults to 1.
+    '''
+    def __init__(self,
+                 host: str,
+                 port: int,
+                 format: str = 'json',
+                 broadcast: bool = False,
+                 **options) -> None:
+        if format not in ('json', 'forza'):
+            raise ValueError(f'unknown format: {format}')
+        super().__init__(**{'batch_size': 1, **options})
+        self.address = (host, port)
+        self.format = format
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if broadcast:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.sock.setblocking(False)
+
+    def _encode(self, record: dict) -> bytes | None:
+        if self.format == 'json':
+            return json.dumps(record).encode()
+        if 'event_type' in record:
+            return None
+        if not _DASH_ONLY.isdisjoint(record): # FH4 records are sent with the dash layout
+            return FastForzaDataPacket.dash_struct.pack(*[record.get(key, 0) for key in FastForzaDataPacket.dash_keys])
+        return FastForzaDataPacket.sled_struct.pack(*[record.get(key, 0) for key in FastForzaDataPacket.sled_keys])
+
+    async def write(self, records: list[dict]) -> int:
+        sent = 0
+        for record in records:
+            data = self._encode(record)
+            if data is None:
+                continue
+            try:
+                self.sock.sendto(data, self.address)
+                sent += 1
+            except BlockingIOError:
+                self.dropped += 1
+        return sent
+
+    async def close(self) -> None:
+        await super().close()
+        self.sock.close()
+
+
+class StdoutSink(Sink):
+    '''Prints records as JSON lines, from a worker thread.
+    Args:
+        stream (TextIO) default sys.stdout: stream written.
+        Other arguments as Sink.
+    '''
+    def __init__(self, stream: TextIO | None = None, **options) -> None:
+        super().__init__(**options)
+        self.stream = stream or sys.stdout
+
+    def _write(self, text: str) -> None:
+        self.stream.write(text)
+        self.stream.flush()
+
+    async def write(self, records: list[dict]) -> None:
+        await asyncio.to_thread(self._write, ''.join(json.dumps(record) + '\n' for record in records))
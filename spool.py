@@ -0,0 +1,198 @@
+'''Memory-bounded event buffer that spills to a disk journal.
+
+SpillBuffer sits between the reader and the producer. Up to max_items events
+are kept in memory; beyond that, events are appended to segment files in
+journal_dir (JSON lines, one [enqueue time, event] pair per line) and read
+back, oldest segment first, once the memory part has drained. Events keep
+their order: while the journal is not empty new events go to the journal,
+and batches handed back with requeue() go in front of everything else.
+Segments left by a previous run are drained before new events.
+
+It implements the parts of the asyncio.Queue interface used by
+ForzaDatagramProtocol and AsyncForzaIO, and put_nowait() never blocks or
+drops, so the reader is never slowed down by slow uploads.
+'''
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+
+from logger import create_logger
+
+logger = create_logger(__name__, logging.DEBUG)
+
+_FIRST_SEQUENCE = 10 ** 9 # segments handed back with requeue() get lower numbers
+
+
+class SpillBuffer:
+    '''FIFO of events bounded in memory and spilled to disk when full.
+    Args:
+        max_items (int) default 10000: events kept in memory.
+        journal_dir (str) default 'spool': directory of the segment files.
+        segment_bytes (int) default 4 MB: size at which a new segment is started.
+    '''
+    def __init__(self,
+                 max_items: int = 10000,
+                 journal_dir: str = 'spool',
+                 segment_bytes: int = 4 * 1024 * 1024) -> None:
+        if max_items < 1:
+            raise ValueError('max_items must be at least 1')
+        self.max_items = max_items
+        self.refill_below = max(1, max_items // 2) # memory size at which a segment is read back
+        self.journal_dir = journal_dir
+        self.segment_bytes = segment_bytes
+        self.memory = deque() # (enqueue time, event)
+        self.segments = deque() # sequence numbers, oldest first
+        self.journal_bytes = 0 # bytes waiting on disk
+        self.spilled_bytes = 0 # bytes written to disk since start
+        self.requeued = 0 # events handed back with requeue() since start
+        self._writer = None
+        self._writer_sequence = None
+        self._event = asyncio.Event()
+        os.makedirs(journal_dir, exist_ok = True)
+        for name in sorted(os.listdir(journal_dir)):
+            if name.endswith('.seg'):
+                self.segments.append(int(name[:-4]))
+                self.journal_bytes += os.path.getsize(self._path(int(name[:-4])))
+        if self.segments:
+            logger.info(f'{len(self.segments)} journal segments ({self.journal_bytes} bytes) '
+                        f'left in {journal_dir} will be sent first')
+            self._refill()
+
+    def _path(self, sequence: int) -> str:
+        return os.path.join(self.journal_dir, f'{sequence:012d}.seg')
+
+    def _write(self, sequence: int, items, mode: str = 'a') -> int:
+        lines = ''.join(json.dumps(item, separators = (',', ':')) + '\n' for item in items)
+        data = lines.encode('utf-8')
+        if sequence == self._writer_sequence:
+            self._writer.write(data)
+        else:
+            with open(self._path(sequence), mode + 'b') as segment:
+                segment.write(data)
+        self.journal_bytes += len(data)
+        self.spilled_bytes += len(data)
+        return len(data)
+
+    def _spill(self, items: list) -> None:
+        '''Appends items to the newest segment.'''
+        if self._writer is None or self._writer.tell() >= self.segment_bytes:
+            self._close_writer()
+            self._writer_sequence = self.segments[-1] + 1 if self.segments else _FIRST_SEQUENCE
+            self.segments.append(self._writer_sequence)
+            self._writer = open(self._path(self._writer_sequence), 'ab')
+            if len(self.segments) == 1:
+                logger.warning(f'Buffer full, spilling events to {self.journal_dir}')
+        self._write(self._writer_sequence, items)
+
+    def _close_writer(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = self._writer_sequence = None
+
+    def _refill(self) -> None:
+        '''Moves the oldest segment back to memory once half of it is free.'''
+        while self.segments and len(self.memory) < self.refill_below:
+            sequence = self.segments.popleft()
+            if sequence == self._writer_sequence:
+                self._close_writer()
+            path = self._path(sequence)
+            self.journal_bytes -= os.path.getsize(path)
+            with open(path, 'rb') as segment:
+                for line in segment:
+                    try:
+                        enqueued, event = json.loads(line)
+                    except ValueError:
+                        logger.error(f'Skipping corrupted line in {path}')
+                        continue
+                    self.memory.append((enqueued, event))
+            os.remove(path)
+            if not self.segments:
+                logger.info('Journal drained')
+
+    def put_nowait(self, event) -> None:
+        '''Adds an event, spilling it to disk when memory is full. Never blocks.'''
+        if self.segments or len(self.memory) >= self.max_items:
+            self._spill([(time.time(), event)])
+        else:
+            self.memory.append((time.time(), event))
+        self._event.set()
+
+    def requeue(self, events: list) -> None:
+        '''Puts events back in front of the buffer, e.g. after a failed send.'''
+        now = time.time()
+        self.requeued += len(events)
+        self.memory.extendleft((now, event) for event in reversed(events))
+        overflow = len(self.memory) - self.max_items
+        if overflow > 0:
+            # the newest events in memory are still older than the journal
+            sequence = self.segments[0] - 1 if self.segments else _FIRST_SEQUENCE
+            items = [self.memory.pop() for _ in range(overflow)]
+            items.reverse()
+            self._write(sequence, items, 'w')
+            self.segments.appendleft(sequence)
+        self._event.set()
+
+    def full(self) -> bool:
+        return False
+
+    def empty(self) -> bool:
+        return not self.memory and not self.segments
+
+    def qsize(self) -> int:
+        return len(self.memory)
+
+    def get_nowait(self):
+        '''Removes and returns the oldest event, raises asyncio.QueueEmpty if none.'''
+        if not self.memory:
+            self._refill()
+            if not self.memory:
+                raise asyncio.QueueEmpty
+        event = self.memory.popleft()[1]
+        if self.segments and len(self.memory) < self.refill_below:
+            self._refill()
+        return event
+
+    async def get(self):
+        '''Removes and returns the oldest event, waiting for one if needed.
+           Always yields to the event loop, so a consumer handing events back
+           with requeue() cannot starve the other tasks.'''
+        while self.empty():
+            self._event.clear()
+            await self._event.wait()
+        await asyncio.sleep(0)
+        return self.get_nowait()
+
+    def age(self) -> float:
+        '''Seconds since the oldest buffered event was enqueued. Reads only
+           the first line of the oldest segment when memory is empty.'''
+        if self.memory:
+            return time.time() - self.memory[0][0]
+        for sequence in self.segments:
+            if sequence == self._writer_sequence:
+                self._writer.flush()
+            with open(self._path(sequence), 'rb') as segment:
+                line = segment.readline()
+            try:
+                return time.time() - json.loads(line)[0]
+            except ValueError:
+                continue
+        return 0.0
+
+    def stats(self) -> dict:
+        return {'depth': len(self.memory),
+                'journal_segments': len(self.segments),
+                'journal_bytes': self.journal_bytes,
+                'spilled_bytes': self.spilled_bytes,
+                'age': self.age()}
+
+    def close(self) -> None:
+        '''Writes events still in memory to the journal, so they are sent on the next run.'''
+        if self.memory:
+            sequence = self.segments[0] - 1 if self.segments else _FIRST_SEQUENCE
+            self._write(sequence, list(self.memory), 'w')
+            self.segments.appendleft(sequence)
+            self.memory.clear()
+        self._close_writer()
@@ -0,0 +1,223 @@
+'''Synthetic Forza telemetry generator.
+
+Generates valid sled, dash and FH4 length datagrams, using the layouts from
+ForzaDataPacket, for cars lapping an oval track with smoothly varying
+channels, and sends them over UDP so the pipeline can be load tested without
+a console running Forza.
+
+Usage:
+    python synthetic.py [--host 127.0.0.1] [--port 6667] [--rigs 1] [--rate 60]
+                        [--format dash] [--seconds 0]
+
+Every rig sends from its own socket (its own source port). cur_race_time is
+the number of seconds since the sender base time, which benchmarks use to
+measure latency from send to Producer.
+'''
+import argparse
+import math
+import random
+import socket
+import time
+
+from forza_package import FastForzaDataPacket
+
+# struct code -> (minimum, maximum) of integer fields
+_INT_RANGES = {'i': (-2**31, 2**31 - 1), 'I': (0, 2**32 - 1), 'H': (0, 2**16 - 1),
+               'B': (0, 255), 'b': (-128, 127)}
+_WHEELS = ('FL', 'FR', 'RL', 'RR')
+
+
+class SyntheticRig:
+    '''Simulated car lapping an oval track.
+    Args:
+        packet_format (str) default 'dash': 'sled', 'dash' or 'fh4'.
+        seed (int) default None: seed for the car specific variations.
+        track_length (float) default 4000.0: lap length in meters.
+        incident_interval (float) default 20.0: mean seconds between short 
+            incidents (collisions and brake lockups), 0 disables them.
+    '''
+    def __init__(self,
+                 packet_format: str = 'dash',
+                 seed: int | None = None,
+                 track_length: float = 4000.0,
+                 incident_interval: float = 20.0) -> None:
+        if packet_format not in ('sled', 'dash', 'fh4'):
+            raise ValueError(f'unknown packet format: {packet_format}')
+        self.packet_format = packet_format
+        self.random = random.Random(seed)
+        self.track_length = track_length
+        self.pace = self.random.uniform(0.9, 1.1)
+        self.phase = self.random.uniform(0, 2 * math.pi)
+        self.car_ordinal = self.random.randint(2000, 3000)
+        if packet_format == 'sled':
+            self.struct = FastForzaDataPacket.sled_struct
+            self.keys = FastForzaDataPacket.sled_keys
+        else:
+            self.struct = FastForzaDataPacket.dash_struct
+            self.keys = FastForzaDataPacket.dash_keys
+        codes = self.struct.format.lstrip('<')
+        self.ranges = [_INT_RANGES.get(code) for code in codes]
+        self.prefix = bytes(FastForzaDataPacket.FH4_OFFSET) if packet_format == 'fh4' else b''
+        self.best_lap_time = 0.0
+        self.last_lap_time = 0.0
+        self.lap_start = 0.0
+        self.lap_no = 0
+        self.distance = 0.0
+        self.last_t = 0.0
+        self.incident_interval = incident_interval
+        self.incident = None
+        self.incident_end = 0.0
+
+    def speed(self, lap_fraction: float) -> float:
+        '''Speed in m/s: fast on the straights, slow in the two corners.'''
+        return self.pace * (45 + 20 * math.cos(4 * math.pi * lap_fraction + self.phase))
+
+    def channels(self, t: float) -> dict:
+        '''Returns the channel values at t seconds since the race start.'''
+        lap_fraction = (self.distance % self.track_length) / self.track_length
+        speed = self.speed(lap_fraction)
+        dt = max(0.0, t - self.last_t)
+        self.distance += speed * dt
+        self.last_t = t
+        if self.incident and t >= self.incident_end:
+            self.incident = None
+        if (not self.incident and self.incident_interval
+                and self.random.random() < dt / self.incident_interval):
+            self.incident = self.random.choice(('collision', 'lockup'))
+            self.incident_end = t + self.random.uniform(0.05, 0.3)
+        lap_no = int(self.distance // self.track_length)
+        if lap_no != self.lap_no:
+            self.last_lap_time = t - self.lap_start
+            if not self.best_lap_time or self.last_lap_time < self.best_lap_time:
+                self.best_lap_time = self.last_lap_time
+            self.lap_start = t
+            self.lap_no = lap_no
+        lap_fraction = (self.distance % self.track_length) / self.track_length
+        angle = 2 * math.pi * lap_fraction
+        radius = self.track_length / (2 * math.pi)
+        # dv/dt = dv/ds * v
+        acceleration = -80 * math.pi * self.pace / self.track_length * math.sin(4 * math.pi * lap_fraction + self.phase) * speed
+        gear = min(6, 1 + int(speed / 12))
+        rpm = 1000 + (speed % 12) / 12 * 5500 + gear * 100
+        noise = self.random.gauss
+        values = {
+            'is_race_on': 1,
+            'timestamp_ms': int(t * 1000),
+            'engine_max_rpm': 8000.0, 'engine_idle_rpm': 900.0, 'current_engine_rpm': rpm,
+            'acceleration_x': speed * speed / radius * 0.3 + noise(0, 0.2),
+            'acceleration_y': noise(0, 0.1),
+            'acceleration_z': acceleration + noise(0, 0.2),
+            'velocity_x': speed * -math.sin(angle), 'velocity_y': 0.0, 'velocity_z': speed * math.cos(angle),
+            'angular_velocity_x': noise(0, 0.01), 'angular_velocity_y': speed / radius,
+            'angular_velocity_z': noise(0, 0.01),
+            'yaw': angle - math.pi, 'pitch': noise(0, 0.005), 'roll': noise(0, 0.005),
+            'car_ordinal': self.car_ordinal,
+            'car_class': 5, 'car_performance_index': 800, 'drivetrain_type': 2, 'num_cylinders': 8,
+            'position_x': radius * math.cos(angle), 'position_y': 5 * math.sin(angle),
+            'position_z': radius * math.sin(angle),
+            'speed': speed, 'power': max(0.0, 300000 * acceleration / 10), 'torque': rpm / 20,
+            'boost': 0.0, 'fuel': max(0.0, 1 - self.distance / 200000), 'dist_traveled': self.distance,
+            'best_lap_time': self.best_lap_time, 'last_lap_time': self.last_lap_time,
+            'cur_lap_time': t - self.lap_start, 'cur_race_time': t,
+            'lap_no': self.lap_no, 'race_pos': 1,
+            'accel': 255 if acceleration >= 0 else 0, 'brake': 0 if acceleration >= 0 else 200,
+            'clutch': 0, 'handbrake': 0, 'gear': gear,
+            'steer': int(40 * math.sin(4 * math.pi * lap_fraction + self.phase)),
+            'norm_driving_line': 0, 'norm_ai_brake_diff': 0,
+        }
+        temperature = 170 + 30 * (1 - math.exp(-t / 300))
+        for i, wheel in enumerate(_WHEELS):
+            bump = 0.5 + 0.1 * math.sin(t * 7 + i) + noise(0, 0.01)
+            values[f'norm_suspension_travel_{wheel}'] = bump
+            values[f'suspension_travel_meters_{wheel}'] = bump / 10
+            values[f'tire_slip_ratio_{wheel}'] = noise(0, 0.02)
+            values[f'tire_slip_angle_{wheel}'] = noise(0, 0.02)
+            values[f'tire_combined_slip_{wheel}'] = abs(noise(0, 0.03))
+            values[f'wheel_rotation_speed_{wheel}'] = speed / 0.33
+            values[f'wheel_on_rumble_strip_{wheel}'] = 1.0 if 0.24 < lap_fraction < 0.25 else 0.0
+            values[f'wheel_in_puddle_{wheel}'] = 0.0
+            values[f'surface_rumble_{wheel}'] = 0.0
+            values[f'tire_temp_{wheel}'] = temperature + 5 * (i % 2) + noise(0, 0.1)
+        if self.incident == 'collision':
+            values['acceleration_x'] += noise(0, 30)
+            values['acceleration_z'] -= abs(noise(0, 40))
+        elif self.incident == 'lockup':
+            values['brake'] = 255
+            values['accel'] = 0
+            values['acceleration_z'] -= 12
+            for wheel in _WHEELS[:2]:
+                values[f'tire_slip_ratio_{wheel}'] = -1.0
+                values[f'tire_combined_slip_{wheel}'] = 1.0
+        return values
+
+    def datagram(self, t: float) -> bytes:
+        '''Returns the datagram for t seconds since the race start.'''
+        channels = self.channels(t)
+        values = []
+        for key, value_range in zip(self.keys, self.ranges):
+            value = channels.get(key, 0)
+            if value_range is not None:
+                value = min(max(int(value), value_range[0]), value_range[1])
+            values.append(value)
+        return self.prefix + self.struct.pack(*values)
+
+
+def send(host: str,
+         ports: list[int] | int,
+         rigs: int = 1,
+         rate: float = 60,
+         seconds: float = 0,
+         packet_format: str = 'dash',
+         base: float | None = None) -> int:
+    '''Sends datagrams from rigs simulated cars over UDP.
+    Args:
+        host (str): destination address.
+        ports (list[int] | int): destination port, or one port per rig (used round robin).
+        rigs (int) default 1: number of simulated cars, each one with its own socket.
+        rate (float) default 60: packets per second sent by each rig.
+        seconds (float) default 0: how long to send for, 0 sends forever.
+        packet_format (str) default 'dash': 'sled', 'dash' or 'fh4'.
+        base (float) default None: time.monotonic() value used as race start.
+    Returns:
+        int: number of datagrams sent.
+    '''
+    if isinstance(ports, int):
+        ports = [ports]
+    base = time.monotonic() if base is None else base
+    cars = [SyntheticRig(packet_format, seed = i) for i in range(rigs)]
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(rigs)]
+    addresses = [(host, ports[i % len(ports)]) for i in range(rigs)]
+    interval = 1 / rate
+    sent = 0
+    next_send = time.monotonic()
+    end = next_send + seconds if seconds else math.inf
+    try:
+        while next_send < end:
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            for car, sock, address in zip(cars, sockets, addresses):
+                sock.sendto(car.datagram(time.monotonic() - base), address)
+            sent += rigs
+            next_send += interval
+    finally:
+        for sock in sockets:
+            sock.close()
+    return sent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Sends synthetic Forza telemetry over UDP')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, nargs = '+', default = [6667])
+    parser.add_argument('--rigs', type = int, default = 1)
+    parser.add_argument('--rate', type = float, default = 60)
+    parser.add_argument('--format', choices = ('sled', 'dash', 'fh4'), default = 'dash')
+    parser.add_argument('--seconds', type = float, default = 0)
+    args = parser.parse_args()
+    print(f'Sending {args.format} packets from {args.rigs} rigs at {args.rate} Hz to {args.host}:{args.port}')
+    try:
+        count = send(args.host, args.port, args.rigs, args.rate, args.seconds, args.format)
+        print(f'{count} datagrams sent')
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,23 @@
+import asyncio
+import faulthandler
+import os
+import sys
+
+import pytest
+
+# modules live at the repository root, like for the benchmarks
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def run_async():
+    '''Runs a coroutine with a timeout. A task spinning without yielding cannot
+       be cancelled, so the process is also ended, with the stacks dumped, when
+       the timeout passes twice.'''
+    def run(coroutine, timeout: float = 10):
+        faulthandler.dump_traceback_later(2 * timeout, exit = True)
+        try:
+            return asyncio.run(asyncio.wait_for(coroutine, timeout))
+        finally:
+            faulthandler.cancel_dump_traceback_later()
+    return run
@@ -0,0 +1,130 @@
+import pytest
+
+from capture import FILE_HEADER, CaptureFile, CaptureWriter, ReplayForzaDataReader
+from forza_package import read_header
+from synthetic import SyntheticRig
+
+T0 = 1_700_000_000_000_000_000 # receive time of the first datagram, ns
+
+
+def write_capture(path, sessions = 2, packets = 300, index_interval = 60):
+    '''Writes sessions of packets datagrams at 60 Hz, each starting at timestamp_ms 0.
+    Returns:
+        list of (receive time ns, datagram) written.'''
+    written = []
+    writer = CaptureWriter(str(path), index_interval = index_interval)
+    recv_time = T0
+    for session in range(sessions):
+        rig = SyntheticRig('dash', seed = session, incident_interval = 0)
+        for i in range(packets):
+            data = rig.datagram(i / 60)
+            writer.write(data, recv_time)
+            written.append((recv_time, data))
+            recv_time += 16_666_667
+    writer.close()
+    return written
+
+
+def test_records_round_trip(tmp_path):
+    written = write_capture(tmp_path / 'session.cap')
+    capture = CaptureFile(str(tmp_path / 'session.cap'))
+    try:
+        assert [(recv_time, bytes(data)) for recv_time, data in capture.records()] == written
+        assert len(capture.sessions) == 2
+    finally:
+        capture.close()
+
+
+def test_offset_at_time_seeks_with_the_index(tmp_path):
+    written = write_capture(tmp_path / 'session.cap')
+    capture = CaptureFile(str(tmp_path / 'session.cap'))
+    try:
+        for position in (0, 1, 59, 60, 61, 299, 300, 599):
+            recv_time = written[position][0]
+            records = list(capture.records(capture.offset_at_time(recv_time)))
+            assert records[0][0] == recv_time
+            assert len(records) == len(written) - position
+            # between two records, the next one is returned
+            records = list(capture.records(capture.offset_at_time(recv_time - 1)))
+            assert records[0][0] == recv_time
+        assert list(capture.records(capture.offset_at_time(written[-1][0] + 1))) == []
+    finally:
+        capture.close()
+
+
+def test_offset_at_timestamp_in_each_session(tmp_path):
+    written = write_capture(tmp_path / 'session.cap')
+    capture = CaptureFile(str(tmp_path / 'session.cap'))
+    try:
+        for session, first in ((0, 0), (1, 300), (-1, 300)):
+            for timestamp_ms in (0, 1000, 2500):
+                recv_time, data = next(capture.records(capture.offset_at_timestamp(timestamp_ms, session)))
+                assert read_header(data)[1] >= timestamp_ms
+                position = [recv for recv, _ in written].index(recv_time)
+                assert first <= position < first + 300
+                previous = written[position - 1][1]
+                assert position == first or read_header(previous)[1] < timestamp_ms
+    finally:
+        capture.close()
+
+
+def test_appending_starts_a_new_session(tmp_path):
+    path = tmp_path / 'session.cap'
+    write_capture(path, sessions = 1, packets = 10)
+    write_capture(path, sessions = 1, packets = 10)
+    capture = CaptureFile(str(path))
+    try:
+        assert [entry.session for entry in capture.sessions] == [0, 1]
+        assert len(list(capture.records())) == 20
+    finally:
+        capture.close()
+
+
+def test_truncated_last_record_is_ignored(tmp_path):
+    path = tmp_path / 'session.cap'
+    written = write_capture(path, sessions = 1, packets = 10)
+    with open(path, 'r+b') as capture_file:
+        capture_file.truncate(path.stat().st_size - 5)
+    capture = CaptureFile(str(path))
+    try:
+        assert len(list(capture.records())) == len(written) - 1
+    finally:
+        capture.close()
+
+
+def test_capture_without_records(tmp_path):
+    path = tmp_path / 'empty.cap'
+    CaptureWriter(str(path)).close()
+    capture = CaptureFile(str(path))
+    try:
+        assert list(capture.records()) == []
+        assert capture.sessions == []
+        assert capture.offset_at_time(T0) == len(FILE_HEADER)
+        assert capture.offset_at_timestamp(1000) == len(FILE_HEADER)
+    finally:
+        capture.close()
+    reader = ReplayForzaDataReader(str(path), 'test', speed = 0, filter_rate = 0)
+    reader.start()
+    assert list(reader.read()) == []
+    reader.stop()
+
+
+def test_empty_file_is_not_a_capture(tmp_path):
+    path = tmp_path / 'empty.cap'
+    path.write_bytes(b'')
+    with pytest.raises(ValueError, match = 'not a capture file'):
+        CaptureFile(str(path))
+    path.write_bytes(b'not a capture')
+    with pytest.raises(ValueError, match = 'not a capture file'):
+        CaptureFile(str(path))
+
+
+def test_replay_decodes_every_packet(tmp_path):
+    path = tmp_path / 'session.cap'
+    written = write_capture(path, sessions = 1, packets = 120)
+    reader = ReplayForzaDataReader(str(path), 'test', speed = 0, filter_rate = 0)
+    reader.start()
+    packets = list(reader.read())
+    reader.stop()
+    assert len(packets) == len(written)
+    assert packets[0].driver_name == 'test'
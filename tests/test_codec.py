@@ -0,0 +1,88 @@
+import math
+import zlib
+
+import pytest
+
+import codec
+from synthetic import SyntheticRig
+from forza_package import FastForzaDataPacket
+
+
+def round_trip(events, compress_payload = True):
+    return codec.decode_batch(codec.encode_batch(events, compress_payload = compress_payload))
+
+
+@pytest.mark.parametrize('packet_format', ['sled', 'dash', 'fh4'])
+def test_packet_round_trip(packet_format):
+    rig = SyntheticRig(packet_format, seed = 1)
+    events = [FastForzaDataPacket(rig.datagram(i / 60), 'test').to_dict() for i in range(300)]
+    assert round_trip(events) == events
+
+
+@pytest.mark.parametrize('compress_payload', [True, False])
+def test_column_types_round_trip(compress_payload):
+    events = [{'f32': 0.5 * i, # exact in float32
+               'f64': 0.1 * i,
+               'int': i * 1000 - 50000,
+               'big': 2 ** 62 + i, # beyond the delta encoded range
+               'flag': i % 2 == 0,
+               'name': f'driver{i % 3}',
+               'mixed': [i, 'x'] if i % 2 else None}
+              for i in range(50)]
+    assert round_trip(events, compress_payload) == events
+
+
+def test_float_special_values():
+    values = [0.0, -0.0, math.inf, -math.inf, 1e-310, 3.4e38, math.nan]
+    decoded = round_trip([{'value': value} for value in values])
+    for event, value in zip(decoded, values):
+        if math.isnan(value):
+            assert math.isnan(event['value'])
+        else:
+            assert event['value'] == value
+            assert math.copysign(1, event['value']) == math.copysign(1, value)
+
+
+def test_missing_keys_keep_order():
+    events = [{'a': 1, 'b': 2.5}, {'a': 2}, {'c': 'x'}, {}, {'b': 1.5, 'a': 3}]
+    assert round_trip(events) == events
+
+
+def test_empty_batch():
+    assert round_trip([]) == []
+    assert round_trip([{}, {}]) == [{}, {}]
+
+
+def test_unicode_key():
+    events = [{'pilote_numéro': 1, '速度': 2.0}]
+    assert round_trip(events) == events
+
+
+def test_key_of_255_bytes():
+    events = [{'k' * 255: 1}]
+    assert round_trip(events) == events
+
+
+def test_key_longer_than_255_bytes():
+    with pytest.raises(ValueError, match = '255 bytes'):
+        codec.encode_batch([{'k' * 256: 1}])
+    with pytest.raises(ValueError):
+        codec.encode_batch([{'é' * 128: 1}]) # 256 bytes once encoded
+
+
+def test_payload_header():
+    payload = codec.encode_batch([{'a': 1}], compress_payload = False)
+    assert payload[:3] == codec.MAGIC
+    assert payload[3] == codec.SCHEMA_VERSION
+    assert payload[4] == 0
+    compressed = codec.encode_batch([{'a': 1}])
+    assert compressed[4] & codec.FLAG_ZLIB
+    assert zlib.decompress(compressed[5:]) == payload[5:]
+
+
+def test_rejects_other_payloads():
+    payload = codec.encode_batch([{'a': 1}])
+    with pytest.raises(ValueError, match = 'not a forza columnar batch'):
+        codec.decode_batch(b'XYZ' + payload[3:])
+    with pytest.raises(ValueError, match = 'unsupported schema version'):
+        codec.decode_batch(payload[:3] + bytes([codec.SCHEMA_VERSION + 1]) + payload[4:])
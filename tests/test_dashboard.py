@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+from dashboard import DashboardServer, _Client
+
+
+def test_update_keeps_the_latest_record_per_driver_and_event():
+    dashboard = DashboardServer(port = 0, fields = ['speed'])
+    dashboard.update({'driver_name': 'alice', 'speed': 1.0, 'gear': 3})
+    dashboard.update({'driver_name': 'alice', 'speed': 2.0, 'gear': 3})
+    dashboard.update({'driver_name': 'alice', 'event_type': 'lap_summary', 'lap_no': 1})
+    dashboard.update({'driver_name': 'bob', 'speed': 5.0})
+    records = {key: entry[1] for key, entry in dashboard.latest.items()}
+    assert records == {('alice', 'state'): {'speed': 2.0, 'driver_name': 'alice'},
+                       ('alice', 'lap_summary'): {'driver_name': 'alice', 'event_type': 'lap_summary', 'lap_no': 1},
+                       ('bob', 'state'): {'speed': 5.0, 'driver_name': 'bob'}}
+
+
+def test_frames_are_coalesced_per_client():
+    dashboard = DashboardServer(port = 0)
+    everyone = _Client(None, 0.1, None)
+    bob = _Client(None, 0.1, 'bob')
+    dashboard.update({'driver_name': 'alice', 'speed': 1.0})
+    dashboard.update({'driver_name': 'bob', 'speed': 5.0})
+    assert len(dashboard._frames(everyone)) == 2
+    assert dashboard._frames(bob) == [b'event: state\ndata: {"driver_name": "bob", "speed": 5.0}\n\n']
+    everyone.seen = bob.seen = dashboard.version
+    for speed in range(3):
+        dashboard.update({'driver_name': 'alice', 'speed': float(speed)})
+    frames = dashboard._frames(everyone)
+    assert frames == [b'event: state\ndata: {"driver_name": "alice", "speed": 2.0}\n\n']
+    assert dashboard._frames(bob) == []
+
+
+async def request(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+    await writer.drain()
+    return reader, writer
+
+
+def test_state_and_events_over_http(run_async):
+    dashboard = DashboardServer(port = 0, max_rate = 100)
+
+    async def scenario():
+        server = await asyncio.start_server(dashboard._handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        dashboard.update({'driver_name': 'alice', 'speed': 1.0})
+        reader, writer = await request(port, '/state')
+        response = await reader.read()
+        assert response.startswith(b'HTTP/1.1 200 OK')
+        assert json.loads(response.split(b'\r\n\r\n', 1)[1]) == [{'driver_name': 'alice', 'speed': 1.0}]
+        writer.close()
+
+        reader, writer = await request(port, '/events?hz=50&driver=alice')
+        assert (await reader.readuntil(b'\r\n\r\n')).startswith(b'HTTP/1.1 200 OK')
+        assert await reader.readuntil(b'\n\n') == b'event: state\ndata: {"driver_name": "alice", "speed": 1.0}\n\n'
+        dashboard.update({'driver_name': 'bob', 'speed': 5.0})
+        dashboard.update({'driver_name': 'alice', 'speed': 2.0})
+        assert await reader.readuntil(b'\n\n') == b'event: state\ndata: {"driver_name": "alice", "speed": 2.0}\n\n'
+        assert len(dashboard.clients) == 1
+        writer.close()
+
+        reader, writer = await request(port, '/missing')
+        assert (await reader.read()).startswith(b'HTTP/1.1 404')
+        writer.close()
+        server.close()
+
+    run_async(scenario())
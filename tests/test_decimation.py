@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+from decimation import Decimator, Deadband, DropAll, EveryNth, MinMaxWindow, TimeRate
+
+
+def packet(timestamp_ms, **channels):
+    return SimpleNamespace(timestamp_ms = timestamp_ms, **channels)
+
+
+def admitted(decimator, timestamps):
+    return [timestamp for timestamp in timestamps if decimator.admit(timestamp)]
+
+
+def test_base_and_drop_all():
+    p = packet(0)
+    assert Decimator().admit(0) and Decimator().push(p) == [p] and Decimator().flush() == []
+    assert admitted(DropAll(), range(0, 1000, 16)) == []
+
+
+def test_every_nth_skips_the_first_n():
+    assert admitted(EveryNth(3), range(10)) == [3, 6, 9]
+    assert admitted(EveryNth(1), range(4)) == [1, 2, 3]
+    assert admitted(EveryNth(0), range(4)) == [0, 1, 2, 3]
+
+
+def test_time_rate_keeps_the_target_rate():
+    timestamps = [round(i * 1000 / 60) for i in range(600)] # 10 s at 60 Hz
+    kept = admitted(TimeRate(hz = 10), timestamps)
+    assert len(kept) == 100
+    assert all(95 <= b - a <= 117 for a, b in zip(kept, kept[1:]))
+
+
+def test_time_rate_restarts_on_reset_and_gaps():
+    decimator = TimeRate(hz = 10)
+    assert admitted(decimator, [1000, 1050, 1100]) == [1000, 1100]
+    assert decimator.admit(20) # timestamp_ms reset by the game
+    assert not decimator.admit(70)
+    assert decimator.admit(5000) # gap in the stream
+    assert not decimator.admit(5050)
+    assert decimator.admit(5100)
+
+
+def test_deadband_keeps_changes_and_heartbeats():
+    decimator = Deadband({'speed': 1.0}, max_interval_ms = 500)
+    kept = []
+    for timestamp_ms, speed in [(0, 10.0), (16, 10.5), (33, 11.2), (50, 11.0), (600, 11.0), (616, 11.5), (700, 9.0)]:
+        kept += [p.timestamp_ms for p in decimator.push(packet(timestamp_ms, speed = speed))]
+    # 33 changed by 1.2, 600 is a heartbeat, 700 changed by 2.0
+    assert kept == [0, 33, 600, 700]
+
+
+def test_deadband_restarts_when_timestamp_goes_back():
+    decimator = Deadband({'speed': 1.0})
+    assert decimator.push(packet(1000, speed = 10.0))
+    assert decimator.push(packet(1016, speed = 10.0)) == []
+    assert decimator.push(packet(10, speed = 10.0)) # new session
+
+
+def test_deadband_ignores_missing_channels():
+    decimator = Deadband({'speed': 1.0, 'gear': 1})
+    assert decimator.push(packet(0, speed = 10.0))
+    assert decimator.push(packet(16, speed = 10.2)) == []
+
+
+def test_min_max_window_keeps_extremes_in_order():
+    decimator = MinMaxWindow(100, ['speed'])
+    speeds = [5, 9, 1, 4, 3, 7]
+    emitted = []
+    for i, speed in enumerate(speeds):
+        emitted += decimator.push(packet(i * 20, speed = speed))
+    # window [0, 100) holds 5 samples, 100 opens the next one
+    assert [(p.timestamp_ms, p.speed) for p in emitted] == [(0, 5), (20, 9), (40, 1)]
+    assert [(p.timestamp_ms, p.speed) for p in decimator.flush()] == [(100, 7)]
+    assert decimator.flush() == []
+
+
+def test_min_max_window_emits_a_packet_once():
+    decimator = MinMaxWindow(100, ['speed', 'rpm'])
+    first = packet(0, speed = 10, rpm = 9000) # first, max speed and max rpm
+    decimator.push(first)
+    decimator.push(packet(50, speed = 5, rpm = 1000))
+    assert [p.timestamp_ms for p in decimator.flush()] == [0, 50]
+
+
+def test_min_max_window_closes_when_timestamp_goes_back():
+    decimator = MinMaxWindow(100, ['speed'])
+    decimator.push(packet(1000, speed = 1))
+    assert [p.timestamp_ms for p in decimator.push(packet(10, speed = 2))] == [1000]
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+from delta import DeltaTracker, ReferenceLap
+
+LENGTH = 1000.0 # meters of a straight lap along x
+
+
+def packet(lap_no, cur_lap_time, x, last_lap_time = 0.0, packet_format = 'fh4'):
+    return SimpleNamespace(packet_format = packet_format, driver_name = 'alice', lap_no = lap_no,
+                           cur_lap_time = cur_lap_time, last_lap_time = last_lap_time,
+                           position_x = x, position_z = 0.0, dist_traveled = lap_no * LENGTH + x)
+
+
+def lap(tracker, lap_no, lap_time, last_lap_time = 0.0, samples = 100):
+    '''Drives one lap at constant speed and returns its packets.'''
+    packets = [packet(lap_no, i * lap_time / samples, i * LENGTH / samples, last_lap_time)
+               for i in range(samples)]
+    for lap_packet in packets:
+        assert tracker.push(lap_packet) == []
+    return packets
+
+
+def delta_at(packets, x):
+    [middle] = [lap_packet for lap_packet in packets if lap_packet.position_x == x]
+    return middle.extras['delta_best']
+
+
+def test_reference_lap_time_at():
+    reference = ReferenceLap([0.0, 10.0, 20.0], [0.0, 0.0, 0.0], [0.0, 10.0, 20.0], [0.0, 1.0, 2.0], 2.0)
+    assert reference.time_at(15.0, 1.0) == 1.5
+    assert reference.time_at(10.0, 0.0, distance = 10.0) == 1.0
+    assert reference.time_at(1000.0, 1000.0) is None # beyond the searched cells
+
+
+def test_no_delta_before_a_complete_lap():
+    tracker = DeltaTracker()
+    packets = lap(tracker, 0, 60.0)
+    assert tracker.reference is None
+    assert not any(hasattr(lap_packet, 'extras') for lap_packet in packets)
+
+
+def test_faster_lap_swaps_the_reference_and_delta_sign():
+    tracker = DeltaTracker()
+    lap(tracker, 0, 60.0)
+    faster = lap(tracker, 1, 50.0, last_lap_time = 60.0)
+    assert tracker.swaps == 1
+    assert tracker.reference.lap_time == 60.0
+    assert delta_at(faster, 500.0) == -5.0 # ahead of the reference
+    slower = lap(tracker, 2, 55.0, last_lap_time = 50.0)
+    assert tracker.swaps == 2
+    assert tracker.reference.lap_time == 50.0
+    assert delta_at(slower, 500.0) == 2.5 # behind the new reference
+    lap(tracker, 3, 50.0, last_lap_time = 55.0)
+    assert tracker.swaps == 2 # the slower lap did not replace it
+    assert tracker.reference.lap_time == 50.0
+
+
+def test_partial_and_interrupted_laps_are_not_references():
+    tracker = DeltaTracker()
+    # joined late: the trace starts 10 s into the lap
+    for i in range(50):
+        tracker.push(packet(0, 10.0 + i * 0.5, 500.0 + i * 10.0))
+    lap(tracker, 1, 60.0, last_lap_time = 40.0)
+    assert tracker.reference is None
+    # rewind to the previous lap
+    lap(tracker, 0, 30.0, last_lap_time = 60.0)
+    assert tracker.reference is None
+
+
+def test_sled_packets_are_ignored():
+    tracker = DeltaTracker()
+    assert tracker.push(packet(0, 0.0, 0.0, packet_format = 'sled')) == []
+    assert tracker.lap_no is None
@@ -0,0 +1,126 @@
+import asyncio
+from types import SimpleNamespace
+
+from forza_package import ForzaDataReader
+from laps import DEFAULT_CHANNELS, LapAggregator, P2Quantile
+from main import AsyncForzaIO
+from synthetic import SyntheticRig
+
+
+def packet(lap_no, cur_lap_time, dist_traveled, speed, last_lap_time = 0.0, packet_format = 'fh4'):
+    channels = {channel: 0.0 for channel in DEFAULT_CHANNELS}
+    channels['speed'] = speed
+    return SimpleNamespace(packet_format = packet_format, driver_name = 'test', car_ordinal = 42,
+                           lap_no = lap_no, cur_lap_time = cur_lap_time, last_lap_time = last_lap_time,
+                           timestamp_ms = int(cur_lap_time * 1000) + 100000 * lap_no,
+                           dist_traveled = dist_traveled, **channels)
+
+
+def lap(aggregator, lap_no, samples = 10, length = 900.0, last_lap_time = 0.0):
+    '''Pushes one lap of samples packets and returns the summaries emitted.'''
+    summaries = []
+    for i in range(samples):
+        summaries += aggregator.push(packet(lap_no, i * 0.1, lap_no * length + i * length / samples,
+                                            speed = float(i), last_lap_time = last_lap_time))
+    return summaries
+
+
+def test_summary_when_lap_no_changes():
+    aggregator = LapAggregator(sectors = 0)
+    assert lap(aggregator, 0) == []
+    summaries = aggregator.push(packet(1, 0.0, 900.0, speed = 0.0, last_lap_time = 1.25))
+    assert len(summaries) == 1
+    record = summaries[0].to_dict()
+    assert record['event_type'] == 'lap_summary'
+    assert record['lap_no'] == 0
+    assert record['lap_time'] == 1.25
+    assert record['complete']
+    assert record['samples'] == 10
+    assert record['distance'] == 810.0
+    speed = record['stats']['speed']
+    assert (speed['min'], speed['max'], speed['mean']) == (0.0, 9.0, 4.5)
+    assert speed['min'] <= speed['p50'] <= speed['p90'] <= speed['max']
+
+
+def test_lap_joined_late_is_incomplete():
+    aggregator = LapAggregator(sectors = 0)
+    aggregator.push(packet(0, 30.0, 100.0, speed = 1.0))
+    summaries = aggregator.push(packet(1, 0.0, 900.0, speed = 1.0, last_lap_time = 60.0))
+    assert not summaries[0].to_dict()['complete']
+
+
+def test_rewind_discards_the_lap():
+    aggregator = LapAggregator(sectors = 0)
+    lap(aggregator, 3)
+    assert aggregator.push(packet(1, 0.0, 0.0, speed = 1.0)) == []
+    assert aggregator.laps == 0
+
+
+def test_sectors_use_the_previous_lap_length():
+    aggregator = LapAggregator(sectors = 3)
+    lap(aggregator, 0, samples = 30)
+    first = aggregator.push(packet(1, 0.0, 900.0, speed = 0.0, last_lap_time = 3.0))[0].to_dict()
+    assert first['sectors'] == [] # no lap length yet
+    lap(aggregator, 1, samples = 30)
+    second = aggregator.push(packet(2, 0.0, 1800.0, speed = 0.0, last_lap_time = 3.0))[0].to_dict()
+    assert len(second['sectors']) == 3
+    assert sum(sector['time'] for sector in second['sectors']) == 3.0
+
+
+def test_sled_packets_are_ignored():
+    aggregator = LapAggregator()
+    assert aggregator.push(packet(0, 0.0, 0.0, speed = 1.0, packet_format = 'sled')) == []
+    assert aggregator.flush() == []
+
+
+def test_flush_returns_the_lap_in_progress():
+    aggregator = LapAggregator(sectors = 0)
+    lap(aggregator, 0)
+    summaries = aggregator.flush()
+    assert len(summaries) == 1
+    assert not summaries[0].to_dict()['complete']
+    assert summaries[0].to_dict()['lap_time'] == 0.9
+    assert aggregator.flush() == []
+
+
+def test_quantile_estimate():
+    quantile = P2Quantile(0.5)
+    for x in range(1001):
+        quantile.add(float(x * 7919 % 1001))
+    assert abs(quantile.value() - 500) < 20
+
+
+def test_lap_in_progress_is_emitted_at_shutdown(run_async):
+    class Collector:
+        def __init__(self) -> None:
+            self.sent = []
+
+        async def send_events(self, events):
+            self.sent.extend(events)
+
+    producer = Collector()
+    reader = ForzaDataReader(driver_name = 'test', ip = '127.0.0.1', port = 0,
+                             aggregator = lambda: LapAggregator(sectors = 0))
+    io = AsyncForzaIO(reader, producer, stats_interval = 3600, max_linger = 0.01)
+    rig = SyntheticRig('dash', seed = 1, incident_interval = 0)
+
+    async def scenario():
+        task = asyncio.create_task(io.run())
+        while getattr(io, 'protocol', None) is None:
+            await asyncio.sleep(0.001)
+        for i in range(120):
+            io.protocol.datagram_received(rig.datagram(i / 60), ('127.0.0.1', 5555))
+        await asyncio.sleep(0.05)
+        assert not [event for event in producer.sent if event.get('event_type') == 'lap_summary']
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    run_async(scenario())
+    reader.stop()
+    summaries = [event for event in producer.sent if event.get('event_type') == 'lap_summary']
+    assert len(summaries) == 1
+    assert not summaries[0]['complete']
+    assert summaries[0]['samples'] == 120
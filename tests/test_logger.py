@@ -0,0 +1,41 @@
+import logging
+
+from logger import RateLimitFilter, create_logger
+
+
+def record(created, lineno = 10, msg = 'dropped %d packets'):
+    record = logging.LogRecord('forza', logging.WARNING, __file__, lineno, msg, (1,), None)
+    record.created = created
+    return record
+
+
+def test_rate_limit_per_call_site():
+    rate_limit = RateLimitFilter(rate = 2)
+    assert [rate_limit.filter(record(0.0)) for _ in range(4)] == [True, True, False, False]
+    assert rate_limit.filter(record(0.0, lineno = 11)) # another call site
+    late = record(0.5)
+    assert rate_limit.filter(late)
+    assert late.msg == 'dropped %d packets (2 similar messages suppressed)'
+    assert late.getMessage() == 'dropped 1 packets (2 similar messages suppressed)'
+    assert not rate_limit.filter(record(0.5))
+
+
+def test_burst():
+    rate_limit = RateLimitFilter(rate = 1, burst = 3)
+    assert [rate_limit.filter(record(0.0)) for _ in range(4)] == [True, True, True, False]
+
+
+def test_environment_level_and_synchronous_file(tmp_path, monkeypatch):
+    monkeypatch.setenv('FORZA_LOG_DIR', str(tmp_path))
+    monkeypatch.setenv('FORZA_LOG_QUEUE', '0')
+    monkeypatch.setenv('FORZA_LOG_LEVEL', 'DEBUG')
+    monkeypatch.setenv('FORZA_LOG_LEVEL_TEST_LOGGER_SYNC', 'WARNING')
+    logger = create_logger('test_logger_sync', logging.DEBUG)
+    assert logger.level == logging.WARNING
+    logger.info('not written')
+    logger.warning('written %s', 'lazily')
+    for handler in logger.handlers:
+        handler.close()
+    lines = (tmp_path / 'test_logger_sync.log').read_text().splitlines()
+    assert len(lines) == 1
+    assert lines[0].endswith('WARNING - test_logger - written lazily')
@@ -0,0 +1,146 @@
+import asyncio
+import contextlib
+import json
+
+from forza_package import ForzaDataReader, read_header
+from local_eventhub import LocalEventHubProducerClient
+from main import AsyncForzaIO
+from producer import Producer
+from spool import SpillBuffer
+from synthetic import SyntheticRig
+
+
+class Uplink:
+    '''Producer clients of an Event Hub that can be taken offline: create_batch()
+       opens the connection, so it fails while offline.'''
+    def __init__(self) -> None:
+        self.online = False
+        self.sent = []
+
+    def client(self) -> LocalEventHubProducerClient:
+        uplink = self
+
+        class Client(LocalEventHubProducerClient):
+            async def create_batch(self):
+                if not uplink.online:
+                    raise ConnectionError('Event Hubs unreachable')
+                return await super().create_batch()
+
+        def on_send(batch):
+            uplink.sent.extend(json.loads(next(event.body)) for event in batch._internal_events)
+        return Client(latency = 0, on_send = on_send)
+
+
+def datagrams(count):
+    rig = SyntheticRig('dash', seed = 1, incident_interval = 0)
+    return [rig.datagram(i / 60) for i in range(count)]
+
+
+def timestamps(count):
+    return [read_header(data)[1] for data in datagrams(count)]
+
+
+def forza_io(tmp_path, producer, **options):
+    reader = ForzaDataReader(driver_name = 'test', ip = '127.0.0.1', port = 0, filter_rate = 0)
+    return AsyncForzaIO(reader, producer, spill_dir = str(tmp_path / 'spool'), stats_interval = 3600,
+                        batch_size = 20, max_linger = 0.01, **options)
+
+
+async def started(io):
+    task = asyncio.create_task(io.run())
+    while getattr(io, 'protocol', None) is None:
+        await asyncio.sleep(0.001)
+    return task
+
+
+async def stop(task):
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(0)
+
+
+async def wait_for(condition, timeout = 5.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, 'timed out'
+        await asyncio.sleep(0.01)
+
+
+def test_spills_while_uplink_is_down_and_drains_when_it_returns(tmp_path, run_async):
+    uplink = Uplink()
+    producer = Producer(client_factory = uplink.client, retry_delay = 0.01, max_retries = 2)
+    io = forza_io(tmp_path, producer, queue_size = 50)
+    assert producer.on_error == io.queue.requeue
+
+    async def scenario():
+        task = await started(io)
+        for data in datagrams(300):
+            io.protocol.datagram_received(data, ('127.0.0.1', 5555))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.1)
+        assert not task.done() # the writer survived the failed connections
+        assert io.queue.stats()['spilled_bytes'] > 0
+        assert uplink.sent == []
+        uplink.online = True
+        await wait_for(lambda: len(uplink.sent) == 300)
+        await producer.flush()
+        await stop(task)
+
+    run_async(scenario())
+    assert [event['timestamp_ms'] for event in uplink.sent] == timestamps(300)
+    assert io.queue.empty()
+    io.reader.stop()
+
+
+def test_send_errors_are_requeued(tmp_path, run_async):
+    class FailingProducer:
+        '''Producer raising on send, like one without on_error handling.'''
+        def __init__(self) -> None:
+            self.failures = 2
+            self.sent = []
+            self.retry_delay = 0
+
+        async def send_events(self, events):
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError('Event Hubs unreachable')
+            self.sent.extend(events)
+
+    producer = FailingProducer()
+    io = forza_io(tmp_path, producer)
+
+    async def scenario():
+        task = await started(io)
+        for data in datagrams(50):
+            io.protocol.datagram_received(data, ('127.0.0.1', 5555))
+        await wait_for(lambda: len(producer.sent) == 50)
+        await stop(task)
+
+    run_async(scenario())
+    assert producer.failures == 0
+    assert [event['timestamp_ms'] for event in producer.sent] == timestamps(50)
+    io.reader.stop()
+
+
+def test_buffered_events_are_journaled_at_shutdown(tmp_path, run_async):
+    uplink = Uplink()
+    producer = Producer(client_factory = uplink.client, retry_delay = 0.01, max_retries = 1)
+    io = forza_io(tmp_path, producer)
+
+    async def scenario():
+        task = await started(io)
+        for data in datagrams(100):
+            io.protocol.datagram_received(data, ('127.0.0.1', 5555))
+        await asyncio.sleep(0.05)
+        await stop(task)
+
+    run_async(scenario())
+    io.reader.stop()
+    restarted = SpillBuffer(journal_dir = str(tmp_path / 'spool'))
+    events = []
+    while not restarted.empty():
+        events.append(restarted.get_nowait())
+    assert len(events) == 100
+    assert [event['timestamp_ms'] for event in events] == timestamps(100)
@@ -0,0 +1,33 @@
+from metrics import Registry
+
+
+def test_counter_and_histogram():
+    registry = Registry()
+    registry.counter('events_total', 'Events').inc(3)
+    latency = registry.histogram('latency_seconds', 'Latency', buckets = (0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+    lines = registry.render().splitlines()
+    assert lines[:3] == ['# HELP events_total Events', '# TYPE events_total counter', 'events_total 3']
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert 'latency_seconds_count 3' in lines
+
+
+def test_same_family_from_several_collectors_is_written_once():
+    registry = Registry()
+    for sink in ('file', 'udp'):
+        registry.register(f'sink:{sink}', lambda sink = sink: [
+            ('sink_sent_total', 'counter', 'Records sent', [({'sink': sink}, 1)])])
+    lines = registry.render().splitlines()
+    assert lines.count('# HELP sink_sent_total Records sent') == 1
+    assert lines.count('# TYPE sink_sent_total counter') == 1
+    assert lines[2:] == ['sink_sent_total{sink="file"} 1', 'sink_sent_total{sink="udp"} 1']
+
+
+def test_failing_collector_is_skipped():
+    registry = Registry()
+    registry.register('broken', lambda: 1 / 0)
+    registry.gauge('depth', 'Depth', lambda: 7)
+    assert registry.render().splitlines()[-1] == 'depth 7'
@@ -0,0 +1,74 @@
+import asyncio
+import contextlib
+import json
+
+import pytest
+
+from multirig import MultiRigIngest, QueueProducer, load_config
+
+
+class FlakyProducer:
+    '''Producer whose first send raises.'''
+    encoding = 'json'
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.sent = []
+
+    async def send_events(self, events):
+        self.calls += 1
+        if self.calls == 1:
+            raise ConnectionError('Event Hubs unreachable')
+        self.sent.extend(events)
+
+
+class QueueOutput:
+    '''multiprocessing.Queue stand-in keeping what is put.'''
+    def __init__(self) -> None:
+        self.items = []
+
+    def put(self, item) -> None:
+        self.items.append(item)
+
+
+def test_load_config_defaults_driver_names(tmp_path):
+    path = tmp_path / 'rigs.json'
+    path.write_text(json.dumps({'rigs': [{'port': 6667}, {'port': 6668, 'driver_name': 'bob'}]}))
+    config = load_config(str(path))
+    assert [rig['driver_name'] for rig in config['rigs']] == ['rig6667', 'bob']
+    path.write_text(json.dumps({'rigs': [{'driver_name': 'bob'}]}))
+    with pytest.raises(ValueError, match = 'without port'):
+        load_config(str(path))
+
+
+def test_failed_send_does_not_stop_the_ingest(run_async):
+    producer = FlakyProducer()
+    ingest = MultiRigIngest({'rigs': [{'port': 6667, 'driver_name': 'alice'}]}, producer)
+    worker = QueueProducer(ingest.queue)
+
+    async def scenario():
+        task = asyncio.create_task(ingest.run())
+        await worker.send_events([{'speed': 1.0}])
+        while producer.calls < 1:
+            await asyncio.sleep(0.01)
+        await worker.send_events([{'speed': 2.0}])
+        while not producer.sent:
+            await asyncio.sleep(0.01)
+        assert not task.done()
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    run_async(scenario())
+    assert ingest.failed == 1
+    assert [json.loads(event) for event in producer.sent] == [{'speed': 2.0}]
+
+
+def test_workers_project_before_serializing(run_async):
+    output = QueueOutput()
+    worker = QueueProducer(output, fields = {'speed', 'driver_name'})
+    run_async(worker.send_events([{'driver_name': 'alice', 'speed': 1.0, 'gear': 3},
+                                  {'event_type': 'lap_summary', 'driver_name': 'alice', 'lap_no': 1}]))
+    assert [json.loads(event) for event in output.items[0]] == [
+        {'driver_name': 'alice', 'speed': 1.0},
+        {'event_type': 'lap_summary', 'driver_name': 'alice', 'lap_no': 1}]
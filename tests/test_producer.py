@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from local_eventhub import LocalEventHubProducerClient
+from producer import Producer
+
+
+class UnreachableClient(LocalEventHubProducerClient):
+    '''Client of an Event Hub that cannot be reached: create_batch() opens the connection.'''
+    async def create_batch(self):
+        raise ConnectionError('Event Hubs unreachable')
+
+
+def test_unreachable_event_hub_calls_on_error():
+    failed = []
+    producer = Producer(client_factory = UnreachableClient, retry_delay = 0, on_error = failed.extend)
+    events = [{'speed': float(i)} for i in range(10)]
+    asyncio.run(producer.send_events(events)) # does not raise
+    assert failed == events
+    assert producer.producer is None # disconnected, the next send reconnects
+
+
+def test_reconnects_after_failed_create_batch():
+    attempts = []
+
+    class FlakyClient(LocalEventHubProducerClient):
+        async def create_batch(self):
+            attempts.append(1)
+            if len(attempts) < 2:
+                raise ConnectionError('Event Hubs unreachable')
+            return await super().create_batch()
+
+    clients = []
+    def client_factory():
+        clients.append(FlakyClient(latency = 0))
+        return clients[-1]
+
+    failed = []
+    producer = Producer(client_factory = client_factory, retry_delay = 0, on_error = failed.extend)
+    events = [{'speed': float(i)} for i in range(10)]
+
+    async def send():
+        await producer.send_events(events)
+        await producer.flush()
+
+    asyncio.run(send())
+    assert failed == []
+    assert len(clients) == 2
+    assert clients[-1].events_sent == len(events)
+
+
+def test_failed_send_calls_on_error():
+    failed = []
+    producer = Producer(client_factory = lambda: LocalEventHubProducerClient(latency = 0, failure_rate = 1),
+                        retry_delay = 0, on_error = failed.extend)
+    events = [{'speed': float(i)} for i in range(10)]
+
+    async def send():
+        await producer.send_events(events)
+        await producer.flush()
+
+    asyncio.run(send())
+    assert failed == events
+
+
+def test_events_split_in_batches_by_size():
+    clients = []
+    def client_factory():
+        clients.append(LocalEventHubProducerClient(latency = 0, max_size_in_bytes = 2000))
+        return clients[-1]
+
+    producer = Producer(client_factory = client_factory)
+    events = [{'speed': float(i), 'driver_name': 'test'} for i in range(100)]
+    batches = asyncio.run(producer.prepare_events(events))
+    assert len(batches) > 1
+    assert [event for _, batch_events in batches for event in batch_events] == events
+    assert all(batch.size_in_bytes <= 2000 for batch, _ in batches)
+
+
+def test_encoding_errors_raise():
+    failed = []
+    producer = Producer(client_factory = LocalEventHubProducerClient, encoding = 'binary',
+                        on_error = failed.extend)
+    with pytest.raises(ValueError):
+        asyncio.run(producer.send_events([{'k' * 256: 1}]))
+    assert failed == []
+
+
+def test_oversized_event_after_a_full_batch_is_dropped_alone():
+    producer = Producer(client_factory = lambda: LocalEventHubProducerClient(latency = 0, max_size_in_bytes = 1000))
+    small = [{'speed': float(i)} for i in range(30)]
+    big = {'blob': 'x' * 2000}
+    events = small[:20] + [big] + small[20:]
+    batches = asyncio.run(producer.prepare_events(events))
+    assert [event for _, batch_events in batches for event in batch_events] == small
+    assert sum(len(batch) for batch, _ in batches) == len(small)
+
+
+def test_client_construction_errors_go_to_on_error():
+    def client_factory():
+        raise ValueError('invalid connection string')
+
+    failed = []
+    producer = Producer(client_factory = client_factory, retry_delay = 0, on_error = failed.extend)
+    events = [{'speed': 1.0}]
+    asyncio.run(producer.send_events(events))
+    assert failed == events
@@ -0,0 +1,87 @@
+import pytest
+
+from forza_package import ForzaDataReader, projection
+from laps import LapAggregator
+from synthetic import SyntheticRig
+
+
+def datagrams(count, packet_format = 'dash'):
+    rig = SyntheticRig(packet_format, seed = 1, incident_interval = 0)
+    return [rig.datagram(i / 60) for i in range(count)]
+
+
+def reader(**options):
+    # never started, handle() needs no socket
+    return ForzaDataReader(driver_name = 'alice', port = 0, **options)
+
+
+def handled(reader, data, addr = ('127.0.0.1', 5555)):
+    return [packet for datagram in data for packet in reader.handle(datagram, addr)]
+
+
+def test_filter_rate_keeps_one_packet_every_n():
+    forza = reader(filter_rate = 2)
+    packets = handled(forza, datagrams(10))
+    assert [packet.timestamp_ms for packet in packets] == [packet.timestamp_ms for packet in
+                                                          handled(reader(filter_rate = 0), datagrams(10))[2::2]]
+    assert forza.stats.received == 10
+    assert forza.stats.decoded == 4
+    assert forza.stats.filtered == 6
+
+
+def test_invalid_length_is_ignored():
+    forza = reader(filter_rate = 0)
+    assert forza.handle(b'\x00' * 100) == []
+    assert forza.stats.invalid == 1
+
+
+def test_race_off_packet_is_not_decoded():
+    forza = reader(filter_rate = 0)
+    data = bytearray(datagrams(1)[0])
+    data[:4] = bytes(4) # is_race_on
+    assert forza.handle(bytes(data)) == [None]
+    assert forza.stats.decoded == 0
+
+
+def test_driver_names_by_source_address():
+    forza = reader(filter_rate = 0, driver_names = {'192.168.0.20': 'bob'})
+    data = datagrams(1)[0]
+    assert forza.handle(data, ('192.168.0.20', 5555))[0].driver_name == 'bob'
+    assert forza.handle(data, ('192.168.0.21', 5555))[0].driver_name == 'alice'
+
+
+def test_each_driver_is_decimated_separately():
+    forza = reader(filter_rate = 1, driver_names = {'192.168.0.20': 'bob'})
+    data = datagrams(2)
+    bob = handled(forza, data, ('192.168.0.20', 5555))
+    alice = handled(forza, data, ('192.168.0.21', 5555))
+    assert len(bob) == len(alice) == 1
+
+
+def test_fields_projection():
+    full = handled(reader(filter_rate = 0), datagrams(3))
+    projected = handled(reader(filter_rate = 0, fields = ['speed', 'gear']), datagrams(3))
+    for packet, expected in zip(projected, full):
+        assert packet.to_dict() == {'timestamp_ms': expected.timestamp_ms, 'driver_name': 'alice',
+                                    'speed': expected.speed, 'gear': expected.gear}
+        with pytest.raises(AttributeError):
+            packet.current_engine_rpm
+    assert projection(['gear', 'speed']) is projection(['speed', 'gear'])
+    with pytest.raises(ValueError, match = 'unknown fields'):
+        projection(['warp_factor'])
+
+
+def test_fields_are_rejected_with_aggregators():
+    with pytest.raises(ValueError, match = 'aggregator'):
+        reader(fields = ['speed'], aggregator = LapAggregator)
+    with pytest.raises(ValueError, match = 'fast_decode'):
+        reader(fields = ['speed'], fast_decode = False)
+
+
+def test_aggregators_see_every_race_packet():
+    forza = reader(filter_rate = 0, aggregator = lambda: LapAggregator(sectors = 0))
+    handled(forza, datagrams(10))
+    assert forza.stats.decoded == 10
+    events = forza.flush()
+    assert [event.to_dict()['event_type'] for event in events] == ['lap_summary']
+    assert events[0].to_dict()['samples'] == 10
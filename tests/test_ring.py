@@ -0,0 +1,50 @@
+import pickle
+
+import pytest
+
+from ring import DatagramRing
+
+
+@pytest.fixture
+def ring():
+    ring = DatagramRing(slots = 4)
+    yield ring
+    ring.close()
+
+
+def test_put_and_get_in_order(ring):
+    assert ring.put(memoryview(b'first'), ('192.168.0.20', 5555))
+    assert ring.put(memoryview(b'second'), ('192.168.0.21', 5556))
+    assert ring.get() == [(b'first', ('192.168.0.20', 5555)), (b'second', ('192.168.0.21', 5556))]
+    assert ring.get() == []
+    assert ring.stats() == {'slots': 4, 'occupancy': 0, 'high_water': 2, 'received': 2, 'overruns': 0}
+
+
+def test_get_frees_at_most_max_items(ring):
+    for i in range(3):
+        ring.put(memoryview(bytes([i])), ('127.0.0.1', 5555))
+    assert [data for data, _ in ring.get(max_items = 2)] == [b'\x00', b'\x01']
+    assert ring.stats()['occupancy'] == 1
+    assert [data for data, _ in ring.get()] == [b'\x02']
+
+
+def test_full_ring_drops_new_datagrams(ring):
+    results = [ring.put(memoryview(bytes([i])), ('127.0.0.1', 5555)) for i in range(6)]
+    assert results == [True] * 4 + [False] * 2
+    assert ring.stats()['overruns'] == 2
+    assert ring.stats()['high_water'] == 4
+    assert [data for data, _ in ring.get()] == [b'\x00', b'\x01', b'\x02', b'\x03']
+    # slots wrap around once freed
+    assert ring.put(memoryview(b'again'), ('127.0.0.1', 5555))
+    assert ring.get() == [(b'again', ('127.0.0.1', 5555))]
+
+
+def test_unpickled_ring_shares_the_memory(ring):
+    attached = pickle.loads(pickle.dumps(ring))
+    try:
+        assert not attached.owner
+        ring.put(memoryview(b'shared'), ('127.0.0.1', 5555))
+        assert attached.get() == [(b'shared', ('127.0.0.1', 5555))]
+        assert ring.stats()['occupancy'] == 0
+    finally:
+        attached.close()
@@ -0,0 +1,106 @@
+import asyncio
+import contextlib
+
+import numpy as np
+
+from forza_package import ForzaDataReader
+from main import AsyncForzaIO
+from session_store import SessionReader, SessionRecorder, SessionWriter
+from synthetic import SyntheticRig
+
+CHANNELS = {'speed': '<f4', 'gear': '<u1'}
+
+
+def write(path, count, chunk_size = 100, levels = (100, 1000)):
+    '''Writes samples every 10 ms, speed i and gear i % 6, and returns the writer.'''
+    writer = SessionWriter(str(path), CHANNELS, chunk_size = chunk_size, levels = levels)
+    for i in range(count):
+        writer.append(1000 + 10 * i, (float(i), i % 6))
+    return writer
+
+
+def test_raw_round_trip(tmp_path):
+    write(tmp_path / 'session', 250).close()
+    session = SessionReader(str(tmp_path / 'session'))
+    assert session.samples == 250
+    assert (session.start_ms, session.end_ms) == (1000, 3490)
+    assert session.meta['closed']
+    result = session.query('speed')
+    assert np.array_equal(result['time'], 1000 + 10 * np.arange(250))
+    assert np.array_equal(result['value'], np.arange(250, dtype = np.float32))
+    result = session.query('gear', 1995, 2030)
+    assert result['time'].tolist() == [2000, 2010, 2020, 2030]
+    assert result['value'].tolist() == [100 % 6, 101 % 6, 102 % 6, 103 % 6]
+
+
+def test_zoom_levels(tmp_path):
+    write(tmp_path / 'session', 250).close()
+    session = SessionReader(str(tmp_path / 'session'))
+    second = session.query('speed', resolution_ms = 1000)
+    assert second['time'].tolist() == [1000, 2000, 3000]
+    assert second['count'].tolist() == [100, 100, 50]
+    assert second['min'].tolist() == [0, 100, 200]
+    assert second['max'].tolist() == [99, 199, 249]
+    assert second['mean'].tolist() == [49.5, 149.5, 224.5]
+    # 2 s buckets are merged from the 1 s level, 50 ms buckets computed from the samples
+    assert session.query('speed', resolution_ms = 2000)['count'].tolist() == [100, 150]
+    fine = session.query('speed', 1000, 1090, resolution_ms = 50)
+    assert fine['count'].tolist() == [5, 5]
+    assert fine['mean'].tolist() == [2, 7]
+
+
+def test_query_before_the_first_chunk(tmp_path):
+    writer = write(tmp_path / 'session', 50)
+    session = SessionReader(str(tmp_path / 'session'))
+    assert session.samples == 0
+    assert session.start_ms is None
+    assert len(session.query('speed')['value']) == 0
+    assert len(session.query('speed', resolution_ms = 1000)['count']) == 0
+    writer.close()
+    assert SessionReader(str(tmp_path / 'session')).samples == 50
+
+
+def test_query_before_the_first_bucket_is_closed(tmp_path):
+    writer = write(tmp_path / 'session', 100, levels = (60000,))
+    writer._submit()
+    writer._submit() # waits for the chunk
+    session = SessionReader(str(tmp_path / 'session'))
+    assert session.samples == 100
+    assert len(session.query('speed', resolution_ms = 60000)['count']) == 0
+    writer.close()
+    assert SessionReader(str(tmp_path / 'session')).query('speed', resolution_ms = 60000)['count'].tolist() == [100]
+
+
+def test_recorder_session_is_closed_at_shutdown(tmp_path, run_async):
+    class Collector:
+        async def send_events(self, events):
+            pass
+
+    root = tmp_path / 'sessions'
+    recorders = []
+
+    def recorder():
+        recorders.append(SessionRecorder(str(root), chunk_size = 100))
+        return recorders[-1]
+
+    reader = ForzaDataReader(driver_name = 'alice', ip = '127.0.0.1', port = 0, aggregator = recorder)
+    io = AsyncForzaIO(reader, Collector(), stats_interval = 3600)
+    rig = SyntheticRig('dash', seed = 1, incident_interval = 0)
+
+    async def scenario():
+        task = asyncio.create_task(io.run())
+        while getattr(io, 'protocol', None) is None:
+            await asyncio.sleep(0.001)
+        for i in range(250):
+            io.protocol.datagram_received(rig.datagram(i / 60), ('127.0.0.1', 5555))
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    run_async(scenario())
+    reader.stop()
+    [path] = recorders[0].sessions
+    session = SessionReader(path)
+    assert session.meta['closed']
+    assert session.samples == 250
+    assert len(session.query('speed')['value']) == 250
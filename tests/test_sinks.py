@@ -0,0 +1,135 @@
+import asyncio
+import contextlib
+import json
+
+import pytest
+
+import metrics
+from forza_package import ForzaDataReader
+from main import AsyncForzaIO
+from sinks import FileSink, Sink, UdpSink
+from synthetic import SyntheticRig
+
+
+class ListSink(Sink):
+    def __init__(self, **options) -> None:
+        super().__init__(**options)
+        self.written = []
+
+    async def write(self, records):
+        self.written.extend(records)
+
+
+class FullSocket:
+    '''Socket whose send buffer is full after accepting room datagrams.'''
+    def __init__(self, room: int) -> None:
+        self.room = room
+        self.sent = []
+
+    def sendto(self, data, address):
+        if len(self.sent) == self.room:
+            raise BlockingIOError
+        self.sent.append(data)
+
+    def close(self):
+        pass
+
+
+def records(count):
+    return [{'driver_name': 'alice', 'timestamp_ms': i} for i in range(count)]
+
+
+def queued(sink):
+    return [record['timestamp_ms'] for _, record in sink.queue._queue]
+
+
+def test_drop_oldest():
+    sink = ListSink(name = 'oldest', queue_size = 3)
+    for record in records(5):
+        sink.put(record)
+    assert queued(sink) == [2, 3, 4]
+    assert sink.dropped == 2
+
+
+def test_drop_newest():
+    sink = ListSink(name = 'newest', queue_size = 3, drop = 'newest')
+    for record in records(5):
+        sink.put(record)
+    assert queued(sink) == [0, 1, 2]
+    assert sink.dropped == 2
+    with pytest.raises(ValueError, match = 'drop policy'):
+        ListSink(name = 'other', drop = 'random')
+
+
+def test_run_writes_batches(run_async):
+    sink = ListSink(name = 'batches', batch_size = 4, max_linger = 0.01)
+
+    async def scenario():
+        task = asyncio.create_task(sink.run())
+        for record in records(10):
+            sink.put(record)
+        while sink.sent < 10:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    run_async(scenario())
+    assert [record['timestamp_ms'] for record in sink.written] == list(range(10))
+    assert sink.batches == 3
+
+
+def test_udp_counts_only_sent_datagrams(run_async):
+    sink = UdpSink('127.0.0.1', 9, name = 'udp_full', format = 'json')
+    sink.sock.close()
+    sink.sock = FullSocket(room = 2)
+    for record in records(3) + [{'event_type': 'lap_summary', 'driver_name': 'alice'}]:
+        sink.put(record)
+    run_async(sink.close())
+    assert len(sink.sock.sent) == 2
+    assert (sink.sent, sink.dropped) == (2, 2)
+
+
+def test_udp_forza_format_skips_events(run_async):
+    sink = UdpSink('127.0.0.1', 9, name = 'udp_forza', format = 'forza')
+    sink.sock.close()
+    sink.sock = FullSocket(room = 10)
+    sink.put({'event_type': 'lap_summary', 'driver_name': 'alice'})
+    sink.put({'driver_name': 'alice', 'timestamp_ms': 1, 'speed': 10.0})
+    run_async(sink.close())
+    assert len(sink.sock.sent) == 1
+    assert (sink.sent, sink.dropped) == (1, 0)
+
+
+def test_sinks_are_closed_at_shutdown(tmp_path, run_async):
+    path = tmp_path / 'records.jsonl'
+    sink = FileSink(str(path), name = 'file_shutdown', max_linger = 3600, batch_size = 1000)
+    reader = ForzaDataReader(driver_name = 'alice', ip = '127.0.0.1', port = 0, filter_rate = 0)
+    io = AsyncForzaIO(reader, None, stats_interval = 3600, sinks = [sink])
+    rig = SyntheticRig('dash', seed = 1, incident_interval = 0)
+
+    async def scenario():
+        task = asyncio.create_task(io.run())
+        while getattr(io, 'protocol', None) is None:
+            await asyncio.sleep(0.001)
+        for i in range(20):
+            io.protocol.datagram_received(rig.datagram(i / 60), ('127.0.0.1', 5555))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    run_async(scenario())
+    reader.stop()
+    assert sink.file is None
+    assert len([json.loads(line) for line in path.read_text().splitlines()]) == 20
+    assert sink.sent == 20
+
+
+def test_metrics_of_every_sink_share_one_family():
+    ListSink(name = 'family_a')
+    ListSink(name = 'family_b')
+    lines = metrics.REGISTRY.render().splitlines()
+    assert lines.count('# TYPE forza_sink_records_total counter') == 1
+    assert 'forza_sink_records_total{sink="family_a",stat="sent"} 0' in lines
+    assert 'forza_sink_records_total{sink="family_b",stat="sent"} 0' in lines
@@ -0,0 +1,151 @@
+import asyncio
+import os
+
+import pytest
+
+from spool import SpillBuffer
+
+
+def drain(buffer):
+    events = []
+    while not buffer.empty():
+        events.append(buffer.get_nowait())
+    return events
+
+
+def test_memory_only_keeps_order(tmp_path):
+    buffer = SpillBuffer(max_items = 100, journal_dir = str(tmp_path))
+    for i in range(50):
+        buffer.put_nowait(i)
+    assert buffer.qsize() == 50
+    assert buffer.stats()['journal_segments'] == 0
+    assert drain(buffer) == list(range(50))
+    with pytest.raises(asyncio.QueueEmpty):
+        buffer.get_nowait()
+
+
+def test_spills_to_disk_and_keeps_order(tmp_path):
+    buffer = SpillBuffer(max_items = 10, journal_dir = str(tmp_path), segment_bytes = 200)
+    for i in range(100):
+        buffer.put_nowait({'i': i})
+    assert buffer.qsize() == 10
+    assert buffer.stats()['journal_segments'] > 1
+    assert buffer.journal_bytes > 0
+    assert [event['i'] for event in drain(buffer)] == list(range(100))
+    assert buffer.journal_bytes == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_new_events_go_after_the_journal(tmp_path):
+    buffer = SpillBuffer(max_items = 10, journal_dir = str(tmp_path))
+    for i in range(20):
+        buffer.put_nowait(i)
+    head = [buffer.get_nowait() for _ in range(8)] # memory has room again, journal does not
+    for i in range(20, 25):
+        buffer.put_nowait(i)
+    assert head + drain(buffer) == list(range(25))
+
+
+def test_requeue_goes_in_front(tmp_path):
+    buffer = SpillBuffer(max_items = 100, journal_dir = str(tmp_path))
+    for i in range(10):
+        buffer.put_nowait(i)
+    batch = [buffer.get_nowait() for _ in range(4)]
+    buffer.requeue(batch)
+    assert drain(buffer) == list(range(10))
+
+
+def test_requeue_beyond_memory_spills_in_order(tmp_path):
+    buffer = SpillBuffer(max_items = 10, journal_dir = str(tmp_path))
+    for i in range(30):
+        buffer.put_nowait(i) # 10 in memory, 20 in the journal
+    batch = [buffer.get_nowait() for _ in range(10)]
+    assert batch == list(range(10))
+    buffer.requeue(batch)
+    buffer.requeue(batch[:0])
+    assert drain(buffer) == list(range(30))
+
+
+def test_requeue_of_a_batch_bigger_than_memory(tmp_path):
+    buffer = SpillBuffer(max_items = 4, journal_dir = str(tmp_path))
+    for i in range(10, 14):
+        buffer.put_nowait(i)
+    buffer.requeue(list(range(10)))
+    assert drain(buffer) == list(range(14))
+
+
+def test_close_keeps_events_for_the_next_run(tmp_path):
+    buffer = SpillBuffer(max_items = 10, journal_dir = str(tmp_path))
+    for i in range(25):
+        buffer.put_nowait(i)
+    buffer.requeue([-2, -1])
+    buffer.close()
+    restarted = SpillBuffer(max_items = 10, journal_dir = str(tmp_path))
+    assert restarted.empty() is False
+    assert drain(restarted) == list(range(-2, 25))
+
+
+def test_corrupted_line_is_skipped(tmp_path):
+    buffer = SpillBuffer(max_items = 10, journal_dir = str(tmp_path))
+    for i in range(5):
+        buffer.put_nowait(i)
+    buffer.close()
+    segment = os.path.join(tmp_path, os.listdir(tmp_path)[0])
+    with open(segment, 'ab') as journal:
+        journal.write(b'{"truncated\n')
+    assert drain(SpillBuffer(max_items = 10, journal_dir = str(tmp_path))) == list(range(5))
+
+
+def test_small_memory_reads_the_journal_back(tmp_path):
+    buffer = SpillBuffer(max_items = 1, journal_dir = str(tmp_path))
+    for i in range(5):
+        buffer.put_nowait(i)
+    assert drain(buffer) == list(range(5))
+    with pytest.raises(ValueError):
+        SpillBuffer(max_items = 0, journal_dir = str(tmp_path))
+
+
+def test_stats_do_not_read_the_journal_into_memory(tmp_path):
+    buffer = SpillBuffer(max_items = 10, journal_dir = str(tmp_path))
+    for i in range(30):
+        buffer.put_nowait(i)
+    while buffer.qsize():
+        buffer.memory.popleft() # consumed without get_nowait(), which reads segments back
+    stats = buffer.stats()
+    assert stats['depth'] == 0
+    assert stats['journal_segments'] == 1
+    assert 0 <= stats['age'] < 60
+    assert buffer.qsize() == 0
+
+
+def test_get_yields_to_the_event_loop(tmp_path, run_async):
+    buffer = SpillBuffer(max_items = 10, journal_dir = str(tmp_path))
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0)
+
+    async def spin():
+        # a consumer handing every event back, like a writer whose sends fail
+        task = asyncio.create_task(ticker())
+        buffer.put_nowait('event')
+        for _ in range(100):
+            buffer.requeue([await buffer.get()])
+        task.cancel()
+
+    run_async(spin())
+    assert len(ticks) >= 50
+    assert buffer.requeued == 100
+
+
+def test_get_waits_for_an_event(tmp_path):
+    buffer = SpillBuffer(max_items = 10, journal_dir = str(tmp_path))
+
+    async def consume():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.01, buffer.put_nowait, 'late')
+        return await asyncio.wait_for(buffer.get(), 1)
+
+    assert asyncio.run(consume()) == 'late'